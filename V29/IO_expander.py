@@ -2,75 +2,250 @@ import pyb
 import machine
 import time
 
+import hardware
+
 # Class for the I/O expander
 class MCP23S17:
     # Addressing for IO expander
-    # Using IOCON.BANK = 0 (Default)
+    # Using IOCON.BANK = 0 (Default), so every port B register follows its port A register
+    # and IOCON.SEQOP = 0 (Default), so one transfer can read or write consecutive registers
 
-    IOCON 	= 0x05	#Address of the configuration register
     IODIRA 	= 0x00	#Address of the register that defines the direction of the port bits for port A
     IODIRB 	= 0x01	#Address of the register that defines the direction of the port bits for port B
+    IOCON 	= 0x0A	#Address of the configuration register (also mapped at 0x0B)
+    INTFA 	= 0x0E	#Address of the interrupt flag register for port A (read only)
+    INTCAPB = 0x11	#Address of the interrupt capture register for port B (read only)
     GPIOA 	= 0x12	#Address of the register that controls the GPIO pins for port A
     GPIOB 	= 0x13	#Address of the register that controls the GPIO pins for port B
     OLATA 	= 0x14	#Address of the register that controls the output latch for port A
     OLATB 	= 0x15	#Address of the register that controls the output latch for port B
-    
-    WRITE_OPCODE 	= 0x40			#Write opcode
+    REGISTERS 	= 0x16	#Number of registers
+
+    WRITE_OPCODE 	= 0x40			#Write opcode (hardware address in bits 3-1)
     READ_OPCODE 	= 0x41			#Read opcode
-    write_buffer 	= bytearray(3)	#Creates a three byte array for writing
-    read_buffer 	= bytearray(3)	#Creates a three byte array for reading
-    
+    IOCON_HAEN 		= 0x08			#IOCON bit that makes the expander check the hardware address pins
+    MERGE_GAP 		= 2				#apply() rewrites up to this many unchanged registers rather than open another CS window
+
     #0x00 defines IODIRX as all outputs and 0xFF defines IODIRX as all inputs
     IODIR_OUTPUT_CONFIG = 0x00	#IODIRX Configuration
     ALL_PINS_HIGH 		= 0xFF #All pins are high
-    
-    
-    def __init__(self, cs_pin_name, spi_bus):
+
+
+    def __init__(self, cs_pin_name, spi_bus, address = 0):
         self.spi_bus = spi_bus	#Spi bus creation
-        self.cs = machine.Pin(cs_pin_name, machine.Pin.OUT)	#Sets own chip select pin register for the I/O expander to be an output
+        self.cs = hardware.pin(cs_pin_name)	#Own chip select pin for the I/O expander, shared by every expander on it
         self.cs.high()	#Pulls up CS to ensure no communication is active
-        
-        self.write_register(self.IODIRA, self.IODIR_OUTPUT_CONFIG)	#Writing port A as outputs
-        self.write_register(self.IODIRB, self.IODIR_OUTPUT_CONFIG)	#Writing port B as outputs
-        self.write_register(self.OLATA, self.ALL_PINS_HIGH)			#Sets all pins high for the OLATA port
-    
-    
+        self.address = address	#Hardware address (A2-A0 pins), lets up to 8 expanders share one chip select
+
+        self.write_buffer = bytearray(3)	#Opcode, register, value
+        self.seq_buffer = bytearray(4)		#Opcode, register, port A value, port B value
+        self.read_buffer = bytearray(3)		#What comes back on MISO during a 3 byte read
+        self.seq_read_buffer = bytearray(4)	#What comes back on MISO during a 4 byte read
+        self.bulk_buffer = bytearray(2 + self.REGISTERS)	#Opcode, first register, then up to every register
+        self.bulk_view = memoryview(self.bulk_buffer)
+
+        #Shadow of the registers, cached[reg] is 1 while regs[reg] is known to match the chip
+        #(GPIO, INTF and INTCAP follow the pins, so they are never cached and always read from the chip)
+        self.regs = bytearray(self.REGISTERS)
+        self.cached = bytearray(self.REGISTERS)
+        self.staged = 0		#Bit mask of registers changed by stage() and not yet sent by apply()
+
+        self.writes = 0		#Write transfers made by this expander
+        self.reads = 0		#Read transfers made by this expander
+        self.skipped = 0	#Register writes left out because the shadow already held the value
+
+        #Until HAEN is set every expander answers to address 0, so this reaches all of them
+        self.opcode = self.WRITE_OPCODE
+        self.write_register(self.IOCON, self.IOCON_HAEN)
+        self.opcode = self.WRITE_OPCODE | (address << 1)
+        self.read_opcode = self.READ_OPCODE | (address << 1)
+
+        #Latches first, so no output is driven low while the ports switch from inputs to outputs
+        self.write16(self.OLATA, 0xFFFF)	#Sets all pins high for both ports
+        self.write16(self.IODIRA, (self.IODIR_OUTPUT_CONFIG << 8) | self.IODIR_OUTPUT_CONFIG)	#Writing both ports as outputs
+
+    #Writing a GPIO register writes its output latch, so the latch is the register that is cached
+    def _target(self, reg):
+        if reg == self.GPIOA or reg == self.GPIOB:
+            return reg + 2
+        return reg
+
+    #Registers whose value follows the pins and so can't be cached
+    def _volatile(self, reg):
+        return self.INTFA <= reg <= self.GPIOB
+
+    #Forgets the shadow, the next write of every register goes out (e.g. after the expander was reset)
+    def invalidate(self):
+        for i in range(self.REGISTERS):
+            self.cached[i] = 0
+        self.staged = 0
+
     def write_register(self, reg, value):
-        # Function to write a value to a register, 0x40 is the write opcode, reg is the desired register to write to, and value is the value to write to the register 
-        self.cs.low()	#Pulls down chip select signal for 1st IO expander to initiate communication
-        
-        self.write_buffer[0] = self.WRITE_OPCODE	#Writes OPCODE
+        # Function to write a value to a register, opcode carries the hardware address, reg is the desired register to write to, and value is the value to write to the register
+        reg = self._target(reg)
+        if self.cached[reg] and self.regs[reg] == value:
+            self.skipped += 1
+            return
+        self.cs.low()	#Pulls down chip select signal to initiate communication
+
+        self.write_buffer[0] = self.opcode			#Writes OPCODE
         self.write_buffer[1] = reg					#Writes desired register value to write to
         self.write_buffer[2] = value				#Writes desired value to register
         self.spi_bus.write(self.write_buffer)		#Writes 3 bytes on the SPI bus
-        self.cs.high()								#Pulls up chip select signal for 1st IO expander to end communication
-    
+        self.cs.high()								#Pulls up chip select signal to end communication
+        self.writes += 1
+        self.regs[reg] = value
+        self.cached[reg] = 1
+
+    #Writes a port A register and the port B register after it, value holds port A in the low byte
+    #(nothing if the shadow already holds both, one byte if only one differs, else both in one sequential transfer)
+    def write16(self, reg, value):
+        reg = self._target(reg)
+        value_a = value & 0xFF
+        value_b = (value >> 8) & 0xFF
+        change_a = not (self.cached[reg] and self.regs[reg] == value_a)
+        change_b = not (self.cached[reg + 1] and self.regs[reg + 1] == value_b)
+        if change_a and change_b:
+            self.cs.low()
+            self.seq_buffer[0] = self.opcode
+            self.seq_buffer[1] = reg
+            self.seq_buffer[2] = value_a
+            self.seq_buffer[3] = value_b
+            self.spi_bus.write(self.seq_buffer)
+            self.cs.high()
+            self.writes += 1
+            self.regs[reg] = value_a
+            self.regs[reg + 1] = value_b
+            self.cached[reg] = 1
+            self.cached[reg + 1] = 1
+        elif change_a:
+            self.write_register(reg, value_a)
+            self.skipped += 1
+        elif change_b:
+            self.write_register(reg + 1, value_b)
+            self.skipped += 1
+        else:
+            self.skipped += 2
+
     def write_OLATA(self, value):
         self.write_register(self.OLATA, value)		#Writes value to OLATA register
-        
+
     def write_OLATB(self, value):
         self.write_register(self.OLATB, value)		#Writes value to OLATB register
 
+    #Writes all 16 outputs at once, port A in the low byte
+    def write_gpio(self, value):
+        self.write16(self.GPIOA, value)
+
+    #Changes a register in the shadow only, apply() sends every staged change
+    def stage(self, reg, value):
+        reg = self._target(reg)
+        if self.cached[reg] and self.regs[reg] == value:
+            return
+        self.regs[reg] = value
+        self.cached[reg] = 0	#The chip differs from the shadow until apply()
+        self.staged |= 1 << reg
+
+    #Sends the staged registers, each run of them in one CS window. Runs separated by no more than
+    #MERGE_GAP cached registers share a window, the registers in between are rewritten from the shadow
+    def apply(self):
+        staged = self.staged
+        if not staged:
+            return
+        self.staged = 0
+        reg = 0
+        while staged >> reg:
+            if not (staged >> reg) & 1:
+                reg += 1
+                continue
+            first = reg
+            last = reg
+            reg += 1
+            while reg < self.REGISTERS and staged >> reg:
+                if (staged >> reg) & 1:
+                    last = reg
+                elif reg - last > self.MERGE_GAP or not (self.cached[self._target(reg)] or self.INTFA <= reg <= self.INTCAPB):
+                    break
+                reg += 1
+            self._write_run(first, last)
+            for i in range(first, last + 1):
+                if (staged >> i) & 1:
+                    self.cached[i] = 1
+
+    #Writes registers first..last from the shadow in one transfer
+    def _write_run(self, first, last):
+        buf = self.bulk_buffer
+        buf[0] = self.opcode
+        buf[1] = first
+        n = 2
+        for reg in range(first, last + 1):
+            # A gap GPIO register goes out as its latch value and the read only ones ignore the write,
+            # so neither changes
+            buf[n] = self.regs[self._target(reg)]
+            n += 1
+        self.cs.low()
+        self.spi_bus.write(self.bulk_view[:n])
+        self.cs.high()
+        self.writes += 1
+
+    #Reads one register from the chip (cached registers refresh their shadow)
+    def read_register(self, reg):
+        self.cs.low()
+        self.write_buffer[0] = self.read_opcode
+        self.write_buffer[1] = reg
+        self.write_buffer[2] = 0
+        self.spi_bus.write_readinto(self.write_buffer, self.read_buffer)
+        self.cs.high()
+        self.reads += 1
+        value = self.read_buffer[2]
+        if not self._volatile(reg):
+            self.regs[reg] = value
+            self.cached[reg] = 1
+        return value
+
+    #Reads a port A register and the port B register after it in one sequential transfer, port A in the low byte
+    def read16(self, reg):
+        self.cs.low()
+        self.seq_buffer[0] = self.read_opcode
+        self.seq_buffer[1] = reg
+        self.seq_buffer[2] = 0
+        self.seq_buffer[3] = 0
+        self.spi_bus.write_readinto(self.seq_buffer, self.seq_read_buffer)
+        self.cs.high()
+        self.reads += 1
+        value_a = self.seq_read_buffer[2]
+        value_b = self.seq_read_buffer[3]
+        if not self._volatile(reg):
+            self.regs[reg] = value_a
+            self.regs[reg + 1] = value_b
+            self.cached[reg] = 1
+            self.cached[reg + 1] = 1
+        return value_a | (value_b << 8)
+
+    #Reads the level of all 16 pins, port A in the low byte
+    def read_gpio(self):
+        return self.read16(self.GPIOA)
+
 
 
 if __name__ == "__main__":
     print("IO Expander Module File")
     spi_bus = machine.SPI(1, baudrate=10000000)	#Initialising SPI bus 1
     io_expander1 = MCP23S17("PD14", spi_bus)
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    
\ No newline at end of file
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
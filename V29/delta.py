@@ -0,0 +1,130 @@
+"""
+Delta Module
+Delta codec for quarter-degree samples, shared by the delta log and the delta UART frames.
+
+MAX31855 readings are whole quarter degrees and most channels read the same
+value, or one step away, from one scan to the next. Each scan is therefore
+sent as the change from the previous scan, two bits per channel:
+
+    Keyframe payload (n channels)
+    0   2n  Samples, int16 quarter degrees, little-endian
+
+    Delta payload
+    0   ceil(n/4)  2-bit codes, channel i in bits 2*(i % 4) of byte i // 4:
+                   0 unchanged, 1 up one step, 2 down one step, 3 escape
+    ..  ..         For each escape, in channel order, the change as a zig-zag
+                   varint (7 bits per byte, low bits first, top bit = more bytes)
+
+A keyframe is sent every keyframe_interval payloads, whenever the channel count
+changes, and whenever a delta payload would be larger than a keyframe. A
+decoder that joins mid-stream, or loses a payload, waits for the next keyframe.
+"""
+from array import array
+
+# ============ CONFIGURATION ============
+KEYFRAME_INTERVAL = 60		#Payloads per keyframe (a keyframe plus 59 deltas)
+
+CODE_SAME = 0
+CODE_UP = 1
+CODE_DOWN = 2
+CODE_ESCAPE = 3
+
+
+def max_payload(count):
+    """Largest payload encode() can write for count channels (a keyframe, plus a varint of slack)."""
+    return 2 * count + 3
+
+
+# ============ DELTA CODEC CLASS ============
+class DELTA_CODEC:
+    """
+    Encoder side of the delta codec.
+
+    Keeps the previous samples of every channel and writes each new scan
+    into a caller-supplied buffer, so encoding allocates nothing.
+    """
+
+    def __init__(self, capacity, keyframe_interval=KEYFRAME_INTERVAL):
+        """
+        Initialize the codec.
+
+        Args:
+            capacity: Maximum number of channels
+            keyframe_interval: Payloads per keyframe
+        """
+        self.capacity = capacity
+        self.keyframe_interval = keyframe_interval
+        self.prev = array('h', [0] * capacity)	#Samples the decoder holds after the last payload
+        self.count = 0		#Channel count of the last payload
+        self.since_key = -1	#Deltas since the last keyframe, -1 forces a keyframe
+
+    def force_key(self):
+        """Make the next payload a keyframe, e.g. after one was lost or a new file was started."""
+        self.since_key = -1
+
+    def encode(self, samples, n, buf, pos):
+        """
+        Encode one scan.
+
+        Args:
+            samples: Quarter-degree samples, e.g. TC_BANK.tc_q
+            n: Number of channels in the scan
+            buf: Output buffer with max_payload(n) bytes free from pos
+            pos: Offset in buf to write at
+
+        Returns:
+            (end, key): offset after the payload, and True if it is a keyframe
+        """
+        if n > self.capacity:
+            raise ValueError("delta codec capacity exceeded")
+        if self.since_key < 0 or self.since_key + 1 >= self.keyframe_interval or n != self.count:
+            return self._keyframe(samples, n, buf, pos), True
+
+        prev = self.prev
+        j = pos + (n + 3) // 4
+        for k in range(pos, j):
+            buf[k] = 0
+        limit = pos + 2 * n
+        for i in range(n):
+            d = samples[i] - prev[i]
+            if d == 0:
+                continue
+            if d == 1:
+                code = CODE_UP
+            elif d == -1:
+                code = CODE_DOWN
+            else:
+                code = CODE_ESCAPE
+                z = d << 1 if d > 0 else ((-d) << 1) - 1	#Zig-zag: 2, -2, 3, -3 -> 4, 3, 6, 5
+                while z > 0x7F:
+                    buf[j] = (z & 0x7F) | 0x80
+                    j += 1
+                    z >>= 7
+                buf[j] = z
+                j += 1
+                if j > limit:
+                    # Most channels jumped (e.g. a probe board was replugged), a keyframe is smaller
+                    return self._keyframe(samples, n, buf, pos), True
+            buf[pos + (i >> 2)] |= code << ((i & 3) << 1)
+
+        for i in range(n):
+            prev[i] = samples[i]
+        self.since_key += 1
+        return j, False
+
+    def _keyframe(self, samples, n, buf, pos):
+        prev = self.prev
+        j = pos
+        for i in range(n):
+            q = samples[i]
+            prev[i] = q
+            buf[j] = q & 0xFF
+            buf[j + 1] = (q >> 8) & 0xFF
+            j += 2
+        self.count = n
+        self.since_key = 0
+        return j
+
+
+if __name__ == "__main__":
+    print("Delta Module File")
@@ -0,0 +1,162 @@
+"""
+Download Module
+Streams log files from the SD card over UART in checked, resumable chunks.
+
+    FILES                   -> FILES:<name>,<size>;<name>,<size>;...
+    FILE_GET:<name>:<offset> -> FILE_START:<name>:<size>:<offset>
+                               FILE_DATA:<offset>:<base64>:<crc>   (repeated)
+                               FILE_END:<name>:<size>
+    FILE_STOP               -> FILE_STOP:<name>:<offset>
+
+<crc> is the CRC-16/CCITT of the chunk's raw bytes as 4 hex digits. A host
+that loses the link keeps the bytes up to its last good chunk and resumes
+with FILE_GET:<name>:<that offset>.
+
+The file is read one chunk at a time into a preallocated buffer, so logs of
+any size are sent with constant RAM use. One chunk is queued per main loop
+pass, and only while the transmit queue has room, so a download never holds
+up a scan.
+"""
+import os
+import binascii
+
+from frames import crc16
+
+# ============ CONFIGURATION ============
+FILE_CHUNK_SIZE = 384		#Raw bytes per FILE_DATA line (512 characters of base64)
+FILE_QUEUE_LIMIT = 2048		#Only queue a chunk while the TX queue holds less than this
+FILE_EXTENSIONS = (".csv", ".bin", ".dlt")
+
+
+def _is_log(name):
+    """Log files are named after their date, e.g. 2026-01-27_09-00.csv."""
+    if name[-4:] not in FILE_EXTENSIONS:
+        return False
+    try:
+        int(name.split('-')[0])
+    except ValueError:
+        return False
+    return True
+
+
+def list_logs():
+    """
+    Get the log files in the current directory.
+
+    Returns:
+        List of (name, size) tuples sorted by name (oldest first)
+    """
+    logs = []
+    if hasattr(os, "ilistdir"):
+        # MicroPython: entries carry the size, no stat() per file
+        for entry in os.ilistdir():
+            if entry[1] == 0x8000 and _is_log(entry[0]):
+                logs.append((entry[0], entry[3]))
+    else:
+        for name in os.listdir():
+            if _is_log(name):
+                logs.append((name, os.stat(name)[6]))
+    logs.sort()
+    return logs
+
+
+# ============ FILE SENDER CLASS ============
+class FILE_SENDER:
+    """Sends one file at a time as FILE_DATA lines, resuming from any offset."""
+
+    def __init__(self, chunk_size=FILE_CHUNK_SIZE):
+        """
+        Initialize the sender.
+
+        Args:
+            chunk_size: Raw bytes per chunk, a multiple of 3 so base64 has no padding mid-file
+        """
+        self.buf = bytearray(chunk_size)
+        self.mv = memoryview(self.buf)
+        self.file = None
+        self.name = None
+        self.size = 0
+        self.offset = 0		#File offset of the next chunk
+
+    @property
+    def active(self):
+        return self.file is not None
+
+    def send_list(self, helper):
+        """Reply to FILES with every log file and its size."""
+        try:
+            logs = list_logs()
+        except OSError as e:
+            helper.write_uart(f"FILES:ERROR_{e}")
+            return
+        helper.write_uart("FILES:" + ";".join(f"{name},{size}" for name, size in logs))
+
+    def start(self, helper, arg):
+        """
+        Begin sending a file.
+
+        Args:
+            helper: UART helper
+            arg: "<name>" or "<name>:<offset>"
+        """
+        self.stop()
+        name, _, offset = arg.partition(":")
+        name = name.strip()
+        if not _is_log(name):
+            helper.write_uart(f"FILE_ERROR:NOT_A_LOG_{name}")
+            return
+        try:
+            offset = int(offset) if offset else 0
+        except ValueError:
+            helper.write_uart(f"FILE_ERROR:BAD_OFFSET_{offset}")
+            return
+        try:
+            self.file = open(name, "rb")
+            self.size = self.file.seek(0, 2)
+        except OSError:
+            self.file = None
+            helper.write_uart(f"FILE_ERROR:NOT_FOUND_{name}")
+            return
+        if not 0 <= offset <= self.size:
+            self.stop()
+            helper.write_uart(f"FILE_ERROR:BAD_OFFSET_{offset}")
+            return
+        self.file.seek(offset)
+        self.name = name
+        self.offset = offset
+        helper.write_uart(f"FILE_START:{name}:{self.size}:{offset}")
+
+    def step(self, helper):
+        """Queue the next chunk if there is room. Call once per main loop pass."""
+        if self.file is None or helper.tx.depth >= FILE_QUEUE_LIMIT:
+            return
+        try:
+            n = self.file.readinto(self.buf)
+        except OSError as e:
+            helper.write_uart(f"FILE_ERROR:{e}")
+            self.stop()
+            return
+        if not n:
+            # A log still being written may have grown since FILE_START
+            helper.write_uart(f"FILE_END:{self.name}:{self.offset}")
+            self.stop()
+            return
+        data = binascii.b2a_base64(self.mv[:n])[:-1]	#Drop the trailing newline
+        crc = crc16(self.buf, 0, n)
+        helper.write_uart(f"FILE_DATA:{self.offset}:{data.decode()}:{crc:04X}")
+        self.offset += n
+
+    def stop(self, helper=None):
+        """Close the file, replying FILE_STOP:<name>:<offset> if a helper is given."""
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            if helper is not None:
+                helper.write_uart(f"FILE_STOP:{self.name}:{self.offset}")
+        self.file = None
+
+
+if __name__ == "__main__":
+    print("Download Module File")
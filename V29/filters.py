@@ -0,0 +1,248 @@
+"""
+Filters Module
+Per-channel smoothing of the probe temperatures, chosen separately for the
+UART stream and the SD log (FILTER:<UART|LOG|ALL>:<spec>).
+
+A spec is RAW or up to three stages joined by '+', always applied in this order:
+
+    MED3    median of the last 3 samples, removes single-scan glitches
+    MA<n>   running-sum moving average over n samples (2, 4, 8 or 16, default 8)
+    EMA<n>  exponential moving average with alpha 1/n (2 .. 64, power of two, default 8)
+
+e.g. "MED3+EMA8". Every stage keeps its state in typed arrays sized when the
+stream is created, does O(1) integer work per sample and allocates nothing.
+Samples flagged with a fault are not fed into the filters. A channel's filters
+start from its first good sample, and start again from the next good sample
+after a fault (e.g. a pruned channel that comes back), so a faulted reading
+never enters the state.
+
+The filters work in sixteenths of a degree. A FILTER_STREAM offers the
+TC_BANK attributes the frame encoders and log writers read (count, tc_q,
+faults, slot, probe_text), so it is passed in place of the bank. tc_q holds
+the output rounded to quarter degrees, the binary formats are unchanged.
+probe_text() prints the sixteenths. The raw readings stay in the TC_BANK.
+"""
+from array import array
+
+# ============ CONFIGURATION ============
+FILTER_RAW = "RAW"
+FILTER_MEDIAN = "MED3"
+FILTER_MA = "MA"
+FILTER_EMA = "EMA"
+
+MA_DEFAULT = 8			#Moving average window if the spec gives none
+MA_MAX = 16				#Largest window, the ring costs 2 * window bytes per channel
+EMA_DEFAULT = 8			#EMA alpha is 1/EMA_DEFAULT if the spec gives none
+EMA_MAX = 64
+EMA_FRAC = 8			#Fraction bits kept in the EMA state
+
+
+def _log2(n):
+    """Exponent of n if it is a power of two >= 2, else None."""
+    if n < 2 or n & (n - 1):
+        return None
+    k = 0
+    while n > 1:
+        n >>= 1
+        k += 1
+    return k
+
+
+def parse_spec(spec):
+    """
+    Parse a filter spec.
+
+    Args:
+        spec: e.g. "RAW", "EMA", "MED3+MA16"
+
+    Returns:
+        (median, ma_shift, ema_shift): median is a bool, the shifts are log2 of
+        the window / time constant, 0 if that stage is off
+
+    Raises:
+        ValueError: if the spec is not valid
+    """
+    median = False
+    ma_shift = 0
+    ema_shift = 0
+    spec = spec.strip().upper()
+    if spec == FILTER_RAW:
+        return median, ma_shift, ema_shift
+    for stage in spec.split("+"):
+        if stage == FILTER_MEDIAN and not median:
+            median = True
+        elif stage.startswith(FILTER_EMA) and not ema_shift:
+            n = int(stage[3:]) if stage[3:] else EMA_DEFAULT
+            ema_shift = _log2(n) if n <= EMA_MAX else None
+            if not ema_shift:
+                raise ValueError(stage)
+        elif stage.startswith(FILTER_MA) and not ma_shift:
+            n = int(stage[2:]) if stage[2:] else MA_DEFAULT
+            ma_shift = _log2(n) if n <= MA_MAX else None
+            if not ma_shift:
+                raise ValueError(stage)
+        else:
+            raise ValueError(stage)
+    return median, ma_shift, ema_shift
+
+
+def spec_name(median, ma_shift, ema_shift):
+    """Canonical spec string, e.g. "MED3+EMA8" or "RAW"."""
+    stages = []
+    if median:
+        stages.append(FILTER_MEDIAN)
+    if ma_shift:
+        stages.append(f"{FILTER_MA}{1 << ma_shift}")
+    if ema_shift:
+        stages.append(f"{FILTER_EMA}{1 << ema_shift}")
+    return "+".join(stages) if stages else FILTER_RAW
+
+
+# ============ FILTER STREAM CLASS ============
+class FILTER_STREAM:
+    """Filter state of every channel for one output stream."""
+
+    def __init__(self, capacity, spec=FILTER_RAW):
+        """
+        Initialize the stream.
+
+        Args:
+            capacity: Maximum number of channels
+            spec: Filter spec, see parse_spec()
+        """
+        self.median, self.ma_shift, self.ema_shift = parse_spec(spec)
+        self.spec = spec_name(self.median, self.ma_shift, self.ema_shift)
+        self.capacity = capacity
+        self.raw = not (self.median or self.ma_shift or self.ema_shift)
+
+        # TC_BANK attributes seen by the frame encoders and log writers, set by update()
+        self.count = 0
+        self.slot = None
+        self.faults = None
+        self.tc_q = array('h', [0] * capacity)	#Output in quarter degrees (rounded)
+        self.tc_x = array('h', [0] * capacity)	#Output in sixteenths of a degree
+
+        if self.raw:
+            return
+        if self.median:
+            self.m1 = array('h', [0] * capacity)	#Previous two inputs per channel
+            self.m2 = array('h', [0] * capacity)
+        if self.ma_shift:
+            self.window = 1 << self.ma_shift
+            self.ring = array('h', [0] * (self.window * capacity))	#window rows of capacity samples
+            self.sum = array('l', [0] * capacity)
+            self.pos = 0		#Ring row to overwrite next, shared because every channel is scanned together
+        if self.ema_shift:
+            self.ema = array('l', [0] * capacity)	#State in sixteenths << EMA_FRAC
+        self.primed = bytearray(capacity)	#1 once a channel's filters hold its samples, cleared when it faults
+
+    def reset(self):
+        """Restart every filter from the next sample, e.g. after the channels were detected again."""
+        if self.raw:
+            return
+        primed = self.primed
+        for i in range(self.capacity):
+            primed[i] = 0
+
+    def apply(self, bank):
+        """
+        Filter a converted scan.
+
+        Args:
+            bank: TC_BANK after convert_all()
+
+        Returns:
+            bank itself for RAW, else this stream with the filtered scan
+        """
+        if self.raw:
+            return bank
+        self.update(bank)
+        return self
+
+    def update(self, bank):
+        """Feed one scan of every channel through the filters."""
+        n = bank.count
+        if n != self.count:
+            self.reset()
+            self.count = n
+        self.slot = bank.slot
+        self.faults = bank.faults
+        tc_q = bank.tc_q
+        faults = bank.faults
+        out_q = self.tc_q
+        out_x = self.tc_x
+        primed = self.primed
+        median = self.median
+        ma_shift = self.ma_shift
+        ema_shift = self.ema_shift
+        if median:
+            m1 = self.m1
+            m2 = self.m2
+        if ma_shift:
+            ring = self.ring
+            sums = self.sum
+            row = self.pos * self.capacity
+            ma_round = 1 << (ma_shift - 1)
+        if ema_shift:
+            ema = self.ema
+        ema_round = 1 << (EMA_FRAC - 1)
+
+        for i in range(n):
+            if faults[i]:
+                primed[i] = 0	#Start again from the next good sample
+                continue
+            x = tc_q[i] << 2
+            if not primed[i]:
+                self._prime(i, x)
+                primed[i] = 1
+            if median:
+                a = m1[i]
+                b = m2[i]
+                m2[i] = a
+                m1[i] = x
+                # Median of x, a, b
+                if a > b:
+                    a, b = b, a
+                if x < a:
+                    x = a
+                elif x > b:
+                    x = b
+            if ma_shift:
+                j = row + i
+                s = sums[i] + x - ring[j]
+                ring[j] = x
+                sums[i] = s
+                x = (s + ma_round) >> ma_shift
+            if ema_shift:
+                y = ema[i]
+                y += ((x << EMA_FRAC) - y) >> ema_shift
+                ema[i] = y
+                x = (y + ema_round) >> EMA_FRAC
+            out_x[i] = x
+            out_q[i] = (x + 2) >> 2
+
+        if ma_shift:
+            self.pos = (self.pos + 1) & (self.window - 1)
+
+    def _prime(self, i, x):
+        """Fill channel i's filters with sample x (sixteenths), as if it had always read that."""
+        if self.median:
+            self.m1[i] = x
+            self.m2[i] = x
+        if self.ma_shift:
+            cap = self.capacity
+            for r in range(self.window):
+                self.ring[r * cap + i] = x
+            self.sum[i] = x << self.ma_shift
+        if self.ema_shift:
+            self.ema[i] = x << EMA_FRAC
+
+    def probe_text(self):
+        """Comma-separated filtered probe temperatures in degrees (sixteenth resolution), empty for a faulted channel."""
+        tc_x = self.tc_x
+        faults = self.faults
+        return ",".join([str(tc_x[i] / 16) if not faults[i] else "" for i in range(self.count)])
+
+
+if __name__ == "__main__":
+    print("Filters Module File")
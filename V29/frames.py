@@ -0,0 +1,329 @@
+"""
+Frames Module
+Packed binary measurement frames for the UART link.
+
+Frame layout (all fields little-endian):
+    0   2   Sync bytes 0xAA 0x55
+    2   1   Frame type (FRAME_MEASURE)
+    3   1   Protocol version
+    4   2   Sequence number (wraps at 65536)
+    6   4   Timestamp, time.ticks_ms() when the scan finished
+    10  2   Channel count n
+    12  2n  Probe temperatures, int16 quarter degrees
+    ..  ceil(n/8)  Fault bitmap, bit (i % 8) of byte (i // 8) set if channel i has a fault
+    ..  2   CRC-16/CCITT (poly 0x1021, init 0xFFFF) of every byte after the sync bytes
+
+Delta frames (FRAME_MEASURE_DELTA) share the first 12 bytes, then:
+    12  1   Flags, bit 0 keyframe, bit 1 fault bitmap present
+    13  2   Payload length p
+    15  p   Delta codec payload (see delta.py)
+    ..  ceil(n/8)  Fault bitmap, only if flag bit 1 is set (any channel has a fault)
+    ..  2   CRC-16/CCITT of every byte after the sync bytes
+
+Sample frames (FRAME_SAMPLES, adaptive sampling) carry the n channels read on
+one tick, each with its own time. The header timestamp is the first read:
+    12  4n  Per sample: u8 channel index (0-based), u8 ms after the header
+            timestamp (255 at most), int16 probe temperature in quarter degrees
+    ..  ceil(n/8)  Fault bitmap, bit (k % 8) of byte (k // 8) set if sample k has a fault
+    ..  2   CRC-16/CCITT of every byte after the sync bytes
+"""
+import time
+from array import array
+
+from delta import DELTA_CODEC, max_payload
+
+# ============ CONFIGURATION ============
+SYNC = b'\xaa\x55'
+FRAME_MEASURE = 0x01
+FRAME_MEASURE_DELTA = 0x02
+FRAME_SAMPLES = 0x03
+VERSION = 1
+HEADER_SIZE = 12
+DELTA_HEADER_SIZE = 15
+CRC_SIZE = 2
+SAMPLE_SIZE = 4		#Bytes per sample in a sample frame
+FRAME_KEYFRAME_INTERVAL = 30	#Delta frames per keyframe, the longest a host waits to resync
+FLAG_KEYFRAME = 0x01
+FLAG_FAULTS = 0x02
+
+# UART output modes for measurement data
+FRAME_TEXT = "TEXT"		#One "TC<id>: <temp>" line per channel (default)
+FRAME_BINARY = "BINARY"	#One packed frame per scan
+FRAME_DELTA = "DELTA"	#One delta-encoded frame per scan
+
+
+# ============ CRC ============
+def _crc_table():
+    table = array('H', [0] * 256)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table[i] = crc
+    return table
+
+CRC_TABLE = _crc_table()
+
+
+def crc16(buf, start, end, crc=0xFFFF):
+    """
+    CRC-16/CCITT of buf[start:end] without slicing it.
+
+    Args:
+        buf: Bytes-like object
+        start: First byte to include
+        end: One past the last byte to include
+        crc: Starting value, to continue an earlier CRC
+
+    Returns:
+        CRC as an int
+    """
+    table = CRC_TABLE
+    for i in range(start, end):
+        crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ buf[i]) & 0xFF]
+    return crc
+
+
+def _pack_header(buf, ftype, seq, timestamp, n):
+    """Write the sync bytes and the common 12-byte frame header."""
+    buf[0] = SYNC[0]
+    buf[1] = SYNC[1]
+    buf[2] = ftype
+    buf[3] = VERSION
+    buf[4] = seq & 0xFF
+    buf[5] = (seq >> 8) & 0xFF
+    buf[6] = timestamp & 0xFF
+    buf[7] = (timestamp >> 8) & 0xFF
+    buf[8] = (timestamp >> 16) & 0xFF
+    buf[9] = (timestamp >> 24) & 0xFF
+    buf[10] = n & 0xFF
+    buf[11] = (n >> 8) & 0xFF
+
+
+def _pack_faults(buf, j, faults, n):
+    """Write the fault bitmap of n channels at buf[j] and return the offset after it."""
+    for k in range((n + 7) // 8):
+        buf[j + k] = 0
+    for i in range(n):
+        if faults[i]:
+            buf[j + (i >> 3)] |= 1 << (i & 7)
+    return j + (n + 7) // 8
+
+
+# ============ MEASUREMENT FRAME CLASS ============
+class MEASURE_FRAME:
+    """
+    Packs one scan of a TC_BANK into a preallocated binary frame.
+
+    At 256 channels a frame is 560 bytes against roughly 3 KB of text lines,
+    and it goes out in a single UART write.
+    """
+
+    def __init__(self, capacity):
+        """
+        Initialize the frame encoder.
+
+        Args:
+            capacity: Maximum number of channels in one frame
+        """
+        self.capacity = capacity
+        self.buf = bytearray(self.frame_size(capacity))
+        self.mv = memoryview(self.buf)
+        self.seq = 0	#Sequence number of the next frame
+
+    @staticmethod
+    def frame_size(count):
+        """Get the size in bytes of a frame holding count channels."""
+        return HEADER_SIZE + 2 * count + (count + 7) // 8 + CRC_SIZE
+
+    def pack(self, bank, timestamp=None):
+        """
+        Pack the bank's latest converted readings.
+
+        Args:
+            bank: TC_BANK whose tc_q and faults hold the scan
+            timestamp: ticks_ms of the scan, now if None
+
+        Returns:
+            memoryview of the packed frame (valid until the next pack)
+        """
+        n = bank.count
+        if n > self.capacity:
+            raise ValueError("frame capacity exceeded")
+        if timestamp is None:
+            timestamp = time.ticks_ms()
+
+        buf = self.buf
+        seq = self.seq
+        _pack_header(buf, FRAME_MEASURE, seq, timestamp, n)
+
+        # Samples, written byte by byte so no intermediate objects are created
+        tc_q = bank.tc_q
+        j = HEADER_SIZE
+        for i in range(n):
+            q = tc_q[i]
+            buf[j] = q & 0xFF
+            buf[j + 1] = (q >> 8) & 0xFF
+            j += 2
+
+        j = _pack_faults(buf, j, bank.faults, n)
+
+        crc = crc16(buf, 2, j)
+        buf[j] = crc & 0xFF
+        buf[j + 1] = crc >> 8
+
+        self.seq = (seq + 1) & 0xFFFF
+        return self.mv[:j + CRC_SIZE]
+
+
+
+# ============ DELTA FRAME CLASS ============
+class DELTA_FRAME:
+    """
+    Packs one scan of a TC_BANK as a delta frame.
+
+    At 256 channels with the usual 0/±1 step changes a delta frame is about
+    80 bytes, and a 527-byte keyframe goes out every FRAME_KEYFRAME_INTERVAL
+    frames. The fault bitmap is only included while a channel has a fault.
+    """
+
+    def __init__(self, capacity, keyframe_interval=FRAME_KEYFRAME_INTERVAL):
+        """
+        Initialize the frame encoder.
+
+        Args:
+            capacity: Maximum number of channels in one frame
+            keyframe_interval: Frames per keyframe
+        """
+        self.capacity = capacity
+        self.codec = DELTA_CODEC(capacity, keyframe_interval)
+        self.buf = bytearray(DELTA_HEADER_SIZE + max_payload(capacity) + (capacity + 7) // 8 + CRC_SIZE)
+        self.mv = memoryview(self.buf)
+        self.seq = 0	#Sequence number of the next frame
+
+    def force_key(self):
+        """Make the next frame a keyframe, e.g. after the transmit queue dropped one."""
+        self.codec.force_key()
+
+    def pack(self, bank, timestamp=None):
+        """
+        Pack the bank's latest converted readings.
+
+        Args:
+            bank: TC_BANK whose tc_q and faults hold the scan
+            timestamp: ticks_ms of the scan, now if None
+
+        Returns:
+            memoryview of the packed frame (valid until the next pack)
+        """
+        n = bank.count
+        if n > self.capacity:
+            raise ValueError("frame capacity exceeded")
+        if timestamp is None:
+            timestamp = time.ticks_ms()
+
+        buf = self.buf
+        seq = self.seq
+        _pack_header(buf, FRAME_MEASURE_DELTA, seq, timestamp, n)
+        j, key = self.codec.encode(bank.tc_q, n, buf, DELTA_HEADER_SIZE)
+        length = j - DELTA_HEADER_SIZE
+        flags = FLAG_KEYFRAME if key else 0
+        buf[13] = length & 0xFF
+        buf[14] = (length >> 8) & 0xFF
+
+        faults = bank.faults
+        for i in range(n):
+            if faults[i]:
+                flags |= FLAG_FAULTS
+                j = _pack_faults(buf, j, faults, n)
+                break
+        buf[12] = flags
+
+        crc = crc16(buf, 2, j)
+        buf[j] = crc & 0xFF
+        buf[j + 1] = crc >> 8
+
+        self.seq = (seq + 1) & 0xFFFF
+        return self.mv[:j + CRC_SIZE]
+
+
+# ============ SAMPLE FRAME CLASS ============
+class SAMPLE_FRAME:
+    """
+    Packs the samples of one adaptive sampling tick, each with its own time.
+
+    Only the channels read on the tick are sent, so a tick reading 8 hot
+    channels is a 48-byte frame whatever the channel count.
+    """
+
+    def __init__(self, capacity):
+        """
+        Initialize the frame encoder.
+
+        Args:
+            capacity: Maximum number of channels (at most 256, the index is one byte)
+        """
+        if capacity > 256:
+            raise ValueError("sample frames address at most 256 channels")
+        self.capacity = capacity
+        self.buf = bytearray(self.frame_size(capacity))
+        self.mv = memoryview(self.buf)
+        self.seq = 0	#Sequence number of the next frame
+
+    @staticmethod
+    def frame_size(count):
+        """Get the size in bytes of a frame holding count samples."""
+        return HEADER_SIZE + SAMPLE_SIZE * count + (count + 7) // 8 + CRC_SIZE
+
+    def pack(self, bank, sampler):
+        """
+        Pack the samples read on this tick.
+
+        Args:
+            bank: TC_BANK whose tc_q and faults hold the converted samples
+            sampler: RATE_SCHEDULER whose picked and t_ms list the channels read and their times
+
+        Returns:
+            memoryview of the packed frame (valid until the next pack)
+        """
+        n = sampler.n_picked
+        picked = sampler.picked
+        t_ms = sampler.t_ms
+        t0 = t_ms[picked[0]] if n else time.ticks_ms()
+
+        buf = self.buf
+        seq = self.seq
+        _pack_header(buf, FRAME_SAMPLES, seq, t0, n)
+
+        tc_q = bank.tc_q
+        faults = bank.faults
+        j = HEADER_SIZE
+        bitmap = HEADER_SIZE + SAMPLE_SIZE * n
+        for k in range((n + 7) // 8):
+            buf[bitmap + k] = 0
+        for k in range(n):
+            i = picked[k]
+            dt = time.ticks_diff(t_ms[i], t0)
+            q = tc_q[i]
+            buf[j] = i
+            buf[j + 1] = dt if dt < 255 else 255
+            buf[j + 2] = q & 0xFF
+            buf[j + 3] = (q >> 8) & 0xFF
+            j += SAMPLE_SIZE
+            if faults[i]:
+                buf[bitmap + (k >> 3)] |= 1 << (k & 7)
+        j = bitmap + (n + 7) // 8
+
+        crc = crc16(buf, 2, j)
+        buf[j] = crc & 0xFF
+        buf[j + 1] = crc >> 8
+
+        self.seq = (seq + 1) & 0xFFFF
+        return self.mv[:j + CRC_SIZE]
+
+
+if __name__ == "__main__":
+    print("Frames Module File")
@@ -0,0 +1,46 @@
+"""
+Hardware Module
+Creates each hardware pin once, when it is first used.
+
+Modules ask for pins by name instead of constructing machine.Pin objects at
+import time, so a line shared by several drivers (e.g. SRCLK, which is also
+the chip-select SoftSPI clock) is one object, and pins nothing uses (debug
+outputs, the user button) are never configured.
+"""
+import machine
+
+# ============ CONFIGURATION ============
+DEBUG_PINS = ("PE9", "PE11", "PE13", "PD14")	#Spare outputs for timing measurements on a scope
+
+_pins = {}
+
+
+def pin(name, mode=machine.Pin.OUT, pull=None):
+    """
+    Get the Pin for a pin name, configuring it on first use.
+    
+    Args:
+        name: Pin name, e.g. "PF15"
+        mode: Mode used when the pin is created
+        pull: Pull used when the pin is created (None for no pull argument)
+        
+    Returns:
+        The same machine.Pin object on every call for that name
+    """
+    p = _pins.get(name)
+    if p is None:
+        if pull is None:
+            p = machine.Pin(name, mode)
+        else:
+            p = machine.Pin(name, mode, pull)
+        _pins[name] = p
+    return p
+
+
+def pin_count():
+    """Get the number of pins created so far."""
+    return len(_pins)
+
+
+if __name__ == "__main__":
+    print("Hardware Module File")
@@ -0,0 +1,203 @@
+"""
+Health Module
+Per-channel fault statistics and scan-list pruning for the measurement scans.
+
+Every read's MAX31855 fault bits (open circuit, short to GND, short to VCC)
+are counted per channel. A channel that reads with a fault PRUNE_AFTER times
+in a row leaves the scan list: the fixed-period scan stops reading it, and its
+last (faulted) frame keeps it flagged in every output. Pruned channels are
+re-read in the background, one every REPROBE_MS in turn, and a clean read
+puts the channel back in the scan list. An open probe then costs one read per
+re-probe instead of one per scan.
+
+The counters read the fault bits straight from the raw frames, so they are
+updated right after the reads, before bank.convert_all(). Adaptive sampling
+already backs faulted channels off to the floor interval, so its reads are
+counted (and may prune or restore a channel) but it does not use the scan list.
+
+The summary is sent on HEALTH:
+
+    HEALTH:channels=<n>,scanned=<n>,pruned=<n>,reprobes=<n>,restored=<n>[;<id>:<oc>/<scg>/<scv>[:P]]...
+
+with one ";<id>:..." entry for each channel (1-based TC number) that has
+faulted since detection or HEALTH:CLEAR, ":P" marking the pruned ones.
+"""
+import time
+from array import array
+
+# ============ CONFIGURATION ============
+PRUNE_AFTER = 8			#Faulted reads in a row before a channel leaves the scan list
+REPROBE_MS = 5000		#Time between background re-reads of pruned channels
+COUNT_MAX = 0xFFFF		#Fault counters stop here
+
+# MAX31855 fault bits (D2..D0 of the frame)
+FAULT_OC = 0x1			#Open circuit
+FAULT_SCG = 0x2			#Short to GND
+FAULT_SCV = 0x4			#Short to VCC
+
+
+# ============ FAULT MONITOR CLASS ============
+class FAULT_MONITOR:
+    """Fault counters of every channel and the list of channels the scan reads."""
+
+    def __init__(self, capacity, prune_after=PRUNE_AFTER, reprobe_ms=REPROBE_MS):
+        """
+        Initialize the monitor with no channels.
+
+        Args:
+            capacity: Maximum number of channels
+            prune_after: Faulted reads in a row before a channel is pruned, 0 to never prune
+            reprobe_ms: Time between re-reads of pruned channels
+        """
+        self.capacity = capacity
+        self.prune_after = prune_after
+        self.reprobe_ms = reprobe_ms
+        self.count = 0
+
+        self.oc = array('H', [0] * capacity)	#Open circuit reads per channel
+        self.scg = array('H', [0] * capacity)	#Short to GND reads per channel
+        self.scv = array('H', [0] * capacity)	#Short to VCC reads per channel
+        self.streak = bytearray(capacity)		#Faulted reads in a row (saturates at 255)
+        self.pruned = bytearray(capacity)		#1 while the channel is out of the scan list
+
+        self.scan_list = array('H', [0] * capacity)	#Indices of the channels the scan reads, in channel order
+        self.n_scan = 0
+        self.changed = False	#A channel was pruned or restored, the scan list is rebuilt after the pass
+        self.next_probe = 0		#Pruned channel to re-read next (round robin)
+        self.last_probe = 0		#ticks_ms of the last re-read
+
+        self.reprobes = 0		#Background re-reads of pruned channels
+        self.restored = 0		#Channels put back in the scan list
+
+    def reset(self, count):
+        """
+        Start over for a new set of channels, e.g. after detection.
+
+        Args:
+            count: Number of channels
+        """
+        self.count = count
+        for i in range(count):
+            self.oc[i] = 0
+            self.scg[i] = 0
+            self.scv[i] = 0
+            self.streak[i] = 0
+            self.pruned[i] = 0
+        self.reprobes = 0
+        self.restored = 0
+        self.last_probe = time.ticks_ms()
+        self._rebuild()
+
+    def _rebuild(self):
+        """Rebuild the scan list from the pruned flags."""
+        n = 0
+        pruned = self.pruned
+        scan_list = self.scan_list
+        for i in range(self.count):
+            if not pruned[i]:
+                scan_list[n] = i
+                n += 1
+        self.n_scan = n
+        self.changed = False
+
+    def check(self, frame, indices, n):
+        """
+        Count the fault bits of channels just read.
+
+        Args:
+            frame: TC_BANK.frame holding their raw frames
+            indices: Channel indices that were read, in indices[:n]
+            n: Number of channels read
+        """
+        streak = self.streak
+        for k in range(n):
+            i = indices[k]
+            bits = frame[(i << 2) + 3] & 0x7
+            # A clean read of a clean channel is the common case and costs nothing else
+            if bits or streak[i]:
+                self._record(i, bits)
+        if self.changed:
+            self._rebuild()
+
+    def _record(self, i, bits):
+        """Count one read of channel i, pruning or restoring it."""
+        if not bits:
+            self.streak[i] = 0
+            if self.pruned[i]:
+                self.pruned[i] = 0
+                self.restored += 1
+                self.changed = True
+            return
+        if bits & FAULT_OC and self.oc[i] < COUNT_MAX:
+            self.oc[i] += 1
+        if bits & FAULT_SCG and self.scg[i] < COUNT_MAX:
+            self.scg[i] += 1
+        if bits & FAULT_SCV and self.scv[i] < COUNT_MAX:
+            self.scv[i] += 1
+        s = self.streak[i]
+        if s < 255:
+            s += 1
+            self.streak[i] = s
+        if self.prune_after and s >= self.prune_after and not self.pruned[i]:
+            self.pruned[i] = 1
+            self.changed = True
+
+    def reprobe(self, now):
+        """
+        Get the pruned channel to re-read on this scan, at most one every reprobe_ms.
+
+        Args:
+            now: ticks_ms of the scan
+
+        Returns:
+            Channel index, or -1 if none is due
+        """
+        if self.n_scan == self.count or time.ticks_diff(now, self.last_probe) < self.reprobe_ms:
+            return -1
+        self.last_probe = now
+        count = self.count
+        i = self.next_probe
+        for _ in range(count):
+            if i >= count:
+                i = 0
+            if self.pruned[i]:
+                self.next_probe = i + 1
+                self.reprobes += 1
+                return i
+            i += 1
+        return -1
+
+    def probed(self, frame, i):
+        """Count the re-read of pruned channel i."""
+        self._record(i, frame[(i << 2) + 3] & 0x7)
+        if self.changed:
+            self._rebuild()
+
+    def clear(self):
+        """Zero the counters and put every channel back in the scan list (HEALTH:CLEAR)."""
+        self.reset(self.count)
+
+    def summary(self):
+        """Summary as channels=..,scanned=..,pruned=..,reprobes=..,restored=..[;<id>:<oc>/<scg>/<scv>[:P]]..."""
+        parts = [f"channels={self.count},scanned={self.n_scan},pruned={self.count - self.n_scan},"
+                 f"reprobes={self.reprobes},restored={self.restored}"]
+        for i in range(self.count):
+            if self.oc[i] or self.scg[i] or self.scv[i]:
+                mark = ":P" if self.pruned[i] else ""
+                parts.append(f"{i + 1}:{self.oc[i]}/{self.scg[i]}/{self.scv[i]}{mark}")
+        return ";".join(parts)
+
+
+def fault_text(bits):
+    """Text sent in place of a faulted channel's temperature, e.g. "FAULT_OC"."""
+    if bits & FAULT_OC:
+        return "FAULT_OC"
+    if bits & FAULT_SCG:
+        return "FAULT_SCG"
+    if bits & FAULT_SCV:
+        return "FAULT_SCV"
+    return "FAULT"
+
+
+if __name__ == "__main__":
+    print("Health Module File")
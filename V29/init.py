@@ -4,22 +4,25 @@ Manages thermocouple readings and communication for the Heat Cube system.
 """
 import machine
 import time
+import os
 
-from shift_register import SR74HC595_BITBANG
-from thermocouple import MAX31855
+from shift_register import SR74HC595_BITBANG, CS_CHAIN
+from thermocouple import MAX31855, TC_BANK
+from scheduler import ACQ_SCHEDULER, RATE_SCHEDULER
+from frames import crc16
+from pcb import PCB_PINS, PCB_EXPANDER
+from health import FAULT_MONITOR
     
 
 # ============ CONFIGURATION ============
-DEBUG_PIN = machine.Pin("PD14", machine.Pin.OUT)  # Debug pin for timing measurements
+PCB_ENABLE_PINS = ("PG0", "PG1")	#Enable pin of each PCB, in chain order
+PCB_EXPANDER_CS = None			#!CS of the MCP23S17s driving the PCB enables (e.g. "PD14", then not a debug pin), None to use PCB_ENABLE_PINS
+PCB_EXPANDERS = 1				#MCP23S17s on PCB_EXPANDER_CS (hardware addresses 0, 1, ...), 16 PCBs each
 
+TOPOLOGY_FILE = "topology.csv"	#Active chain positions found by the last full probe scan
+TOPOLOGY_VERSION = 1
+PROBE_SETTLE_MS = 10			#Wait after selecting a slot in the full probe scan
 
-PCB_ENABLE1 = machine.Pin("PG0", machine.Pin.OUT)  # Debug pin for timing measurements
-PCB_ENABLE2 = machine.Pin("PG1", machine.Pin.OUT)  # Debug pin for timing measurements
-PCB_ARRAY = [PCB_ENABLE1, PCB_ENABLE2]
-
-DEBUG_PIN1 = machine.Pin("PE9", machine.Pin.OUT)  # Debug pin for timing measurements
-DEBUG_PIN2 = machine.Pin("PE11", machine.Pin.OUT)  # Debug pin for timing measurements
-DEBUG_PIN3 = machine.Pin("PE13", machine.Pin.OUT)  # Debug pin for timing measurements
 # ============ THERMOCOUPLE MANAGER CLASS ============
 class TC_MANAGER:
     """
@@ -29,7 +32,7 @@ class TC_MANAGER:
     using shift registers and SPI communication.
     """
     
-    def __init__(self, total_tc, sr1_bit_bang, spi_bus, MAX31855, uart):
+    def __init__(self, total_tc, sr1_bit_bang, spi_bus, MAX31855, uart, cs_chain=None):
         """
         Initialize the thermocouple manager.
         
@@ -37,8 +40,9 @@ class TC_MANAGER:
             total_tc: Total number of thermocouples to scan (e.g., 256)
             sr1_bit_bang: Instance of shift register class
             spi_bus: SPI bus for communication
-            MAX31855: MAX31855 thermocouple class instance
+            MAX31855: MAX31855 thermocouple class (channels are stored in a TC_BANK instead)
             uart: UART interface for serial communication
+            cs_chain: CS_CHAIN chip select engine (bit banged from sr1_bit_bang if None)
         """
         self.total_tc = total_tc
         self.num_tcs = 0
@@ -49,63 +53,225 @@ class TC_MANAGER:
         self.MAX31855 = MAX31855
         self.uart = uart
         
-        self.PCB_ENABLE1 = machine.Pin("PG0", machine.Pin.OUT)  # Pin for enabling the 1st PCB
-        self.PCB_ENABLE2 = machine.Pin("PG1", machine.Pin.OUT)  # Pin for enabling the 2nd PCB
-        self.PCB_ARRAY = [PCB_ENABLE1, PCB_ENABLE2]
+        # PCB enables, only written when the selected PCB changes
+        if PCB_EXPANDER_CS is None:
+            self.pcbs = PCB_PINS(PCB_ENABLE_PINS)
+        else:
+            self.pcbs = PCB_EXPANDER(PCB_EXPANDER_CS, spi_bus, PCB_EXPANDERS)
         
         self.pcb_tc_count = 16 #Number of thermocouples for each PCB
+        self.active_pcb = -1 #PCB whose MISO buffer was last enabled
+        self.held_tc = 0 #TC held selected for streaming reads (1-based, 0 = none)
+        
+        # Readings, positions and raw frames of every active TC in typed arrays
+        self.bank = TC_BANK(total_tc, spi_bus)
+        
+        # Chip select engine, keeps a shadow of the chain so only changes are shifted
+        if cs_chain is None:
+            cs_chain = CS_CHAIN(None, sr1_bit_bang, total_tc // 8)
+        self.cs_chain = cs_chain
+        
+        # Tracks each chip's conversion window so reads only wait when data can't be fresh
+        self.scheduler = ACQ_SCHEDULER(total_tc)
         
+        # Picks the channels read on each tick of adaptive sampling
+        self.sampler = RATE_SCHEDULER(total_tc)
+        
+        # Counts faults per channel and keeps persistently faulted channels out of the scan
+        self.health = FAULT_MONITOR(total_tc)
+        
+        self.topology_source = None #"cache" or "scan", how init_tc found the active TCs
         self.init_tc()
         
     
-    def init_tc(self):
+    def init_tc(self, use_cache=True):
         """
         Initialize and detect all active thermocouples.
         
-        Scans through all possible thermocouple positions and detects
-        which ones are actually connected and responding.
+        The positions found by the last full probe scan are kept in TOPOLOGY_FILE.
+        If the file matches this hardware, only those positions and a few empty
+        ones are checked, which takes milliseconds instead of seconds. Any
+        difference falls back to the full scan of every position.
+        
+        Args:
+            use_cache: False to always run the full probe scan (RESCAN command)
         """
+        if use_cache:
+            slots = self._load_topology()
+            if slots is not None:
+                if self._verify_topology(slots):
+                    self.topology_source = "cache"
+                    return
+                print("Topology changed, rescanning")
+        
+        self._probe_scan()
+        self.topology_source = "scan"
+        self._save_topology()
+    
+    def _begin_detect(self):
+        # Forget any previous detection, the read times belong to the old channel indices
+        self.bank.clear()
+        self.scheduler.forget()
+        self.tcs_array = self.bank.channels
+        self.tcs_active = []
+        
+        # Disable every PCB, rewriting the enables in case anything else moved them
+        self.pcbs.release()
+        self.active_pcb = -1
+        
         # Clear all registers and disable output
         self.sr1_bit_bang.clear()
         self.sr1_bit_bang.enable(False)
 
         # Pull all !CS high on TC chips (active low, so 1 = high = inactive)
-        for _ in range(self.total_tc):
-            time.sleep_ms(10)
-            self.sr1_bit_bang.bit(1, False)
+        self.cs_chain.release()
 
         # Enable output to send the high signals
         self.sr1_bit_bang.enable(True)
         self.sr1_bit_bang.enable(False)
+    
+    def _end_detect(self):
+        # Leave every !CS high once the scan is done
+        self.cs_chain.release()
 
-        # Load shift register with 0 initially (first TC will be active)
-        self.sr1_bit_bang.bit(0, True)
-        time.sleep_ms(10)
+        # Update active thermocouple count
+        self.num_tcs = self.bank.count
+        self.health.reset(self.num_tcs)
+
+        # Populate active thermocouple CS pin list
+        for tc in self.tcs_array:
+            self.tcs_active.append(tc.cs_pin)
+    
+    def _probe(self, i, settle_ms=0):
+        """
+        Read the raw frame at one chain position.
+        
+        Args:
+            i: Chain position (0-based)
+            settle_ms: Wait after selecting the position
+            
+        Returns:
+            4 bytes, all zero if no MAX31855 answers there
+        """
+        pcb_num = i // self.pcb_tc_count # Each PCB has 16 thermocouples 
+        self.pcb_select(pcb_num)
+        
+        # Walk the !CS low along the chain (first TC starts the walk)
+        self.cs_chain.select(i)
+        
+        if settle_ms:
+            time.sleep_ms(settle_ms)
+        self.sr1_bit_bang.enable(True)
+        data = self.spi_bus.read(4)
+        self.sr1_bit_bang.enable(False)
+        return data
+    
+    def _probe_scan(self):
+        """Probe every chain position for a MAX31855."""
+        self._begin_detect()
 
         # Scan for active thermocouples
         for i in range(self.total_tc):
-            
-            pcb_num = i // self.pcb_tc_count # Each PCB has 16 thermocouples 
-            self.pcb_select(pcb_num)
-            
-            time.sleep_ms(10)
-            self.sr1_bit_bang.enable(True)
-            data = self.spi_bus.read(4)
-            self.sr1_bit_bang.enable(False)
-            self.sr1_bit_bang.bit(1, True)  # Pull CS high again
+            data = self._probe(i, PROBE_SETTLE_MS)
         
             # Check for valid thermocouple data
             # If data is all zeros, no MAX31855 chip is present
             if data != b'\x00\x00\x00\x00':
-                tc_obj = self.MAX31855(i + 1, self.spi_bus, data)
-                self.tcs_array.append(tc_obj)
-
-        # Update active thermocouple count
-        self.num_tcs = len(self.tcs_array)
+                index = self.bank.add(i + 1, data)
+                self.scheduler.mark_read(index)
 
-        # Populate active thermocouple CS pin list
-        for tc in self.tcs_array:
-            self.tcs_active.append(tc.cs_pin)
+        self._end_detect()
+    
+    def _verify_topology(self, slots):
+        """
+        Detect the cached positions and sweep the empty ones.
+        
+        Every cached position must answer and every other position must stay
+        silent. Neither pass waits PROBE_SETTLE_MS, so checking all 256
+        positions takes milliseconds. A read taken too early can only miss a
+        chip, never invent one, so a probe added to an empty position may go
+        unnoticed until RESCAN, but a cached one that is gone is always found.
+        
+        Args:
+            slots: Cached chain positions (0-based, ascending)
+            
+        Returns:
+            True if the hardware matches the cache
+        """
+        self._begin_detect()
+        ok = True
+        for i in slots:
+            data = self._probe(i)
+            if data == b'\x00\x00\x00\x00':
+                ok = False
+                break
+            index = self.bank.add(i + 1, data)
+            self.scheduler.mark_read(index)
+        
+        if ok:
+            cached = bytearray(self.total_tc)
+            for i in slots:
+                cached[i] = 1
+            for i in range(self.total_tc):
+                if not cached[i] and self._probe(i) != b'\x00\x00\x00\x00':
+                    ok = False
+                    break
+        
+        self._end_detect()
+        return ok
+    
+    def signature(self):
+        """Get the hardware signature stored with the topology (MCU ID and chain layout)."""
+        try:
+            uid = machine.unique_id().hex()
+        except AttributeError:
+            uid = "0"
+        return f"{uid}:{self.total_tc}:{self.pcb_tc_count}"
+    
+    def _load_topology(self):
+        """
+        Read the cached topology.
+        
+        Returns:
+            List of 0-based chain positions, or None if there is no valid cache for this hardware
+        """
+        try:
+            with open(TOPOLOGY_FILE, 'r') as f:
+                header = f.readline().strip().split(",")
+                slot_line = f.readline().strip()
+                crc_line = f.readline().strip()
+        except OSError:
+            return None
+        
+        try:
+            if int(header[0]) != TOPOLOGY_VERSION or header[1] != self.signature():
+                return None
+            if int(crc_line, 16) != crc16(slot_line.encode(), 0, len(slot_line)):
+                return None
+            slots = [int(pin) - 1 for pin in slot_line.split(",") if pin]
+        except (IndexError, ValueError):
+            return None
+        
+        for i in slots:
+            if not 0 <= i < self.total_tc:
+                return None
+        return slots
+    
+    def _save_topology(self):
+        """Write the active chain positions to TOPOLOGY_FILE (via a temporary file, so a reset never leaves half a file)."""
+        slot_line = ",".join([str(pin) for pin in self.tcs_active])
+        crc = crc16(slot_line.encode(), 0, len(slot_line))
+        tmp = TOPOLOGY_FILE + ".tmp"
+        try:
+            with open(tmp, 'w') as f:
+                f.write(f"{TOPOLOGY_VERSION},{self.signature()}\n{slot_line}\n{crc:04X}\n")
+            try:
+                os.remove(TOPOLOGY_FILE)
+            except OSError:
+                pass
+            os.rename(tmp, TOPOLOGY_FILE)
+        except OSError as e:
+            print("Error Occured: ", e)
     
     def tc_select_singular(self, tc_selected):
         """
@@ -122,26 +288,26 @@ class TC_MANAGER:
             return None
         
         try:
+            # Chain position of the selected TC's !CS line
+            slot = self.tcs_array[tc_selected - 1].cs_pin - 1
+            
             #Ensures the correct pcb is select to read off MISO line
-            pcb_num = (tc_selected - 1) // self.pcb_tc_count
+            pcb_num = slot // self.pcb_tc_count
             self.pcb_select(pcb_num)            
             
-            # Create bit pattern: all 1s except for selected TC (active low)
-            pattern = (1 << self.num_tcs) - 1
-            pattern &= ~(1 << (self.num_tcs - tc_selected))
-            
-            # Apply pattern to shift register
+            # Latch the selected TC's !CS low (one byte burst, nothing if already latched)
             self.sr1_bit_bang.enable(False)
-            time.sleep_ms(100)
-            self.sr1_bit_bang.bits(pattern, self.num_tcs, True)
-            time.sleep_ms(100)
+            self.cs_chain.select(slot)
+            
+            # Only wait if the chip hasn't finished a conversion since its last read
+            self.scheduler.wait_ready(tc_selected - 1)
             
             self.sr1_bit_bang.enable(True)
             # Read thermocouple data
             self.tcs_array[tc_selected - 1].read_thermocouple()
         
-            time.sleep_ms(100)
             self.sr1_bit_bang.enable(False)
+            self.scheduler.mark_read(tc_selected - 1)
             self.tcs_array[tc_selected - 1].convert_temp()
             print(self.tcs_array[tc_selected - 1].convert_temp())
             
@@ -158,6 +324,70 @@ class TC_MANAGER:
             print(f"Error selecting TC {tc_selected}: {e}")
             return None
     
+    def tc_hold(self, tc_selected):
+        """
+        Latch a single thermocouple selected for repeated streaming reads.
+        
+        Its !CS stays latched low in the shift register and its PCB stays
+        selected, so each tc_read_held() only pulses output enable around
+        the 4-byte SPI read.
+        
+        Args:
+            tc_selected: Index of thermocouple to hold (1-based)
+            
+        Returns:
+            True if the thermocouple is now held, False if the index is invalid
+        """
+        if tc_selected > self.num_tcs or tc_selected < 1:
+            print(f"Invalid TC selected: {tc_selected} (valid range: 1-{self.num_tcs})")
+            self.held_tc = 0
+            return False
+        
+        slot = self.tcs_array[tc_selected - 1].cs_pin - 1
+        self.sr1_bit_bang.enable(False)
+        self.pcb_select(slot // self.pcb_tc_count)
+        self.cs_chain.select(slot)
+        self.held_tc = tc_selected
+        return True
+    
+    def tc_release(self):
+        """Stop holding a thermocouple and pull every !CS high."""
+        self.held_tc = 0
+        self.sr1_bit_bang.enable(False)
+        self.cs_chain.release()
+    
+    def tc_read_held(self):
+        """
+        Read the held thermocouple if it has a new conversion ready.
+        
+        Never sleeps: when the chip is still converting it returns None so the
+        caller can keep servicing UART, which gives the MAX31855's native ~10 Hz.
+        
+        Returns:
+            String with probe and reference temperature data, or None if no new data
+        """
+        if not self.held_tc:
+            return None
+        
+        index = self.held_tc - 1
+        if self.scheduler.ready_in(index):
+            return None
+        
+        # Re-latch if anything else moved the chain or PCB since the hold started
+        tc = self.tcs_array[index]
+        slot = tc.cs_pin - 1
+        if self.cs_chain.selected != slot or self.active_pcb != slot // self.pcb_tc_count:
+            self.tc_hold(self.held_tc)
+        
+        # Output enable pulse frames the read, releasing !CS restarts the conversion
+        self.sr1_bit_bang.enable(True)
+        tc.read_thermocouple()
+        self.sr1_bit_bang.enable(False)
+        self.scheduler.mark_read(index)
+        tc.convert_temp()
+        
+        return "Probe_Data{}, Ref Data: {},{}".format(self.held_tc, tc.tc_c, tc.cj_c)
+    
     def tc_set(self):
         """
         Set all active thermocouples to inactive state (CS high).
@@ -167,9 +397,7 @@ class TC_MANAGER:
         self.sr1_bit_bang.clear()
         self.sr1_bit_bang.enable(False)
         
-        for i in range(self.num_tcs):
-            time.sleep_ms(10)
-            self.sr1_bit_bang.bit(1, True)
+        self.cs_chain.release()
     
     def tc_measure(self):
         """
@@ -180,49 +408,103 @@ class TC_MANAGER:
         Returns:
             Comma-separated string of probe temperatures for all active TCs
         """
-        data_str = ''
+        self.tc_scan()
+        self.bank.convert_all()
         
-        # Start with first TC active (0 = active low)
-        self.sr1_bit_bang.bit(0, True)
-
-        for i in range(self.num_tcs):
-            time.sleep_ms(10)
+        # Text output is the only part of a scan that allocates
+        return self.bank.probe_text()
+    
+    def tc_scan(self):
+        """
+        Read every active thermocouple in the scan list into the bank's frame buffer.
+        
+        Nothing in this loop allocates: each SPI read goes into the TC's
+        preallocated memoryview slice and all bookkeeping is in arrays.
+        Channels pruned by the health monitor are skipped, and one of them is
+        re-read every REPROBE_MS. Call bank.convert_all() afterwards to update
+        the temperatures.
+        """
+        slots = self.bank.slot
+        views = self.bank.views
+        health = self.health
+        scan_list = health.scan_list
+        n = health.n_scan
+        for k in range(n):
+            i = scan_list[k]
+            # Back-to-back reads unless this chip can't have a new conversion yet
+            self.scheduler.wait_ready(i)
+            
+            slot = slots[i]
+            self.pcb_select(slot // self.pcb_tc_count)
             
-            pcb_num = i//self.pcb_tc_count
-            self.pcb_select(pcb_num)
+            # Latch this TC's !CS low (a single bit step when the TCs are consecutive)
+            self.cs_chain.select(slot)
             
-            # Enable current TC (!CS Pulled Low)
+            # Enable current TC (!CS Pulled Low) and read it straight into the frame buffer
             self.sr1_bit_bang.enable(True)
-            # Read thermocouple
-            self.tcs_array[i].read_thermocouple()
+            self.spi_bus.readinto(views[i])
       
-            #Disable current TC (!CS Pulled High)
+            #Disable current TC (!CS Pulled High), which starts its next conversion
             self.sr1_bit_bang.enable(False)
-            
-            # Prepare next TC (if not last)
-            if i < self.num_tcs - 1:
-                self.sr1_bit_bang.bit(1, True)  # Shift in 1 to deactivate previous TC
+            self.scheduler.mark_read(i)
+        health.check(self.bank.frame, scan_list, n)
         
+        # Background re-read of one pruned channel, so a repaired probe comes back
+        i = health.reprobe(time.ticks_ms())
+        if i >= 0:
+            self.tc_read_channel(i)
+            health.probed(self.bank.frame, i)
+    
+    def tc_read_channel(self, i):
+        """Read one channel into the bank's frame buffer (index 0-based), waiting for its conversion if needed."""
+        self.scheduler.wait_ready(i)
+        slot = self.bank.slot[i]
+        self.pcb_select(slot // self.pcb_tc_count)
+        self.cs_chain.select(slot)
+        self.sr1_bit_bang.enable(True)
+        self.spi_bus.readinto(self.bank.views[i])
+        self.sr1_bit_bang.enable(False)
+        self.scheduler.mark_read(i)
+    
+    def tc_scan_due(self):
+        """
+        Read the channels the rate scheduler picks for this adaptive sampling tick.
+        
+        Uses the same chip select walk as tc_scan(), over the picked channels
+        in chain order. Each read's ticks_ms is kept in sampler.t_ms as the
+        sample's timestamp. The reads are counted by the health monitor, but
+        the sampler picks from every channel (it already backs faulted ones
+        off to its floor interval). Call bank.convert_all() and sampler.update()
+        afterwards.
         
-        for i in range(self.num_tcs):
-            # Convert temperature after reading
-            self.tcs_array[i].convert_temp()
+        Returns:
+            Number of channels read, their indices are in sampler.picked
+        """
+        sampler = self.sampler
+        n = sampler.plan(time.ticks_ms())
+        picked = sampler.picked
+        t_ms = sampler.t_ms
+        slots = self.bank.slot
+        views = self.bank.views
+        for k in range(n):
+            i = picked[k]
+            self.scheduler.wait_ready(i)
             
-            # Append temperature to data string
-            data_str += f"{self.tcs_array[i].tc_c},"
-
-        # Remove trailing comma
-        data_str = data_str.rstrip(',')
-        return data_str
-    
+            slot = slots[i]
+            self.pcb_select(slot // self.pcb_tc_count)
+            self.cs_chain.select(slot)
+            
+            self.sr1_bit_bang.enable(True)
+            self.spi_bus.readinto(views[i])
+            self.sr1_bit_bang.enable(False)
+            self.scheduler.mark_read(i)
+            t_ms[i] = time.ticks_ms()
+        self.health.check(self.bank.frame, picked, n)
+        return n
     
-    #Pulls the selected pcb's 125 pin low so MISO line can be read
+    #Enables the selected pcb's MISO buffer (its 125 pin low) so the MISO line can be read
+    #(called for every channel, the enables are only written when the pcb changes)
     def pcb_select(self, pcb_num):
-        
-        #Iterates through all pcb's and pulls the selected one low and the other ones high
-        for i, pcb in enumerate(self.PCB_ARRAY):
-            if i == pcb_num:
-                pcb.low()
-            else:
-                pcb.high()
-        
\ No newline at end of file
+        if pcb_num != self.active_pcb:
+            self.active_pcb = pcb_num
+            self.pcbs.select(pcb_num)
@@ -0,0 +1,525 @@
+"""
+Logger Module
+Measurement-mode log writers for the SD card.
+
+A new log file is started for every 30-minute block, named
+YYYY-MM-DD_HH-MM.<ext> after the start of the block. A file of the block left
+by an earlier run is only appended to if its header holds the current channel
+map. Otherwise, and when the channels change within a block (a different
+channel count, or new_file() after RESCAN), the next file of the block is
+started with a _1, _2, ... suffix.
+
+CSV_LOG writes one "HH:MM:SS,<temp>,<temp>,..." line per scan (the original format),
+with an empty field for a channel that read with a fault.
+
+BIN_LOG writes a header followed by fixed-size records. All fields are little-endian:
+
+    Header
+    0   4   Magic b"HCLG"
+    4   1   Format version
+    5   1   Reserved (0)
+    6   2   Header size in bytes
+    8   2   Record size in bytes
+    10  2   Year
+    12  5   Month, day, hour, minute, second of the first record
+    17  1   Reserved (0)
+    18  2   Channel count n
+    20  2n  Chain position (1-based cs_pin) of each channel
+    ..  2   CRC-16/CCITT of the header bytes before it
+
+    Record
+    0   4   Time of day in milliseconds
+    4   2n  Probe temperatures, int16 quarter degrees, NO_READING_Q (-32768)
+            for a channel that read with a fault
+
+Record k therefore starts at header_size + k * record_size.
+
+DELTA_LOG writes the same header with magic b"HCLD" and record size 0, followed
+by variable-size records coded with delta.py:
+
+    Keyframe record
+    0   2   0xAA 0x4B
+    2   4   Time of day in milliseconds
+    6   2n  Keyframe payload (int16 samples)
+    ..  2   CRC-16/CCITT of the time and payload
+
+    Delta record
+    0   1   Seconds since the previous record (0..DELTA_MAX_GAP_S)
+    1   ..  Delta payload, relative to the previous record
+
+Every file starts with a keyframe, and one follows every LOG_KEYFRAME_INTERVAL
+records, so a reader can seek to any byte, find the next keyframe by its sync
+bytes and CRC, and decode from there.
+
+The writers keep the current file open and collect records in a RAM buffer.
+The buffer is written to the SD card when it fills (ending on a sector boundary),
+after LOG_FLUSH_RECORDS records or LOG_FLUSH_MS, when the 30-minute block
+changes, and on close(). Under the uasyncio runtime the time and record
+bounds are left to the log task (auto_flush off, poll()), so the write
+happens between scans instead of inside one.
+"""
+import struct
+import time
+from array import array
+
+from frames import crc16
+from delta import DELTA_CODEC, max_payload
+
+# ============ CONFIGURATION ============
+LOG_CSV = "CSV"
+LOG_BIN = "BIN"
+LOG_DELTA = "DLT"
+BLOCK_MINUTES = 30			#A new file is started every BLOCK_MINUTES
+
+LOG_BUFFER_SIZE = 4096		#RAM buffer per log, a whole number of 512-byte SD sectors
+LOG_FLUSH_RECORDS = 20		#Write the buffer out after this many records...
+LOG_FLUSH_MS = 10000		#...or once the oldest buffered record is this old
+LOG_MAX_PARTS = 100			#Files per 30-minute block, the base name and _1.._99
+
+BIN_MAGIC = b'HCLG'
+BIN_VERSION = 1
+BIN_HEADER_FIXED = 20		#Header bytes before the channel map
+BIN_RECORD_TIME = 4			#Record bytes before the samples
+NO_READING_Q = -32768		#Sample logged for a faulted channel, outside the MAX31855's range
+
+DELTA_MAGIC = b'HCLD'
+DELTA_KEY_SYNC = b'\xaa\x4b'
+DELTA_KEY_OVERHEAD = 8		#Sync, time and CRC bytes around a keyframe payload
+DELTA_MAX_GAP_S = 0xA9		#Longest gap a delta record can hold (0xAA starts a keyframe)
+LOG_KEYFRAME_INTERVAL = 60	#Records per keyframe
+
+
+def log_name(dt, ext, part=0):
+    """
+    Get the log file name for the block a timestamp falls in.
+
+    Args:
+        dt: RTC datetime tuple (year, month, day, weekday, hour, minute, second, subsecond)
+        ext: File extension without the dot
+        part: Index of the file within the block, 0 for the first one
+
+    Returns:
+        File name such as "2026-01-27_09-00.csv", or "2026-01-27_09-00_1.csv" for part 1
+    """
+    minute_block = (dt[5] // BLOCK_MINUTES) * BLOCK_MINUTES
+    suffix = "_{}".format(part) if part else ""
+    return "{:04d}-{:02d}-{:02d}_{:02d}-{:02d}{}.{}".format(dt[0], dt[1], dt[2], dt[4], minute_block, suffix, ext)
+
+
+def block_key(dt):
+    """Small integer that changes exactly when the log file name would."""
+    return (((dt[0] * 13 + dt[1]) * 32 + dt[2]) * 24 + dt[4]) * 2 + dt[5] // BLOCK_MINUTES
+
+
+# ============ LOG WRITER BASE CLASS ============
+class LOG_WRITER:
+    """
+    Persistent, block-buffered writer for one 30-minute log file at a time.
+
+    Subclasses set ext and implement write(); they add bytes with append()
+    and can override file_header() for data written at the start of a new file
+    and file_matches() to check that header before a file is reopened.
+    """
+
+    ext = "log"
+
+    def __init__(self, buffer_size=LOG_BUFFER_SIZE, flush_records=LOG_FLUSH_RECORDS, flush_ms=LOG_FLUSH_MS, auto_flush=True):
+        """
+        Initialize the writer.
+
+        Args:
+            buffer_size: RAM buffer size, a multiple of 512 so full-buffer writes are whole sectors
+            flush_records: Write the buffer after this many records (0 = only on time or when full)
+            flush_ms: Write the buffer once the oldest record in it is this old (0 = no time bound)
+            auto_flush: Write a due buffer from end_record(). False if a separate task calls poll()
+        """
+        self.buf = bytearray(buffer_size)
+        self.mv = memoryview(self.buf)
+        self.used = 0					#Bytes waiting in buf
+        self.limit = buffer_size		#Fill level that ends on a sector boundary of the file
+        self.pending = 0				#Records waiting in buf
+        self.first_ms = 0				#ticks_ms when the oldest waiting record was added
+        self.flush_records = flush_records
+        self.flush_ms = flush_ms
+        self.auto_flush = auto_flush
+
+        self.file = None				#Open log file, None between blocks or after an error
+        self.filename = None
+        self.block = -1					#block_key() of the open file
+        self.channels = 0				#bank.count of the open file
+        self.fresh = False				#Start a new file on the next record, see new_file()
+        self.offset = 0					#File size, so full-buffer writes can end on a sector boundary
+
+        # SD card statistics, see stats()
+        self.records = 0				#Records logged
+        self.sd_writes = 0				#Buffer writes to the card
+        self.sd_bytes = 0				#Bytes written to the card
+        self.write_us_total = 0			#Time spent in write + flush calls
+        self.write_us_max = 0			#Longest single write + flush
+        self.open_us_max = 0			#Longest file open (directory lookup)
+        self.files_opened = 0
+        self.errors = 0
+
+    def file_header(self, dt, bank):
+        """Bytes written at the start of a new (empty) file, None for no header."""
+        return None
+
+    def file_matches(self, f, bank):
+        """True if an existing file (open for reading) can take the bank's records."""
+        return True
+
+    def new_file(self):
+        """Close the current file and start a new one on the next record, e.g. after the channels were detected again."""
+        self.close()
+        self.fresh = True
+
+    def pick_file(self, dt, bank, fresh):
+        """
+        Get the name of the file the block's records go to.
+
+        That is the block's last file if it matches the bank and fresh is False,
+        else the first free name of the block.
+        """
+        part = 0
+        while True:
+            name = log_name(dt, self.ext, part)
+            try:
+                f = open(name, "rb")
+            except OSError:
+                break		#Free name
+            f.close()
+            part += 1
+            if part == LOG_MAX_PARTS:
+                raise OSError("No free log file name for " + log_name(dt, self.ext))
+        if part and not fresh:
+            last = log_name(dt, self.ext, part - 1)
+            f = open(last, "rb")
+            try:
+                if self.file_matches(f, bank):
+                    return last
+            finally:
+                f.close()
+        return name
+
+    def start_record(self, dt, bank):
+        """
+        Make sure the file for dt's block and the bank's channels is open before a record is added.
+
+        Rotation flushes and closes the previous file first, so a record
+        never straddles two files.
+        """
+        key = block_key(dt)
+        if self.file is not None and key == self.block:
+            if bank.count == self.channels:
+                return True
+            self.fresh = True	#The channels changed within the block
+        fresh = self.fresh
+        self.close()
+        self.block = key
+        self.channels = bank.count
+        start = time.ticks_us()
+        try:
+            self.filename = self.pick_file(dt, bank, fresh)
+            self.file = open(self.filename, "ab")
+            self.offset = self.file.seek(0, 2)
+            self.limit = len(self.buf) - (self.offset & 511)
+            # A file left by an earlier run already has its header
+            if self.offset == 0:
+                header = self.file_header(dt, bank)
+                if header:
+                    self.append(header, record=False)
+        except OSError as e:
+            self._error(e)
+            return False
+        self.fresh = False
+        self.files_opened += 1
+        self.open_us_max = max(self.open_us_max, time.ticks_diff(time.ticks_us(), start))
+        return True
+
+    def append(self, data, record=True):
+        """
+        Copy bytes into the buffer, writing it out each time it fills.
+
+        Args:
+            data: Bytes-like object
+            record: True if data is a complete record (counts towards flush_records)
+        """
+        n = len(data)
+        data = memoryview(data)	#Slices of a memoryview don't copy
+        if record:
+            self.records += 1
+            if self.pending == 0:
+                self.first_ms = time.ticks_ms()
+            self.pending += 1
+        src = 0
+        while src < n:
+            room = self.limit - self.used
+            take = n - src if n - src < room else room
+            self.mv[self.used:self.used + take] = data[src:src + take]
+            self.used += take
+            src += take
+            if self.used == self.limit:
+                self.flush()
+
+    def due(self):
+        """True if the buffered records should be written out now."""
+        if self.pending == 0:
+            return False
+        if self.flush_records and self.pending >= self.flush_records:
+            return True
+        return self.flush_ms and time.ticks_diff(time.ticks_ms(), self.first_ms) >= self.flush_ms
+
+    def flush(self):
+        """Write the buffer to the card and commit it (FAT sync)."""
+        if self.used == 0:
+            return
+        if self.file is None:
+            # Nowhere to write it, e.g. the card failed when the file was opened
+            self.used = 0
+            self.pending = 0
+            return
+        start = time.ticks_us()
+        try:
+            self.file.write(self.mv[:self.used])
+            self.file.flush()
+        except OSError as e:
+            self._error(e)
+            return
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+        self.sd_writes += 1
+        self.sd_bytes += self.used
+        self.write_us_total += elapsed
+        if elapsed > self.write_us_max:
+            self.write_us_max = elapsed
+        
+        # After a partial flush the next full buffer is cut short to get back onto a sector boundary
+        self.offset += self.used
+        self.limit = len(self.buf) - (self.offset & 511)
+        self.used = 0
+        self.pending = 0
+
+    def end_record(self):
+        """Call after each record; writes the buffer out if a flush bound is reached."""
+        if self.auto_flush and self.due():
+            self.flush()
+
+    def poll(self):
+        """
+        Write the buffer out if a flush bound is reached, for writers with auto_flush off.
+        
+        Returns:
+            True if the buffer was written
+        """
+        if not self.due():
+            return False
+        self.flush()
+        return True
+
+    def close(self):
+        """Flush and close the current file. Safe to call at any time, e.g. before a reset."""
+        self.flush()
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError as e:
+                print("Error Occured: ", e)
+            self.file = None
+        self.block = -1
+
+    def stats(self):
+        """One-line summary of the SD write statistics."""
+        avg = self.write_us_total // self.sd_writes if self.sd_writes else 0
+        return "records={},sd_writes={},sd_bytes={},write_avg_us={},write_max_us={},open_max_us={},files={},errors={}".format(
+            self.records, self.sd_writes, self.sd_bytes, avg, self.write_us_max,
+            self.open_us_max, self.files_opened, self.errors)
+
+    def _error(self, e):
+        print("Error Occured: ", e)
+        self.errors += 1
+        # Drop the file; the next record reopens it
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+        self.file = None
+        self.block = -1
+        self.used = 0
+        self.pending = 0
+
+
+# ============ CSV LOG CLASS ============
+class CSV_LOG(LOG_WRITER):
+    """Text log, one line per scan."""
+
+    ext = "csv"
+
+    def write(self, dt, bank, data_str=None):
+        """
+        Add one scan.
+
+        Args:
+            dt: RTC datetime tuple of the scan
+            bank: TC_BANK holding the converted scan
+            data_str: Comma-separated probe temperatures if already formatted
+        """
+        if not self.start_record(dt, bank):
+            return
+        if data_str is None:
+            data_str = bank.probe_text()
+        self.append("{:02d}:{:02d}:{:02d},{}\n".format(dt[4], dt[5], dt[6], data_str).encode())
+        self.end_record()
+
+
+# ============ BINARY LOG CLASS ============
+class BIN_LOG(LOG_WRITER):
+    """Fixed-record binary log, about a quarter of the size of the CSV log."""
+
+    ext = "bin"
+    magic = BIN_MAGIC
+
+    def __init__(self, capacity, **kwargs):
+        """
+        Initialize the binary log writer.
+
+        Args:
+            capacity: Maximum number of channels in one record
+            kwargs: Buffer and flush settings, see LOG_WRITER
+        """
+        super().__init__(**kwargs)
+        self.record = bytearray(BIN_RECORD_TIME + 2 * capacity)	#Reused for every record
+        self.record_mv = memoryview(self.record)
+
+    def file_header(self, dt, bank):
+        """Build the file header for the bank's channel map."""
+        n = bank.count
+        size = BIN_HEADER_FIXED + 2 * n + 2
+        head = bytearray(size)
+        struct.pack_into("<4sBBHHHBBBBBBH", head, 0, self.magic, BIN_VERSION, 0, size,
+                         self.record_size(n), dt[0], dt[1], dt[2], dt[4], dt[5], dt[6], 0, n)
+        for i in range(n):
+            struct.pack_into("<H", head, BIN_HEADER_FIXED + 2 * i, bank.slot[i] + 1)
+        crc = crc16(head, 0, size - 2)
+        struct.pack_into("<H", head, size - 2, crc)
+        return head
+
+    def file_matches(self, f, bank):
+        """True if the file is empty or its header has this log's magic and the bank's channel map."""
+        head = f.read(BIN_HEADER_FIXED)
+        if not head:
+            return True		#The header is written when the file is opened
+        if len(head) < BIN_HEADER_FIXED or head[:4] != self.magic or head[4] != BIN_VERSION:
+            return False
+        n = struct.unpack_from("<H", head, BIN_HEADER_FIXED - 2)[0]
+        if n != bank.count:
+            return False
+        cmap = f.read(2 * n)
+        if len(cmap) != 2 * n:
+            return False
+        slot = bank.slot
+        for i in range(n):
+            if cmap[2 * i] | (cmap[2 * i + 1] << 8) != slot[i] + 1:
+                return False
+        return True
+
+    def record_size(self, n):
+        """Record size stored in the header for n channels."""
+        return BIN_RECORD_TIME + 2 * n
+
+    def pack(self, dt, bank):
+        """Pack one scan into the record buffer and return a view of it."""
+        n = bank.count
+        rec = self.record
+        struct.pack_into("<I", rec, 0, ((dt[4] * 60 + dt[5]) * 60 + dt[6]) * 1000)
+        tc_q = bank.tc_q
+        faults = bank.faults
+        j = BIN_RECORD_TIME
+        for i in range(n):
+            q = tc_q[i] if not faults[i] else NO_READING_Q
+            rec[j] = q & 0xFF
+            rec[j + 1] = (q >> 8) & 0xFF
+            j += 2
+        return self.record_mv[:j]
+
+    def write(self, dt, bank, data_str=None):
+        """
+        Add one scan.
+
+        Args:
+            dt: RTC datetime tuple of the scan
+            bank: TC_BANK holding the converted scan
+            data_str: Unused, accepted so both log writers are called the same way
+        """
+        if not self.start_record(dt, bank):
+            return
+        self.append(self.pack(dt, bank))
+        self.end_record()
+
+
+
+# ============ DELTA LOG CLASS ============
+class DELTA_LOG(BIN_LOG):
+    """Delta-coded binary log, typically 5-7x smaller than BIN_LOG on long runs."""
+
+    ext = "dlt"
+    magic = DELTA_MAGIC
+
+    def __init__(self, capacity, keyframe_interval=LOG_KEYFRAME_INTERVAL, **kwargs):
+        """
+        Initialize the delta log writer.
+
+        Args:
+            capacity: Maximum number of channels in one record
+            keyframe_interval: Records per keyframe
+            kwargs: Buffer and flush settings, see LOG_WRITER
+        """
+        LOG_WRITER.__init__(self, **kwargs)
+        self.codec = DELTA_CODEC(capacity, keyframe_interval)
+        self.samples = array('h', [0] * capacity)	#Scan with NO_READING_Q for faulted channels, as coded
+        self.record = bytearray(DELTA_KEY_OVERHEAD + max_payload(capacity))
+        self.record_mv = memoryview(self.record)
+        self.last_s = 0		#Time of day in seconds of the previous record
+
+    def record_size(self, n):
+        """Records are variable-size, so the header stores 0."""
+        return 0
+
+    def start_record(self, dt, bank):
+        # A new or reopened file must not start with a delta against records it does not hold
+        if self.file is None or block_key(dt) != self.block or bank.count != self.channels:
+            self.codec.force_key()
+        return BIN_LOG.start_record(self, dt, bank)
+
+    def pack(self, dt, bank):
+        """Code one scan as a keyframe or delta record and return a view of it."""
+        now_s = (dt[4] * 60 + dt[5]) * 60 + dt[6]
+        gap = now_s - self.last_s
+        self.last_s = now_s
+        if not 0 <= gap <= DELTA_MAX_GAP_S:
+            self.codec.force_key()
+
+        n = bank.count
+        samples = self.samples
+        tc_q = bank.tc_q
+        faults = bank.faults
+        for i in range(n):
+            samples[i] = tc_q[i] if not faults[i] else NO_READING_Q
+
+        rec = self.record
+        end, key = self.codec.encode(samples, n, rec, 6)
+        if key:
+            # The payload was coded at offset 6, behind room for the sync bytes and time
+            rec[0] = DELTA_KEY_SYNC[0]
+            rec[1] = DELTA_KEY_SYNC[1]
+            struct.pack_into("<I", rec, 2, now_s * 1000)
+            crc = crc16(rec, 2, end)
+            rec[end] = crc & 0xFF
+            rec[end + 1] = crc >> 8
+            return self.record_mv[:end + 2]
+        # A delta record is the gap byte right in front of the payload
+        rec[5] = gap
+        return self.record_mv[5:end]
+
+
+if __name__ == "__main__":
+    print("Logger Module File")
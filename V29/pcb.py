@@ -0,0 +1,123 @@
+"""
+PCB Module
+Board enable addressing: which PCB's MISO buffer drives the shared SPI bus.
+
+Every PCB carries 16 MAX31855s behind a buffer with an active-low enable, and
+exactly one PCB is enabled while a channel is read. Two drivers offer the
+same interface (count, active, select(), release()):
+
+    PCB_PINS      one MCU pin per PCB (PG0, PG1 on the current two-board stack)
+    PCB_EXPANDER  MCP23S17 outputs, 16 PCBs per expander: PCB p is port A bit p
+                  for p < 8, port B bit p - 8 above. Several expanders share one
+                  !CS through their hardware addresses (up to 8, 128 PCBs)
+
+Both only drive the lines when the selected PCB changes, so a scan in chain
+order touches them once per board instead of once per channel. PCB_EXPANDER
+writes the latches through the MCP23S17 register cache, so only the latch
+bytes that change go out: one 3-byte write within a port, one 4-byte
+sequential write across the ports, and one more to release the previous
+expander when the board moves to another one.
+
+PCBs past count have no enable driven by this module (strapped enabled);
+selecting one disables every driven board.
+"""
+import hardware
+from IO_expander import MCP23S17
+
+# ============ CONFIGURATION ============
+PCBS_PER_EXPANDER = 16		#One enable per MCP23S17 output
+EXPANDERS_MAX = 8			#Hardware addresses A2-A0
+
+
+# ============ PCB PINS CLASS ============
+class PCB_PINS:
+    """PCB enables wired straight to MCU pins."""
+
+    def __init__(self, pin_names):
+        """
+        Initialize the enables with every PCB disabled.
+
+        Args:
+            pin_names: Enable pin of each PCB, in chain order
+        """
+        self.pins = [hardware.pin(name) for name in pin_names]
+        self.count = len(self.pins)
+        self.active = -1		#PCB whose enable is low, -1 when none is
+        self.release()
+
+    def select(self, pcb):
+        """
+        Enable one PCB and disable the one enabled before.
+
+        Args:
+            pcb: PCB index (0-based), one past count or more disables every driven PCB
+        """
+        if pcb == self.active:
+            return
+        if not 0 <= pcb < self.count:
+            pcb = -1
+        if self.active >= 0:
+            self.pins[self.active].high()
+        if pcb >= 0:
+            self.pins[pcb].low()
+        self.active = pcb
+
+    def release(self):
+        """Disable every PCB, writing every pin (also resynchronises the pins)."""
+        for i in range(self.count):
+            self.pins[i].high()
+        self.active = -1
+
+
+# ============ PCB EXPANDER CLASS ============
+class PCB_EXPANDER:
+    """PCB enables on the outputs of MCP23S17 expanders sharing one !CS."""
+
+    def __init__(self, cs_pin_name, spi_bus, expanders=1):
+        """
+        Initialize the expanders with every PCB disabled.
+
+        Args:
+            cs_pin_name: !CS pin shared by the expanders
+            spi_bus: SPI bus the expanders are on
+            expanders: Number of expanders, at hardware addresses 0 .. expanders - 1
+
+        Raises:
+            ValueError: if expanders is not 1 .. EXPANDERS_MAX
+        """
+        if not 1 <= expanders <= EXPANDERS_MAX:
+            raise ValueError(expanders)
+        self.expanders = [MCP23S17(cs_pin_name, spi_bus, address) for address in range(expanders)]
+        self.count = expanders * PCBS_PER_EXPANDER
+        self.active = -1		#PCB whose enable is low, -1 when none is
+
+    def select(self, pcb):
+        """
+        Enable one PCB and disable the one enabled before.
+
+        Args:
+            pcb: PCB index (0-based), one past count or more disables every driven PCB
+        """
+        if pcb == self.active:
+            return
+        old = self.active
+        if not 0 <= pcb < self.count:
+            pcb = -1
+        # The old board's expander goes back to all high unless the new board is on it too
+        if old >= 0 and (pcb < 0 or old // PCBS_PER_EXPANDER != pcb // PCBS_PER_EXPANDER):
+            self.expanders[old // PCBS_PER_EXPANDER].write16(MCP23S17.OLATA, 0xFFFF)
+        if pcb >= 0:
+            mask = 0xFFFF ^ (1 << (pcb % PCBS_PER_EXPANDER))
+            self.expanders[pcb // PCBS_PER_EXPANDER].write16(MCP23S17.OLATA, mask)
+        self.active = pcb
+
+    def release(self):
+        """Disable every PCB, writing every latch (also resynchronises the shadows)."""
+        for expander in self.expanders:
+            expander.invalidate()
+            expander.write16(MCP23S17.OLATA, 0xFFFF)
+        self.active = -1
+
+
+if __name__ == "__main__":
+    print("PCB Module File")
@@ -0,0 +1,101 @@
+"""
+Profiler Module
+Boot and scan timing.
+
+BOOT_PROFILER records how long each import and init phase of the boot takes.
+state_machine.py imports this module first and calls mark() after each
+phase. The summary is printed at the end of InitState and sent over UART
+on the BOOT_PROFILE command.
+
+SCAN_JITTER records how late each measurement scan starts against its
+deadline, for both the busy loop and the uasyncio runtime (RT_STATS).
+"""
+import time
+
+# ============ CONFIGURATION ============
+JITTER_LIMIT_US = 5000	#Scans starting later than this after their deadline count as late
+
+
+# ============ BOOT PROFILER CLASS ============
+class BOOT_PROFILER:
+    """Phase timer based on time.ticks_us()."""
+
+    def __init__(self):
+        self.start = time.ticks_us()	#ticks_us when the profiler was imported (time since reset)
+        self.last = self.start
+        self.phases = []				#(name, microseconds) in boot order
+
+    def mark(self, name):
+        """
+        End a phase.
+
+        Args:
+            name: Phase name, e.g. "import init" or "hardware"
+        """
+        now = time.ticks_us()
+        self.phases.append((name, time.ticks_diff(now, self.last)))
+        self.last = now
+
+    def total_us(self):
+        """Get the time from reset to the last mark."""
+        return self.start + time.ticks_diff(self.last, self.start)
+
+    def summary(self):
+        """Get the phases as "before=..,<name>=..,..,total=.." in microseconds."""
+        parts = [f"before={self.start}"]
+        for name, us in self.phases:
+            parts.append(f"{name}={us}")
+        parts.append(f"total={self.total_us()}")
+        return ",".join(parts)
+
+    def report(self, helper=None):
+        """Print the phase table and send BOOT_PROFILE:<summary> if a UART helper is given."""
+        print("Boot profile (us):")
+        print(f"  before state_machine {self.start}")
+        for name, us in self.phases:
+            print(f"  {name} {us}")
+        print(f"  total {self.total_us()}")
+        if helper is not None:
+            helper.write_uart(f"BOOT_PROFILE:{self.summary()}")
+
+
+# ============ SCAN JITTER CLASS ============
+class SCAN_JITTER:
+    """Lateness of each scan against its deadline, in microseconds."""
+
+    def __init__(self, limit_us=JITTER_LIMIT_US):
+        self.limit_us = limit_us
+        self.reset()
+
+    def reset(self):
+        self.scans = 0
+        self.total_us = 0
+        self.max_us = 0
+        self.late = 0		#Scans later than limit_us
+        self.missed = 0		#Scan periods skipped because a scan ran past the next deadline
+
+    def record(self, lag_us):
+        """
+        Record one scan.
+
+        Args:
+            lag_us: Microseconds between the scan's deadline and its start
+        """
+        self.scans += 1
+        self.total_us += lag_us
+        if lag_us > self.max_us:
+            self.max_us = lag_us
+        if lag_us > self.limit_us:
+            self.late += 1
+
+    def stats(self):
+        """One-line summary of the jitter statistics."""
+        avg = self.total_us // self.scans if self.scans else 0
+        return f"scans={self.scans},jitter_avg_us={avg},jitter_max_us={self.max_us},late={self.late},missed={self.missed}"
+
+
+boot_profile = BOOT_PROFILER()
+
+
+if __name__ == "__main__":
+    print("Profiler Module File")
@@ -0,0 +1,115 @@
+"""
+Report Module
+Report-by-exception for the measurement stream (REPORT:CHANGES).
+
+Instead of every channel on every scan, only the channels whose value moved
+more than a deadband since they were last reported are sent, with a fault
+that appears or clears always counting as a change. Every channel goes out in
+a keyframe every keyframe period, on KEYFRAME from the host, and after the
+transmit queue dropped a report, so a viewer that joins late or misses data
+is back in sync by the next keyframe.
+
+The channels picked on a scan are listed the way RATE_SCHEDULER lists its
+samples (picked, n_picked, t_ms), so the same SAMPLE_FRAME encoder packs them.
+"""
+import time
+from array import array
+
+# ============ CONFIGURATION ============
+# Measurement report modes
+REPORT_ALL = "ALL"			#Every channel on every scan (default)
+REPORT_CHANGES = "CHANGES"	#Only channels that moved more than the deadband, plus keyframes
+
+DEADBAND_Q = 1				#Default deadband in quarter degrees, a change must be larger to be sent
+DEADBAND_MAX_Q = 400		#100 °C
+KEYFRAME_MS = 30000			#Default keyframe period
+KEYFRAME_MAX_MS = 3600000
+
+
+# ============ CHANGE REPORTER CLASS ============
+class CHANGE_REPORTER:
+    """Picks the channels of a scan to report, remembering the last value sent for each."""
+
+    def __init__(self, capacity, deadband_q=DEADBAND_Q, keyframe_ms=KEYFRAME_MS):
+        """
+        Initialize the reporter.
+
+        Args:
+            capacity: Maximum number of channels
+            deadband_q: A channel is reported when it moves more than this many quarter degrees
+            keyframe_ms: Time between keyframes
+        """
+        self.capacity = capacity
+        self.deadband_q = deadband_q
+        self.keyframe_ms = keyframe_ms
+
+        self.sent_q = array('h', [0] * capacity)	#Last reported value of each channel
+        self.sent_fault = bytearray(capacity)		#Last reported fault bits of each channel
+        self.picked = array('H', [0] * capacity)	#Indices of the channels to report, in channel order
+        self.n_picked = 0
+        self.t_ms = array('l', [0] * capacity)		#ticks_ms of each reported value
+        self.count = 0			#Channels in the last keyframe, a new count needs a keyframe
+        self.key_pending = True
+        self.last_key = 0		#ticks_ms of the last keyframe
+
+        self.reports = 0		#Channel values reported
+        self.suppressed = 0		#Channel values not reported, inside the deadband
+        self.keyframes = 0
+
+    def force_key(self):
+        """Report every channel on the next scan."""
+        self.key_pending = True
+
+    def select(self, bank, now):
+        """
+        Pick the channels of a converted scan to report and remember their values.
+
+        Args:
+            bank: TC_BANK, or FILTER_STREAM, holding the scan in tc_q and faults
+            now: ticks_ms of the scan
+
+        Returns:
+            (n, key): number of channels picked (indices in picked[:n]) and True for a keyframe
+        """
+        n = bank.count
+        if n != self.count or time.ticks_diff(now, self.last_key) >= self.keyframe_ms:
+            self.key_pending = True
+        key = self.key_pending
+        if key:
+            self.key_pending = False
+            self.last_key = now
+            self.count = n
+            self.keyframes += 1
+
+        tc_q = bank.tc_q
+        faults = bank.faults
+        sent_q = self.sent_q
+        sent_fault = self.sent_fault
+        picked = self.picked
+        t_ms = self.t_ms
+        deadband = self.deadband_q
+        m = 0
+        for i in range(n):
+            q = tc_q[i]
+            if not key and faults[i] == sent_fault[i]:
+                d = q - sent_q[i]
+                if -deadband <= d <= deadband:
+                    continue
+            sent_q[i] = q
+            sent_fault[i] = faults[i]
+            t_ms[i] = now
+            picked[m] = i
+            m += 1
+        self.n_picked = m
+        self.reports += m
+        self.suppressed += n - m
+        return m, key
+
+    def stats(self):
+        """Summary as deadband=..,keyframe_s=..,reports=..,suppressed=..,keyframes=.."""
+        return (f"deadband={self.deadband_q / 4},keyframe_s={self.keyframe_ms // 1000},"
+                f"reports={self.reports},suppressed={self.suppressed},keyframes={self.keyframes}")
+
+
+if __name__ == "__main__":
+    print("Report Module File")
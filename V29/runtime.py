@@ -0,0 +1,242 @@
+"""
+Runtime Module
+Cooperative uasyncio runtime, an alternative to the System.run() busy loop
+(selected with USE_ASYNCIO in state_machine.py).
+
+Each job of the busy loop runs as its own task:
+
+    Task         Priority  Period       Deadline  Budget  Step
+    acquisition  0         scan period  -         -       state.scan() at each scan deadline
+    commands     1         5 ms         50 ms     4 ms    System.process_uart()
+    transmit     2         2 ms         50 ms     12 ms   one TX_QUEUE slice and one FILE_SENDER chunk
+    state        3         10 ms        50 ms     4 ms    state.handle() of non-scanning states
+    log          4         100 ms       1000 ms   40 ms   LOG_WRITER.poll(), the SD write
+
+A step is due one period after the previous one ended and late if it starts
+after its deadline. A step that returns True has more work waiting, and the
+task only yields before the next one (the transmit task while output is
+queued), so a busy task is not slowed down by its period.
+
+uasyncio does not pre-empt, so the acquisition deadline is protected by
+admission instead: in a scanning state, a task only starts a step if its
+budget fits before the next scan deadline. Otherwise it sleeps until
+<priority> ms after the deadline, so held-off tasks resume in priority order
+once the scan is done. A scan can then only be delayed by the scheduler's
+wake-up latency or by a step that ran past its budget (counted as an overrun).
+
+The acquisition task sleeps to absolute deadlines (the previous deadline
+plus the period), so the scan period does not drift with the scan time.
+Scan jitter and per-task statistics are sent on RT_STATS.
+"""
+import time
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+# ============ CONFIGURATION ============
+RX_POLL_MS = 5			#Command task period
+TX_POLL_MS = 2			#Transmit task period
+STATE_POLL_MS = 10		#State task period, sets the calibration streaming latency
+LOG_POLL_MS = 100		#Log task period
+
+RX_DEADLINE_MS = 50		#Longest acceptable delay of a due step: a transmit slice (~11 ms) plus a scan
+TX_DEADLINE_MS = 50	#Held off for up to a budget plus a 256-channel scan (~27 ms)
+STATE_DEADLINE_MS = 50
+LOG_DEADLINE_MS = 1000
+
+RX_BUDGET_US = 4000		#Longest expected step of each task, used for admission before a scan
+TX_BUDGET_US = 12000	#One 128-byte slice takes ~11 ms at 115200 baud
+STATE_BUDGET_US = 4000
+LOG_BUDGET_US = 40000	#One SD buffer write
+
+
+# ============ RUNTIME TASK CLASS ============
+class RT_TASK:
+    """Scheduling parameters and statistics of one runtime task."""
+
+    def __init__(self, name, priority, period_ms, deadline_ms, budget_us, step):
+        """
+        Initialize the task.
+
+        Args:
+            name: Name used in RT_STATS
+            priority: 1 (highest) and up, order in which held-off tasks resume after a scan
+            period_ms: Sleep between steps
+            deadline_ms: A step starting this long after it was due is counted as late
+            budget_us: Longest expected step, a step is only started if this fits before the next scan
+            step: Callable doing one bounded piece of work, returning True if more is waiting
+        """
+        self.name = name
+        self.priority = priority
+        self.period_ms = period_ms
+        self.deadline_us = deadline_ms * 1000
+        self.budget_us = budget_us
+        self.step = step
+
+        # Statistics, see stats()
+        self.runs = 0
+        self.max_us = 0			#Longest step
+        self.max_lag_us = 0		#Longest delay between a step being due and starting
+        self.late = 0			#Steps that started after their deadline
+        self.overruns = 0		#Steps longer than budget_us
+        self.held = 0			#Times the task was held off for a scan
+
+    def record(self, lag_us, run_us):
+        self.runs += 1
+        if lag_us > self.max_lag_us:
+            self.max_lag_us = lag_us
+        if lag_us > self.deadline_us:
+            self.late += 1
+        if run_us > self.max_us:
+            self.max_us = run_us
+        if run_us > self.budget_us:
+            self.overruns += 1
+
+    def stats(self):
+        """Summary as <name>=runs/max_us/max_lag_us/late/overruns/held."""
+        return f"{self.name}={self.runs}/{self.max_us}/{self.max_lag_us}/{self.late}/{self.overruns}/{self.held}"
+
+
+# ============ RUNTIME CLASS ============
+class RUNTIME:
+    """Runs a System's states, UART and log as uasyncio tasks."""
+
+    def __init__(self, system, scan_period_ms):
+        """
+        Initialize the runtime and switch the system to cooperative mode.
+
+        Args:
+            system: state_machine.System, already through InitState
+            scan_period_ms: Measurement scan period
+        """
+        self.system = system
+        self.period_us = scan_period_ms * 1000
+        self.next_scan = time.ticks_add(time.ticks_us(), self.period_us)	#ticks_us deadline of the next scan
+        self.running = False
+        self.stop_flag = asyncio.Event()
+
+        system.cooperative = True
+        system.logger.auto_flush = False
+        system.runtime = self
+
+        self.tasks = [
+            RT_TASK("commands", 1, RX_POLL_MS, RX_DEADLINE_MS, RX_BUDGET_US, system.process_uart),
+            RT_TASK("transmit", 2, TX_POLL_MS, TX_DEADLINE_MS, TX_BUDGET_US, self._transmit),
+            RT_TASK("state", 3, STATE_POLL_MS, STATE_DEADLINE_MS, STATE_BUDGET_US, self._state),
+            RT_TASK("log", 4, LOG_POLL_MS, LOG_DEADLINE_MS, LOG_BUDGET_US, self._log),
+        ]
+
+    def _transmit(self):
+        system = self.system
+        if system.file_sender.active:
+            system.file_sender.step(system.helper)
+        system.helper.drain()
+        return system.helper.tx.depth > 0 or system.file_sender.active
+
+    def _state(self):
+        # Scanning states are driven by the acquisition task alone
+        state = self.system.state
+        if not state.scans:
+            state.handle(self.system)
+
+    def _log(self):
+        self.system.logger.poll()
+
+    def hold_ms(self, task):
+        """
+        Get how long a task must wait so its next step cannot delay a scan.
+
+        Returns:
+            0 if the step may start now, else ms to sleep (until <priority> ms after the scan deadline)
+        """
+        if not self.system.state.scans:
+            return 0
+        left_us = time.ticks_diff(self.next_scan, time.ticks_us())
+        if left_us > task.budget_us:
+            return 0
+        if left_us < 0:
+            left_us = 0	#Scan overdue, the acquisition task runs as soon as this task yields
+        return left_us // 1000 + task.priority
+
+    async def _acquire(self):
+        system = self.system
+        jitter = system.scan_jitter
+        period = self.period_us
+        while self.running:
+            wait_us = time.ticks_diff(self.next_scan, time.ticks_us())
+            if wait_us >= 1000:
+                await asyncio.sleep_ms(wait_us // 1000)
+                continue
+            if wait_us > 0:
+                time.sleep_us(wait_us)	#The last part of a millisecond, below uasyncio's resolution
+            lag = time.ticks_diff(time.ticks_us(), self.next_scan)
+            if system.state.scan(system):
+                jitter.record(lag)
+            # The next deadline follows the schedule, not the time this scan ended
+            self.next_scan = time.ticks_add(self.next_scan, period)
+            behind = time.ticks_diff(time.ticks_us(), self.next_scan)
+            if behind >= 0:
+                # The scan ran past whole periods, skip them instead of scanning back to back
+                skipped = behind // period + 1
+                jitter.missed += skipped
+                self.next_scan = time.ticks_add(self.next_scan, skipped * period)
+
+    async def _run_task(self, task):
+        due = time.ticks_us()
+        while self.running:
+            hold = self.hold_ms(task)
+            if hold:
+                task.held += 1
+                await asyncio.sleep_ms(hold)
+                continue
+            start = time.ticks_us()
+            more = task.step()
+            task.record(time.ticks_diff(start, due), time.ticks_diff(time.ticks_us(), start))
+            if more:
+                # Let the other tasks run, then carry on
+                due = time.ticks_us()
+                await asyncio.sleep_ms(0)
+            else:
+                due = time.ticks_add(time.ticks_us(), task.period_ms * 1000)
+                await asyncio.sleep_ms(task.period_ms)
+
+    async def main(self, duration_ms=None):
+        """
+        Run every task until stop(), or for duration_ms (used on the host simulator).
+        """
+        self.running = True
+        self.stop_flag.clear()
+        asyncio.create_task(self._acquire())
+        for task in self.tasks:
+            asyncio.create_task(self._run_task(task))
+        if duration_ms is None:
+            await self.stop_flag.wait()
+        else:
+            await asyncio.sleep_ms(duration_ms)
+        self.running = False
+
+    def stop(self):
+        """Make main() return. The tasks end at their next wake-up."""
+        self.running = False
+        self.stop_flag.set()
+
+    def set_period(self, scan_period_ms):
+        """Change the scan period, the next scan is one new period from now."""
+        self.period_us = scan_period_ms * 1000
+        self.next_scan = time.ticks_add(time.ticks_us(), self.period_us)
+
+    def stats(self):
+        """One-line summary of the scan jitter, the conversion waits and the task statistics."""
+        return ",".join([self.system.scan_jitter.stats(), self.system.tc_manager.scheduler.stats()]
+                        + [task.stats() for task in self.tasks])
+
+
+def run(system, scan_period_ms):
+    """Run the system under uasyncio. Does not return."""
+    asyncio.run(RUNTIME(system, scan_period_ms).main())
+
+
+if __name__ == "__main__":
+    print("Runtime Module File")
@@ -0,0 +1,309 @@
+"""
+Scheduler Module
+Tracks MAX31855 conversion deadlines so thermocouple reads only wait when needed,
+and picks which channels to read in adaptive sampling (RATE_SCHEDULER).
+"""
+import time
+from array import array
+
+# ============ CONFIGURATION ============
+CONVERSION_MS = 100  # MAX31855 continuous-conversion period (worst case)
+
+# Measurement sampling modes
+SAMPLING_FIXED = "FIXED"		#Every channel once per scan period
+SAMPLING_ADAPTIVE = "ADAPTIVE"	#Each channel at a rate set by its dT/dt (RATE_SCHEDULER)
+
+SAMPLE_TICK_MS = CONVERSION_MS	#Adaptive sampling tick, the fastest a channel is read (10 Hz)
+SAMPLE_FLOOR_MS = 5000			#Default slowest interval of a quiet channel
+SAMPLE_FLOOR_MAX_MS = 60000
+SAMPLE_STEP_Q = 2				#Change expected per sample in quarter degrees, sets the interval from dT/dt
+RATE_SCALE = 16					#Fraction of the rate estimate, rates are quarter degrees per second * RATE_SCALE
+
+
+# ============ ACQUISITION SCHEDULER CLASS ============
+class ACQ_SCHEDULER:
+    """
+    Tracks when each thermocouple chip last started a conversion.
+
+    A MAX31855 starts converting when its !CS line is released and needs up to
+    CONVERSION_MS to finish. Reading it earlier just returns the previous result,
+    so instead of a fixed sleep before every read the scheduler only sleeps for
+    the part of that window which has not passed yet.
+
+    Read times are kept in ticks_us: with whole milliseconds a read could land
+    up to 1 ms inside the window, which adaptive sampling at 10 Hz would hit.
+    """
+
+    def __init__(self, capacity, conversion_ms=CONVERSION_MS):
+        """
+        Initialize the scheduler.
+
+        Args:
+            capacity: Maximum number of channels that will be tracked
+            conversion_ms: Time a chip needs after !CS goes high before new data is ready
+        """
+        self.conversion_ms = conversion_ms
+        self.conversion_us = conversion_ms * 1000
+        self.last_read = array('l', [0] * capacity)	#ticks_us when each chip's !CS was last released
+        self.has_read = bytearray(capacity)			#1 once a chip has been read since boot
+
+        self.wait_count = 0	#Number of reads that had to wait for a conversion
+        self.wait_ms = 0	#Total time spent waiting for conversions
+
+    def ready_in_us(self, index):
+        """
+        Get how long until a chip has a new conversion.
+
+        Args:
+            index: Channel index (0-based)
+
+        Returns:
+            Microseconds until fresh data is available, 0 if it already is
+        """
+        # Chips convert continuously from power-up, so an unread chip is always ready
+        if not self.has_read[index]:
+            return 0
+
+        elapsed = time.ticks_diff(time.ticks_us(), self.last_read[index])
+        if elapsed < 0 or elapsed >= self.conversion_us:
+            return 0
+        return self.conversion_us - elapsed
+
+    def ready_in(self, index):
+        """Get the milliseconds until a chip has a new conversion (rounded up), 0 if it already has."""
+        return (self.ready_in_us(index) + 999) // 1000
+
+    def wait_ready(self, index):
+        """Sleep only as long as the chip still needs to finish its conversion."""
+        remaining = self.ready_in_us(index)
+        if remaining:
+            self.wait_count += 1
+            self.wait_ms += (remaining + 999) // 1000
+            if remaining >= 1000:
+                time.sleep_ms(remaining // 1000)
+            time.sleep_us(remaining % 1000)
+
+    def mark_read(self, index):
+        """Record that a chip was just read and its !CS released (new conversion started)."""
+        self.last_read[index] = time.ticks_us()
+        self.has_read[index] = 1
+
+    def forget(self):
+        """Forget all read times, e.g. after the channel list is rebuilt."""
+        for i in range(len(self.has_read)):
+            self.has_read[i] = 0
+
+    def stats(self):
+        """Summary as conv_waits=..,conv_wait_ms=.."""
+        return f"conv_waits={self.wait_count},conv_wait_ms={self.wait_ms}"
+
+
+# ============ RATE SCHEDULER CLASS ============
+class RATE_SCHEDULER:
+    """
+    Chooses the channels read on each adaptive sampling tick.
+
+    Each channel's rate of change is estimated from its last two samples
+    (smoothed), and its interval is the time it takes to move SAMPLE_STEP_Q
+    quarter degrees at that rate, between one tick (10 Hz) and the floor.
+    A quiet channel flickering by one step doubles its interval on every
+    sample until it reaches the floor.
+
+    Reads are limited to the budget of the fixed scan (count reads per scan
+    period). The faster channels are picked first, taking turns when they do
+    not all fit, then the quiet ones with the budget left. Due channels that do
+    not fit wait for the next tick and are counted in deferred. A channel
+    kept waiting a whole floor past its due time goes ahead of all others, so
+    none starves. All state is in arrays sized at creation, a tick allocates
+    nothing.
+    """
+
+    def __init__(self, capacity, tick_ms=SAMPLE_TICK_MS, floor_ms=SAMPLE_FLOOR_MS):
+        """
+        Initialize the scheduler.
+
+        Args:
+            capacity: Maximum number of channels
+            tick_ms: Sampling tick, the shortest interval
+            floor_ms: Longest interval, the rate of a channel that does not change
+        """
+        self.capacity = capacity
+        self.tick_ms = tick_ms
+        self.floor_ms = floor_ms
+        self.count = 0
+
+        self.next_due = array('l', [0] * capacity)	#ticks_ms when each channel is next due
+        self.interval = array('H', [0] * capacity)	#Current interval of each channel in ms (SAMPLE_FLOOR_MAX_MS at most)
+        self.rate = array('l', [0] * capacity)		#Smoothed |dT/dt|, quarter degrees per second * RATE_SCALE
+        self.last_q = array('h', [0] * capacity)	#Previous sample of each channel
+        self.t_ms = array('l', [0] * capacity)		#ticks_ms of each channel's latest sample, its timestamp
+        self.prev_t = array('l', [0] * capacity)	#ticks_ms of the sample before, for the rate
+        self.seen = bytearray(capacity)				#1 once a channel has a sample to take the rate from
+        self.pick = bytearray(capacity)				#1 for channels read on this tick
+        self.picked = array('H', [0] * capacity)	#Indices of the channels read on this tick, in chain order
+        self.n_picked = 0
+        self.now = 0			#ticks_ms of the current tick, next due times are kept on the tick grid
+
+        self.budget = 0			#Reads per tick * 1000
+        self.tokens = 0			#Read budget in 1/1000 reads, refilled every tick
+        self.rotate = 0			#First channel looked at for the budget left after the floor
+        self.samples = 0		#Reads since the last start()
+        self.deferred = 0		#Due reads pushed to a later tick by the budget
+
+    def start(self, count, period_ms, now):
+        """
+        Start sampling count channels, all due now and at the fixed scan period until their rates are known.
+
+        Args:
+            count: Number of channels
+            period_ms: Fixed scan period, the read budget is count reads per period
+            now: ticks_ms
+        """
+        self.count = count
+        self.budget = count * 1000 * self.tick_ms // period_ms	#Reads per tick * 1000
+        self.tokens = self.budget
+        self.samples = 0
+        self.deferred = 0
+        start_ms = min(period_ms, self.floor_ms)
+        for i in range(count):
+            self.next_due[i] = now
+            self.interval[i] = start_ms
+            self.rate[i] = 0
+            self.t_ms[i] = now
+            self.seen[i] = 0
+
+    def set_floor(self, floor_ms):
+        """Change the floor, quiet channels move to it at their next sample."""
+        self.floor_ms = floor_ms
+
+    def active(self):
+        """Get the number of channels sampled faster than the floor."""
+        floor = self.floor_ms
+        interval = self.interval
+        n = 0
+        for i in range(self.count):
+            if interval[i] < floor:
+                n += 1
+        return n
+
+    def plan(self, now):
+        """
+        Pick the channels to read on this tick.
+
+        Args:
+            now: ticks_ms of the tick
+
+        Returns:
+            Number of channels picked, their indices are in picked[:n] in chain order
+        """
+        self.now = now
+        n = self.count
+        pick = self.pick
+        next_due = self.next_due
+        interval = self.interval
+        floor = self.floor_ms
+        diff = time.ticks_diff
+
+        # Unused budget carries over for one tick, so a burst of due channels is not split
+        tokens = self.tokens + self.budget
+        if tokens > 2 * self.budget:
+            tokens = 2 * self.budget
+
+        # Channels kept waiting a whole floor past their due time first
+        for i in range(n):
+            pick[i] = 0
+            if tokens >= 1000 and diff(now, next_due[i]) >= floor:
+                pick[i] = 1
+                tokens -= 1000
+
+        # Then the faster ones, starting where the last tick's budget ran out
+        start = self.rotate
+        first_deferred = -1
+        for k in range(n):
+            i = start + k
+            if i >= n:
+                i -= n
+            if pick[i] or interval[i] >= floor or diff(now, next_due[i]) < 0:
+                continue
+            if tokens < 1000:
+                self.deferred += 1
+                if first_deferred < 0:
+                    first_deferred = i
+                continue
+            pick[i] = 1
+            tokens -= 1000
+        if first_deferred >= 0:
+            self.rotate = first_deferred
+
+        # Then the quiet ones at their floor
+        for i in range(n):
+            if pick[i] or interval[i] < floor or diff(now, next_due[i]) < 0:
+                continue
+            if tokens < 1000:
+                self.deferred += 1
+                continue
+            pick[i] = 1
+            tokens -= 1000
+        self.tokens = tokens
+
+        # Read in chain order, so the chip select walk takes single steps
+        m = 0
+        picked = self.picked
+        for i in range(n):
+            if pick[i]:
+                picked[m] = i
+                m += 1
+        self.n_picked = m
+        return m
+
+    def update(self, tc_q, faults):
+        """
+        Update the rate and next due time of every channel read on this tick.
+
+        Args:
+            tc_q: Converted samples of every channel (TC_BANK.tc_q)
+            faults: Fault bits of every channel
+        """
+        picked = self.picked
+        t_ms = self.t_ms
+        prev_t = self.prev_t
+        seen = self.seen
+        last_q = self.last_q
+        rate = self.rate
+        interval = self.interval
+        tick = self.tick_ms
+        floor = self.floor_ms
+        for k in range(self.n_picked):
+            i = picked[k]
+            t = t_ms[i]
+            if faults[i]:
+                # Retry a faulted channel at the floor, it says nothing about the rate
+                interval[i] = floor
+            else:
+                dt = time.ticks_diff(t, prev_t[i]) if seen[i] else 0
+                if dt > 0:
+                    dq = tc_q[i] - last_q[i]
+                    if dq < 0:
+                        dq = -dq
+                    r = rate[i]
+                    r += ((dq * 1000 * RATE_SCALE) // dt - r) >> 1
+                    rate[i] = r
+                    iv = SAMPLE_STEP_Q * 1000 * RATE_SCALE // r if r else floor
+                    if iv > floor:
+                        iv = floor
+                    iv -= iv % tick
+                    interval[i] = iv if iv > tick else tick
+                last_q[i] = tc_q[i]
+                prev_t[i] = t
+                seen[i] = 1
+            # From the tick, not the read, so a channel read late in one tick is due at the start of another
+            self.next_due[i] = time.ticks_add(self.now, interval[i])
+        self.samples += self.n_picked
+
+    def stats(self):
+        """Summary as floor_ms=..,active=..,samples=..,deferred=.."""
+        return f"floor_ms={self.floor_ms},active={self.active()},samples={self.samples},deferred={self.deferred}"
+
+
+if __name__ == "__main__":
+    print("Scheduler Module File")
@@ -1,6 +1,4 @@
-import pyb
-import machine
-import time
+import hardware
 
 class SR74HC595:
     #Initiiliases the shift register/s
@@ -8,21 +6,21 @@ class SR74HC595:
         
         self.spi_bus = spi_bus	#SPI bus lane      
         self.buf = bytearray(length)	#Creates a byte buffer array depending on how many shift registers           
-        self.rclk = machine.Pin(rclk_pin, machine.Pin.OUT)	#Sets own register clock/latch pin to be an output
+        self.rclk = hardware.pin(rclk_pin)	#Sets own register clock/latch pin to be an output
         
         #Initiliases srclr (Shift register clear)
         if srclr_pin == None:
             self.srclr = None
         
         else:
-            self.srclr = machine.Pin(srclr_pin, machine.Pin.OUT)	#Sets own srclr register to be an output
+            self.srclr = hardware.pin(srclr_pin)	#Sets own srclr register to be an output
             self.srclr.high()	#Initilises srclr (shift register clear) pin to high for normal operation
         
         #Initilises oe output enable
         if oe_pin == None:
             self.oe = None
         else:
-            self.oe = machine.Pin(oe_pin, machine.Pin.OUT)
+            self.oe = hardware.pin(oe_pin)
             self.oe.low()	#Activates output enable (active low)
         
         #Initliases all the shift register pins to high first
@@ -75,12 +73,12 @@ class SR74HC595_BITBANG:
     #Initiliases the shift register (bit bang version)
     def __init__(self, rclk_pin, ser_pin, srclk_pin, srclr_pin, oe_pin):
          
-        self.rclk = machine.Pin(rclk_pin, machine.Pin.OUT)
-        self.ser = machine.Pin(ser_pin, machine.Pin.OUT)
-        self.srclk = machine.Pin(srclk_pin, machine.Pin.OUT)
+        self.rclk = hardware.pin(rclk_pin)
+        self.ser = hardware.pin(ser_pin)
+        self.srclk = hardware.pin(srclk_pin)
         
-        self.oe = machine.Pin(oe_pin, machine.Pin.OUT)
-        self.srclr = machine.Pin(srclr_pin, machine.Pin.OUT)
+        self.oe = hardware.pin(oe_pin)
+        self.srclr = hardware.pin(srclr_pin)
             
         self.enable()	#Initiliases output enable
     
@@ -108,6 +106,17 @@ class SR74HC595_BITBANG:
         if latch:
             self.latch()
     
+    #Shifts the same bit in count times, setting SER only once
+    def repeat(self, value, count, latch=False):
+        if value:
+            self.ser.high()
+        else:
+            self.ser.low()
+        while count > 0:
+            self._clock()
+            count -= 1
+        if latch:
+            self.latch()
             
     #Pulse the RCLK (latch) pin to copy the current shift register contents to the output pins (Q0–Q7). This updates all outputs simultaneously
     def latch(self):
@@ -125,5 +134,79 @@ class SR74HC595_BITBANG:
     def enable(self, enabled = True):
         self.oe.value(not enabled)
 
+class CS_CHAIN:
+    
+    #Chip select engine for a chain of shift registers driving active low !CS lines.
+    #Keeps a shadow of the chain so a selection that is already latched costs nothing,
+    #stepping up to STEP_MAX positions forward shifts that many bits, and any other selection
+    #is pushed as one byte burst over spi_bus (a SoftSPI/SPI wired to SER and SRCLK).
+    STEP_MAX = 8	#Longest forward step shifted bit by bit, cheaper than a burst of the whole chain
+    
+    def __init__(self, spi_bus, sr_bit_bang, length):
+        
+        self.spi_bus = spi_bus		#SPI (or SoftSPI) on the SER/SRCLK lines, None to bit bang the bursts
+        self.sr = sr_bit_bang		#Bit bang driver, used for latch, single bit steps and output enable
+        self.length = length		#Number of shift registers in the chain
+        self.positions = length * 8	#Number of !CS outputs in the chain
+        self.buf = bytearray(b'\xff' * length)	#Shadow of the chain (1 = !CS high), last byte holds outputs 0-7
+        self.selected = -1			#Output currently latched low, -1 when none is
+        self.known = False			#False until the chain has been loaded from the shadow
+    
+    #Writes the whole shadow into the chain and latches it
+    def _load(self):
+        if self.spi_bus is None:
+            for byte in self.buf:
+                for i in range(7, -1, -1):
+                    self.sr.bit((byte >> i) & 1)
+        else:
+            self.spi_bus.write(self.buf)
+        self.sr.latch()
+        self.known = True
+    
+    #Sets or clears one output in the shadow (output 0 is the bit shifted in last)
+    def _shadow(self, position, value):
+        index = self.length - 1 - (position >> 3)
+        if value:
+            self.buf[index] |= 1 << (position & 7)
+        else:
+            self.buf[index] &= ~(1 << (position & 7))
+    
+    #Latches !CS low for a single output, shifting only what the shadow says has changed
+    def select(self, position):
+        if self.known and position == self.selected:
+            return
+        
+        if self.selected >= 0:
+            self._shadow(self.selected, 1)
+        if 0 <= position < self.positions:
+            self._shadow(position, 0)
+        else:
+            position = -1
+        
+        #Stepping to the next output only needs one bit, every other output stays high.
+        #A short step forward (over skipped outputs) shifts ones, moving the low output along
+        step = position - self.selected
+        if self.known and position >= 0 and step == 1:
+            self.sr.bit(1 if self.selected >= 0 else 0, True)
+        elif self.known and position >= 0 and self.selected >= 0 and 1 < step <= self.STEP_MAX:
+            self.sr.repeat(1, step, True)
+        else:
+            self._load()
+        self.selected = position
+    
+    #Moves the latched low output one position along the chain
+    def advance(self):
+        self.select(self.selected + 1)
+    
+    #Pulls every !CS high (also resynchronises the chain with the shadow)
+    def release(self):
+        self.known = False
+        self.select(-1)
+    
+    #Marks the chain contents as unknown, e.g. after the shift register was cleared directly
+    def invalidate(self):
+        self.known = False
+
+
 if __name__ == "__main__":
     print("Shift register File")
@@ -3,99 +3,172 @@ Heat Cube State Machine
 Main system controller for thermocouple management and state transitions.
 """
 
+from profiler import boot_profile, SCAN_JITTER	#First, so the profile covers every other import
+
 import machine
 import time
 import os
 
-from shift_register import SR74HC595_BITBANG
+import hardware
+from uart_queue import TX_QUEUE, RX_QUEUE
+boot_profile.mark("import uart_queue")
+from shift_register import SR74HC595_BITBANG, CS_CHAIN
 from thermocouple import MAX31855
 from init import TC_MANAGER
+boot_profile.mark("import init")
+from frames import MEASURE_FRAME, DELTA_FRAME, SAMPLE_FRAME, FRAME_TEXT, FRAME_BINARY, FRAME_DELTA, crc16
+from logger import CSV_LOG, BIN_LOG, DELTA_LOG, LOG_CSV, LOG_BIN, LOG_DELTA
+from download import FILE_SENDER
+from filters import FILTER_STREAM, FILTER_RAW
+from report import CHANGE_REPORTER, REPORT_ALL, REPORT_CHANGES, DEADBAND_MAX_Q, KEYFRAME_MAX_MS
+from scheduler import SAMPLING_FIXED, SAMPLING_ADAPTIVE, SAMPLE_TICK_MS, SAMPLE_FLOOR_MAX_MS
+from health import fault_text
+boot_profile.mark("import frames/logger/download")
 
 # ============ CONFIGURATION ============
 POSITION_FILE = "position.csv"
+POSITION_WRITE_LINES = 32	#position.csv lines collected per file write
+POS_WINDOW = 8				#Bulk position chunks the host may send before waiting for an acknowledgment
+POS_CHUNK_MAX = 16			#Most positions per bulk chunk, so a full window (~3 KB) fits the RX ring
+LOG_FORMAT = LOG_CSV	#Measurement log format at boot, LOG_CSV, LOG_BIN or LOG_DELTA (changed with LOG_FORMAT:<format>)
+UART_FILTER = FILTER_RAW	#Filter of the measurement data sent over UART at boot (changed with FILTER:UART:<spec>, see filters.py)
+LOG_FILTER = FILTER_RAW		#Filter of the logged measurement data at boot (changed with FILTER:LOG:<spec>)
 USER_BTN_PIN = "PA0"
 VBUS_PIN = "PA9"
+UART_RXBUF = 512	#UART driver receive buffer, holds a burst until the RX idle interrupt runs
+UART_BAUD = 115200
+TX_GUARD_US = 500	#Main loop: a UART slice must end this long before the next scan is due
+TOTAL_TC = 256	#Total Thermocouple Amount Avaliable (length of the !CS shift register chain)
+SCAN_PERIOD_MS = 1000	#Measurement scan period
+REPORT = REPORT_ALL		#Measurement channels sent over UART at boot, REPORT_ALL or REPORT_CHANGES (changed with REPORT:<mode>, see report.py)
+SAMPLING = SAMPLING_FIXED	#Measurement sampling at boot, SAMPLING_FIXED or SAMPLING_ADAPTIVE (changed with SAMPLING:<mode>[:<floor_ms>])
+USE_ASYNCIO = False	#Run the uasyncio task runtime (runtime.py) instead of the System.run busy loop
 
-scan_pending = False  # Global flag 
-DEBUG_PIN1 = machine.Pin("PE9", machine.Pin.OUT)  # Debug pin for timing measurements
-DEBUG_PIN2 = machine.Pin("PE11", machine.Pin.OUT)  # Debug pin for timing measurements
-DEBUG_PIN3 = machine.Pin("PE13", machine.Pin.OUT)  # Debug pin for timing measurements
-
+# SoftSPI clocking the chip select chain's SER/SRCLK lines in byte bursts
+CS_SPI_BAUDRATE = 2000000
+CS_SPI_MISO_PIN = "PE12"	#Unused input, SoftSPI needs a MISO pin even though the chain has no output
 
-PCB_ENABLE1 = machine.Pin("PG0", machine.Pin.OUT)	#PCB 1 Pin
-PCB_ENABLE2 = machine.Pin("PG1", machine.Pin.OUT)	#PCB 2 Pin
+scan_pending = False  # Global flag 
+scan_due = 0  # ticks_us when the timer set scan_pending, for the scan jitter statistics
+scan_period_us = 0  # Period of tc_timer
+next_scan_due = 0  # ticks_us when tc_timer fires next, the main loop keeps UART slices clear of it
+scan_timer_running = False  # tc_timer is started, set by start_scan_timer()/stop_scan_timer()
 
 # ============ UART HELPER CLASS ============
 class Helper:
     """
     Helper class for UART communication.
     Handles reading and writing messages over serial.
+    
+    Writes go into a TX_QUEUE and are sent by drain() from the main loop,
+    so a burst of output never holds up a scan. Received bytes collect in an
+    RX_QUEUE filled from the UART interrupt.
     """
     def __init__(self, uart):
         self.uart = uart
-        self.buffer = b''
+        self.tx = TX_QUEUE(uart)
+        self.rx = RX_QUEUE(uart)
 
-    def read_uart(self):
+    def read_commands(self):
         """
-        Read a line from UART.
+        Read every complete command line received so far.
+        
         Returns:
-            Decoded command string, or None if no data available
+            List of decoded command strings, empty if there are none
         """
-        if self.uart and self.uart.any():
-            
-            
-            data = self.uart.read()
+        return self.rx.lines()
+
+    def write_uart(self, message, droppable=False):
+        """
+        Queue a message for UART.
+        
+        Args:
+            message: Text without the trailing newline
+            droppable: True for measurement data that may be skipped if the host falls behind
             
-            if data:
-                time.sleep_ms(10)
-                self.buffer += data
-                while b'\n' in self.buffer:
-                    line, self.buffer = self.buffer.split(b'\n', 1)	#Splits buffer by first '\n' into line and self.buffer
-                    cmd = line.decode('utf-8').strip()	#Decode the line into utf-8
-                    return cmd
-        return None
+        Returns:
+            True if queued, False if it was dropped
+        """
+        return self.tx.put((message + "\n").encode(), droppable)
 
-    def write_uart(self, message):
-        """Write message over UART."""
-        self.uart.write((message + "\n").encode())
+    def write_frame(self, frame):
+        """
+        Queue a packed binary measurement frame as it is (no newline, droppable).
+        
+        Returns:
+            True if queued, False if it was dropped
+        """
+        return self.tx.put(frame, True)
+    
+    def drain(self, max_bytes=None):
+        """Send the next bounded slice of queued output (at most max_bytes if given)."""
+        self.tx.drain(max_bytes)
 
 
 # ============ STATE MACHINE BASE CLASS ============
 class State:
     """
     Base class for all states in the state machine.
-    All states must implement handle() and handle_command() methods.
+    All states must implement handle(). Commands are routed through the
+    state's command table: the part of the command before the first ':'
+    selects a handler(context, cmd).
+    
+    States that take timed scans set scans = True and implement scan(),
+    which the uasyncio runtime calls at each scan deadline.
     """
     
+    commands = {}
+    scans = False
+    
     def handle(self, context):
         """Handle state logic - called every loop iteration."""
         raise NotImplementedError("Subclasses must implement this method")
     
     def handle_command(self, context, cmd):
         """Handle incoming UART commands."""
-        raise NotImplementedError("Subclasses must implement this method")
+        handler = self.commands.get(cmd.partition(":")[0])
+        if handler:
+            handler(context, cmd)
+    
+    def scan(self, context):
+        """
+        Take one timed scan.
+        
+        Returns:
+            True if a scan was taken
+        """
+        return False
 
 # ============ INIT STATE ============
 class InitState(State):
     """
     Initialization state.
-    Sets up hardware, software, and thermocouple manager.
+    Sets up the UART, software, hardware, and thermocouple manager, in that
+    order, so the host hears SOFTWARE_INIT before the slow TC detection.
     """
     
     def __init__(self, context):
         print("Init state initializing...")
-        # Initialize hardware
-        context.init_hardware()
+        # UART first, everything after it can report over it
+        context.init_uart()
+        boot_profile.mark("uart")
         # Initialize software
         context.init_software()
+        boot_profile.mark("software")
+        # Initialize hardware
+        context.init_hardware()
+        boot_profile.mark("hardware")
         # Initialize thermocouple manager
         context.tc_manager = TC_MANAGER(
-            total_tc=256,	#Total Thermocouple Amount Avaliable
+            total_tc=TOTAL_TC,	#Total Thermocouple Amount Avaliable
             sr1_bit_bang=context.sr1_bit_bang,
             spi_bus=context.spi_bus,
             MAX31855=MAX31855,
-            uart=context.uart
+            uart=context.uart,
+            cs_chain=context.cs_chain
         )
+        boot_profile.mark("tc_manager")
+        boot_profile.report()	#Sent over UART on the BOOT_PROFILE command
     
     def handle(self, context):
         """Check for USB connection and transition to calibration state."""
@@ -138,11 +211,34 @@ class CalibrationState(State):
     def __init__(self, context):
         print("Calibration init")
         self.tc_selected = 0
+        self.tc_held = 0  # TC currently latched in the TC manager's hold mode
         self.pending_positions = {}  # Dictionary to store positions: {tc_id: (x, y, z)}
         self.expected_position_count = 0  # Expected number of positions
         self.expected_tc_ids = []  # List of expected TC IDs
         self.receiving_positions = False
         
+        # Command table, keyed by the command name before any ':'
+        self.commands = {
+            "measure": self._cmd_measure,
+            "SAVE_POSITIONS_START": self._cmd_save_positions_start,
+            "SAVE_POSITION": self._cmd_save_position,
+            "SAVE_POSITIONS_DONE": self._cmd_save_positions_done,
+            "LOAD_POSITIONS": self._cmd_load_positions,
+            "0": self._cmd_position_ack,
+            "POS_BULK_START": self._cmd_pos_bulk_start,
+            "POS_CHUNK": self._cmd_pos_chunk,
+            "POS_BULK_END": self._cmd_pos_bulk_end,
+            "POS_BULK_ABORT": self._cmd_pos_bulk_abort,
+            "RESCAN": self._cmd_rescan,
+        }
+        
+        # Bulk position upload state (POS_BULK_START ... POS_BULK_END)
+        self.bulk_positions = None	#{tc_id: (x, y, z)} while an upload is running
+        self.bulk_count = 0			#Positions announced by POS_BULK_START
+        self.bulk_next = 0			#Sequence number of the next chunk expected
+        self.bulk_nak = -1			#Chunk last asked for again, so a gap is only NAKed once
+        self.bulk_done = None		#(chunks, positions) of the last completed upload, see _cmd_pos_bulk_end
+        
     def handle(self, context):
         """Main calibration loop - measures or selects thermocouples."""
         
@@ -151,15 +247,23 @@ class CalibrationState(State):
             time.sleep_ms(10)
             return
         
-        time.sleep_ms(10)
+        # Latch a newly selected TC once, then only read it while the selection holds
+        if self.tc_selected != self.tc_held:
+            if self.tc_selected != 0:
+                context.tc_manager.tc_hold(self.tc_selected)
+            else:
+                context.tc_manager.tc_release()
+            self.tc_held = self.tc_selected
         
         if self.tc_selected != 0:
             
-            # A TC is selected - read only that one
-            data_str = context.tc_manager.tc_select_singular(self.tc_selected)
-            print(data_str)
+            # A TC is selected - stream it whenever the MAX31855 has a new conversion
+            data_str = context.tc_manager.tc_read_held()
             if data_str:
+                print(data_str)
                 context.helper.write_uart(data_str)
+        else:
+            context.idle(10)
 #         else:
 #         
 #             # No TC selected - measure all TCs
@@ -192,45 +296,46 @@ class CalibrationState(State):
             self.reset_tc_selected()
         
         # Handle string commands (only reached if cmd wasn't a valid TC ID)
-        if cmd == "measure":
-            time.sleep_ms(200)
-            context.state = MeasureState(context)
-            return
-        
-        # Handle position saving - check for DONE and START first (they don't start with "SAVE_POSITION:")
-        if cmd == "SAVE_POSITIONS_DONE":
-            print("Received SAVE_POSITIONS_DONE")
-            self._handle_save_positions(context, cmd)
-            return
-        
-        if cmd.startswith("SAVE_POSITIONS_START:"):
-            print("Received SAVE_POSITIONS_START")
-            self.receiving_positions = True  # Set flag to disable measurement loop
-            self._handle_save_positions(context, cmd)
-            return
-        
-        # Handle single position (SAVE_POSITION:1,0,0,0)
-        if cmd.startswith("SAVE_POSITION:"):
-            print("Saving positions")
-            self._handle_save_positions(context, cmd)
-            return
-        
-        # Handle position loading
-        if cmd.startswith("LOAD_POSITIONS"):
-            self._handle_load_positions(context)
-            return
-        
-        # Handle file selection
-#         if cmd.startswith("FILE_SELECTED:"):
-#             self._handle_file_selected(context, cmd)
-#             return
-        
-        # Handle "0" as position acknowledgment
-        if cmd == "0":
-            self.tc_selected = 0
-            # Position set acknowledgment - do nothing or log
-            print("Position set acknowledged")
-            return
+        State.handle_command(self, context, cmd)
+    
+    def _cmd_measure(self, context, cmd):
+        time.sleep_ms(200)
+        context.state = MeasureState(context)
+    
+    def _cmd_save_positions_start(self, context, cmd):
+        print("Received SAVE_POSITIONS_START")
+        self.receiving_positions = True  # Set flag to disable measurement loop
+        self._handle_save_positions(context, cmd)
+    
+    # Handle single position (SAVE_POSITION:1,0,0,0)
+    def _cmd_save_position(self, context, cmd):
+        print("Saving positions")
+        self._handle_save_positions(context, cmd)
+    
+    def _cmd_save_positions_done(self, context, cmd):
+        print("Received SAVE_POSITIONS_DONE")
+        self._handle_save_positions(context, cmd)
+    
+    def _cmd_load_positions(self, context, cmd):
+        self._handle_load_positions(context)
+    
+    # Probe every chain position again and refresh the cached topology
+    def _cmd_rescan(self, context, cmd):
+        context.tc_manager.tc_release()
+        self.tc_selected = 0
+        self.tc_held = 0
+        context.tc_manager.init_tc(use_cache=False)
+        # The channel map changed, so the next measurement starts a new log file
+        context.logger.new_file()
+        print(f"Rescan found {context.tc_manager.num_tcs} TCs")
+        context.helper.write_uart(f"RESCAN:{context.tc_manager.num_tcs}")
+        context.helper.write_uart(f"Active TCs:{context.tc_manager.tcs_active}")
+    
+    # Handle "0" as position acknowledgment
+    def _cmd_position_ack(self, context, cmd):
+        self.tc_selected = 0
+        # Position set acknowledgment - do nothing or log
+        print("Position set acknowledged")
     
     def _handle_save_positions(self, context, cmd):
         """Save thermocouple positions to CSV file."""
@@ -325,37 +430,149 @@ class CalibrationState(State):
             return
         
         # All positions received - write to CSV
+        self._store_positions(context, self.pending_positions)
+        self.receiving_positions = False
+        self.pending_positions = {}  # Clear after writing
+        self.expected_position_count = 0
+        self.expected_tc_ids = []
+    
+    # ============ BULK POSITION UPLOAD ============
+    # POS_BULK_START:<count>                      -> POS_BULK_READY:<window>,<max positions per chunk>
+    # POS_CHUNK:<seq>:<id,x,y,z;id,x,y,z;...>:<crc> -> POS_ACK:<chunks received in order>
+    #                                                or POS_NAK:<seq to resend from>
+    # POS_BULK_END:<chunks>                       -> POS_BULK_DONE:<count> or POS_BULK_ERROR:<reason>
+    #                                                (repeated after DONE: the same POS_BULK_DONE)
+    # <crc> is the CRC-16/CCITT of "<seq>:<payload>" as 4 hex digits. The host keeps up to
+    # <window> chunks unacknowledged and goes back to the NAKed chunk on an error.
+    
+    def _cmd_pos_bulk_start(self, context, cmd):
+        try:
+            count = int(cmd.split(":", 1)[1])
+        except (IndexError, ValueError):
+            context.helper.write_uart("POS_BULK_ERROR:BAD_START")
+            return
+        self.receiving_positions = True  # Pause streaming while the upload runs
+        self.bulk_positions = {}
+        self.bulk_count = count
+        self.bulk_next = 0
+        self.bulk_nak = -1
+        self.bulk_done = None
+        context.helper.write_uart(f"POS_BULK_READY:{POS_WINDOW},{POS_CHUNK_MAX}")
+    
+    def _cmd_pos_chunk(self, context, cmd):
+        if self.bulk_positions is None:
+            context.helper.write_uart("POS_BULK_ERROR:NOT_STARTED")
+            return
+        
+        parts = cmd.split(":")
+        try:
+            seq = int(parts[1])
+            body = f"{parts[1]}:{parts[2]}".encode()
+            ok = len(parts) == 4 and int(parts[3], 16) == crc16(body, 0, len(body))
+        except (IndexError, ValueError):
+            seq = -1
+            ok = False
+        
+        if ok and seq < self.bulk_next:
+            # Duplicate of a chunk already stored (its ACK was lost), acknowledge again
+            context.helper.write_uart(f"POS_ACK:{self.bulk_next}")
+            return
+        if not ok or seq != self.bulk_next:
+            # Corrupt or out of order: ask once for everything from the first missing chunk
+            if self.bulk_nak != self.bulk_next:
+                self.bulk_nak = self.bulk_next
+                context.helper.write_uart(f"POS_NAK:{self.bulk_next}")
+            return
+        
+        entries = {}
+        try:
+            for entry in parts[2].split(";"):
+                if entry:
+                    tc_id, x, y, z = entry.split(",")
+                    entries[int(tc_id)] = (float(x), float(y), float(z))
+        except ValueError:
+            self.bulk_nak = self.bulk_next
+            context.helper.write_uart(f"POS_NAK:{self.bulk_next}")
+            return
+        
+        self.bulk_positions.update(entries)
+        self.bulk_next += 1
+        self.bulk_nak = -1
+        context.helper.write_uart(f"POS_ACK:{self.bulk_next}")
+    
+    def _cmd_pos_bulk_end(self, context, cmd):
+        try:
+            chunks = int(cmd.split(":", 1)[1])
+        except (IndexError, ValueError):
+            chunks = -1
+        if self.bulk_positions is None:
+            # The DONE reply was lost and the host ended again: answer the same way
+            if self.bulk_done is not None and chunks == self.bulk_done[0]:
+                context.helper.write_uart(f"POS_BULK_DONE:{self.bulk_done[1]}")
+            else:
+                context.helper.write_uart("POS_BULK_ERROR:NOT_STARTED")
+            return
+        if chunks != self.bulk_next:
+            # Chunks are still missing, the host resends from here and ends again
+            context.helper.write_uart(f"POS_NAK:{self.bulk_next}")
+            return
+        
+        received = len(self.bulk_positions)
+        if received != self.bulk_count:
+            context.helper.write_uart(f"POS_BULK_ERROR:COUNT_{received}_OF_{self.bulk_count}")
+        elif self._store_positions(context, self.bulk_positions):
+            self.bulk_done = (chunks, received)
+            context.helper.write_uart(f"POS_BULK_DONE:{received}")
+        else:
+            context.helper.write_uart("POS_BULK_ERROR:WRITE_FAILED")
+        self._cmd_pos_bulk_abort(context, cmd)
+    
+    def _cmd_pos_bulk_abort(self, context, cmd):
+        self.bulk_positions = None
+        self.bulk_count = 0
+        self.bulk_next = 0
+        self.receiving_positions = False
+    
+    def _store_positions(self, context, positions):
+        """
+        Apply positions to the TCs and write position.csv in one pass.
+        
+        Lines are written in blocks of POSITION_WRITE_LINES with no flush per line.
+        
+        Args:
+            context: System context
+            positions: Dictionary {tc_id: (x, y, z)}
+            
+        Returns:
+            True if the file was written
+        """
+        tcs_array = context.tc_manager.tcs_array
+        lines = []
         try:
             with open(POSITION_FILE, 'w') as f:
                 # Write all positions sorted by TC ID
-                for tc_id in sorted(self.pending_positions.keys()):
-                    x, y, z = self.pending_positions[tc_id]
+                for tc_id in sorted(positions.keys()):
+                    x, y, z = positions[tc_id]
                     
                     # Update TC object (MCU uses 0-based indexing, TC IDs are 1-based)
-                    if 1 <= tc_id <= len(context.tc_manager.tcs_array):
-                        tc = context.tc_manager.tcs_array[tc_id - 1]
+                    if 1 <= tc_id <= len(tcs_array):
+                        tc = tcs_array[tc_id - 1]
                         tc.x = x
                         tc.y = y
                         tc.z = z
                     
-                    
-                    # Write to CSV
-                    f.write(f"{tc_id},{x},{y},{z}\n")
-                    f.flush()
+                    lines.append(f"{tc_id},{x},{y},{z}\n")
+                    if len(lines) == POSITION_WRITE_LINES:
+                        f.write("".join(lines))
+                        lines = []
+                if lines:
+                    f.write("".join(lines))
         except OSError as e:
             print("Error Occured: ", e)
-            
-                    
-                    
-            
-            print(f"Saved {len(self.pending_positions)} positions to {POSITION_FILE}")
-            self.receiving_positions = False
-            self.pending_positions = {}  # Clear after writing
-            self.expected_position_count = 0
-            self.expected_tc_ids = []
-            
-        except Exception as e:
-            print(f"Error writing positions to CSV: {e}")
+            return False
+        
+        print(f"Saved {len(positions)} positions to {POSITION_FILE}")
+        return True
     
     #Send thermocouple position list over UART by reading CSV file
     def _handle_load_positions(self, context):
@@ -374,45 +591,19 @@ class CalibrationState(State):
                         position_data.append(f"{parts[0]},{parts[1]},{parts[2]},{parts[3]}")
             
             if position_data:
-                message = f"LOAD_POSITIONS:{';'.join(position_data)}\n"
-                context.uart.write(message.encode())
+                context.helper.write_uart(f"LOAD_POSITIONS:{';'.join(position_data)}")
                 print(f"Sent {len(position_data)} positions")
             else:
-                context.uart.write("LOAD_POSITIONS:ERROR_NO_DATA\n".encode())
+                context.helper.write_uart("LOAD_POSITIONS:ERROR_NO_DATA")
                 print("No position data found in CSV")
                 
         except OSError:
-            context.uart.write("LOAD_POSITIONS:ERROR_FILE_NOT_FOUND\n".encode())
+            context.helper.write_uart("LOAD_POSITIONS:ERROR_FILE_NOT_FOUND")
             print("position.csv file not found")
         except Exception as e:
-            context.uart.write(f"LOAD_POSITIONS:ERROR_{str(e)}\n".encode())
+            context.helper.write_uart(f"LOAD_POSITIONS:ERROR_{str(e)}")
             print(f"Error reading position file: {e}")
     
-#     def _handle_file_selected(self, context, cmd):
-#         """Handle file selection and send file data over UART."""
-#         filename = cmd.split(":", 1)[1].strip()
-#         print(f"File selected: {filename}")
-#         
-#         #Need to fix this to store one line at a time and not all at once!!!
-#         try:
-#             count = 0
-#             with open(filename, 'r') as f:
-#                 for line in f:
-#                     line = line.strip()
-#                     if line:
-#                         context.helper.write_uart(f"FILE_DATA:{line}")
-#                         count += 1
-# 
-#             print(f"Sent {count} lines from {filename}")
-#             
-#         except OSError:
-#             context.helper.write_uart("FILE_ERROR:File not found")
-#             print(f"File {filename} not found")
-#         except Exception as e:
-#             context.helper.write_uart(f"FILE_ERROR:{str(e)}")
-#             print(f"Error reading file {filename}: {e}")
-
-counter = 0
 # ============ MEASURE STATE ============
 class MeasureState(State):
     """
@@ -420,59 +611,150 @@ class MeasureState(State):
     Continuously measures all active thermocouples.
     """
     
+    scans = True
+    
     #Initliase Measurement State
     def __init__(self, context):
         print("Measure init")
+        self.commands = {"calibrate": self._cmd_calibrate}
+        # Filters restart from the first scan instead of averaging across the break
+        context.uart_filter.reset()
+        context.log_filter.reset()
         context.tc_manager.sr1_bit_bang.clear()
         context.tc_manager.sr1_bit_bang.enable(False)
         context.tc_manager.tc_set()
+        self.start_sampling(context)
+    
+    def start_sampling(self, context):
+        """Start the sampling schedule, on entering measurement mode or a SAMPLING change."""
+        global scan_pending
+        scan_pending = False  # Set while calibrating or by the old period, the first scan waits for the next timer period
+        self.ticks = 0	#Adaptive ticks since the last log record
+        if context.sampling == SAMPLING_ADAPTIVE:
+            tc_manager = context.tc_manager
+            tc_manager.sampler.start(tc_manager.num_tcs, SCAN_PERIOD_MS, time.ticks_ms())
     
     def handle(self, context):
-        """Measure all thermocouples and send data over UART."""
+        """Measure all thermocouples when the scan timer has fired."""
         global scan_pending
-        global counter
         
+        if scan_pending:
+            scan_pending = False
+            context.scan_jitter.record(time.ticks_diff(time.ticks_us(), scan_due))
+            self.scan(context)
+    
+    def scan(self, context):
+        """Measure all thermocouples, log the scan and send it over UART."""
+        if context.sampling == SAMPLING_ADAPTIVE:
+            return self.sample(context)
         context.dt = context.rtc.datetime()
+        tc_manager = context.tc_manager
+        tc_manager.tc_scan()
+        tc_manager.bank.convert_all()
         
-        if scan_pending:
-      
-            #counter += 1
+        # Each stream gets the bank itself (RAW) or its filtered copy, filtered once if both share a filter
+        uart_bank = context.uart_filter.apply(tc_manager.bank)
+        if context.log_filter is context.uart_filter:
+            log_bank = uart_bank
+        else:
+            log_bank = context.log_filter.apply(tc_manager.bank)
         
-            scan_pending = False
-            data_str = context.tc_manager.tc_measure()
-         
+        # Text is only built when the log or the UART output needs it
+        log_str = None
+        if context.log_format == LOG_CSV:
+            log_str = log_bank.probe_text()
+        
+        # Append to the 30-minute log file in the selected format
+        context.logger.write(context.dt, log_bank, log_str)
+        
+        if context.report_mode == REPORT_CHANGES:
+            self.report_changes(context, uart_bank, log_str if uart_bank is log_bank else None)
+        elif context.frame_mode == FRAME_BINARY:
+            # One packed frame per scan instead of a text line per TC
+            context.helper.write_frame(context.frame_encoder.pack(uart_bank))
+        elif context.frame_mode == FRAME_DELTA:
+            if not context.helper.write_frame(context.delta_encoder.pack(uart_bank)):
+                # The host cannot apply deltas past a dropped frame
+                context.delta_encoder.force_key()
+        else:
+            data_str = log_str if log_str is not None and uart_bank is log_bank else uart_bank.probe_text()
+            # The whole scan is queued as one message so it is sent or skipped as a unit
+            # (a faulted channel's empty field goes out as its fault, e.g. "TC3: FAULT_OC")
             data_array = data_str.split(",")
-            year, month, day, hour, minute, second = context.dt[0], context.dt[1], context.dt[2], context.dt[4], context.dt[5], context.dt[6]
-            #print("Seconds: ", context.dt[6], "Milliseconds: ", context.dt[7])
-            
-            minute_block = (minute // 30) * 30 #Ensures every 15 minutes new file can be made
-            
-            date_str = "{:04d}-{:02d}-{:02d}_{:02d}-{:02d}".format(year, month, day, hour, minute_block)
-            
-            time_str = "{:02d}:{:02d}:{:02d}".format(hour, minute, second)
-            
-            #print(time_str)
-            
-            filename = "{}.csv".format(date_str)
-            
-            #if counter == 10:
-            
-            try:
-                with open(filename, "a") as f:
-                    f.write("{},{}\n".format(time_str, data_str))
-                    f.flush()
-            except OSError as e:
-                print("Error Occured: ", e)
-                
-                #counter = 0              
-            for i, value in enumerate(data_array):
-                context.helper.write_uart(f"TC{i + 1}: {value}")
-       
+            faults = uart_bank.faults
+            lines = "\n".join([f"TC{i + 1}: {value or fault_text(faults[i])}" for i, value in enumerate(data_array)])
+            context.helper.write_uart(lines, droppable=True)
+        return True
     
-    def handle_command(self, context, cmd):
-        """Handle measurement state commands."""
-        if cmd == "calibrate":
-            context.state = CalibrationState(context)
+    def report_changes(self, context, bank, data_str=None):
+        """
+        Send only the channels that moved more than the deadband since they were last sent (REPORT:CHANGES).
+        
+        Args:
+            context: System
+            bank: Scan to report (TC_BANK or FILTER_STREAM)
+            data_str: bank.probe_text() if it was already built
+        """
+        reporter = context.reporter
+        n, key = reporter.select(bank, time.ticks_ms())
+        if not n:
+            return
+        if context.frame_mode == FRAME_TEXT:
+            if data_str is None:
+                data_str = bank.probe_text()
+            values = data_str.split(",")
+            faults = bank.faults
+            lines = "\n".join([f"TC{i + 1}: {values[i] or fault_text(faults[i])}" for i in reporter.picked[:n]])
+            sent = context.helper.write_uart(lines, droppable=True)
+        else:
+            # Binary and delta mode both send the picked channels as a sample frame
+            sent = context.helper.write_frame(context.sample_encoder.pack(bank, reporter))
+        if not sent:
+            # The host's copy of the dropped channels is now stale
+            reporter.force_key()
+    
+    def sample(self, context):
+        """
+        Read the channels due on this adaptive sampling tick and send each sample with its own time.
+        
+        The log keeps one record per SCAN_PERIOD_MS, holding the latest sample
+        of every channel, so the log formats do not change. Samples go out
+        unfiltered.
+        """
+        tc_manager = context.tc_manager
+        bank = tc_manager.bank
+        sampler = tc_manager.sampler
+        n = tc_manager.tc_scan_due()
+        if n:
+            bank.convert_all()
+            sampler.update(bank.tc_q, bank.faults)
+            if context.frame_mode == FRAME_TEXT:
+                # The timestamp after the temperature keeps the line readable as "TC<id>: <temp>"
+                picked = sampler.picked
+                tc_q = bank.tc_q
+                faults = bank.faults
+                t_ms = sampler.t_ms
+                lines = "\n".join([f"TC{i + 1}: {tc_q[i] / 4 if not faults[i] else fault_text(faults[i])} @{t_ms[i]}"
+                                   for i in picked[:n]])
+                context.helper.write_uart(lines, droppable=True)
+            else:
+                # Binary and delta mode both send sample frames, a delta needs every channel
+                context.helper.write_frame(context.sample_encoder.pack(bank, sampler))
+        
+        self.ticks += 1
+        if self.ticks >= SCAN_PERIOD_MS // SAMPLE_TICK_MS:
+            self.ticks = 0
+            context.dt = context.rtc.datetime()
+            log_bank = context.log_filter.apply(bank)
+            log_str = log_bank.probe_text() if context.log_format == LOG_CSV else None
+            context.logger.write(context.dt, log_bank, log_str)
+        return True
+    
+    
+    def _cmd_calibrate(self, context, cmd):
+        # Write out the buffered log records before leaving measurement mode
+        context.logger.close()
+        context.state = CalibrationState(context)
 
 
 # ============ SYSTEM CLASS ============
@@ -485,21 +767,51 @@ class System:
     #Initliase systme
     def __init__(self):
         self.tc_manager = None
+        
+        # Commands handled in every state, keyed by the command name before any ':'
+        self.commands = {
+            "FRAME_MODE": self.set_frame_mode,
+            "LOG_FORMAT": self.set_log_format,
+            "LOG_STATS": self._cmd_log_stats,
+            "TX_STATS": self._cmd_tx_stats,
+            "FILES": self._cmd_files,
+            "FILE_GET": self._cmd_file_get,
+            "FILE_STOP": self._cmd_file_stop,
+            "BOOT_PROFILE": self._cmd_boot_profile,
+            "RT_STATS": self._cmd_rt_stats,
+            "FILTER": self.set_filter,
+            "SAMPLING": self.set_sampling,
+            "REPORT": self.set_report,
+            "KEYFRAME": self._cmd_keyframe,
+            "HEALTH": self._cmd_health,
+        }
+        # Commands handled outside measurement mode
+        self.idle_commands = {
+            "RESET": self._cmd_reset,
+            "status": self._cmd_status,
+        }
+        
+        self.frame_mode = FRAME_TEXT	#Measurement data format on UART, changed with FRAME_MODE:<mode>
+        self.log_format = None			#Measurement log format, set by set_log_format()
+        self.report_mode = REPORT		#REPORT_ALL or REPORT_CHANGES, changed with REPORT:<mode>
+        self.sampling = SAMPLING		#SAMPLING_FIXED or SAMPLING_ADAPTIVE, changed with SAMPLING:<mode>
+        self.cooperative = False		#True under the uasyncio runtime: no blocking idle sleeps, log flushes in their own task
+        self.runtime = None				#runtime.RUNTIME when running under uasyncio
         self.state = InitState(self)
     
+    #Initialise the UART before anything else
+    def init_uart(self):
+        """Initialize the UART and its helper."""
+        self.uart = machine.UART(2, baudrate=UART_BAUD, rxbuf=UART_RXBUF)
+        self.helper = Helper(self.uart)
+        print("UART initialised")
+
     #Initlaise hardware
     def init_hardware(self):
-        """Initialize all hardware components."""
+        """Initialize the remaining hardware components. Pins come from hardware.pin(), so each is created once."""
         # SPI bus
         self.spi_bus = machine.SPI(1, baudrate=1000000, phase=0, polarity=0)
 
-        # Shift register pins
-        self.rclk = machine.Pin("PF15", machine.Pin.OUT)
-        self.srclk = machine.Pin("PE14", machine.Pin.OUT)
-        self.ser = machine.Pin("PF12", machine.Pin.OUT)
-        self.oe = machine.Pin("PF13", machine.Pin.OUT)
-        self.srclr = machine.Pin("PF14", machine.Pin.OUT)
-
         # Shift register driver
         self.sr1_bit_bang = SR74HC595_BITBANG(
             rclk_pin="PF15",
@@ -508,110 +820,368 @@ class System:
             srclk_pin="PE14",
             srclr_pin="PF14"
         )
-
-        # User button
-        self.user_btn = machine.Pin(USER_BTN_PIN, machine.Pin.IN, machine.Pin.PULL_DOWN)
-
-        # UART
-        self.uart = machine.UART(2, baudrate=115200)
-
-        # UART helper
-        self.helper = Helper(self.uart)
         
+        # Chip select engine: whole !CS patterns go out as one SoftSPI burst on SER/SRCLK
+        self.cs_spi = machine.SoftSPI(
+            baudrate=CS_SPI_BAUDRATE,
+            polarity=0,
+            phase=0,
+            sck=self.sr1_bit_bang.srclk,
+            mosi=self.sr1_bit_bang.ser,
+            miso=hardware.pin(CS_SPI_MISO_PIN, machine.Pin.IN)
+        )
+        self.cs_chain = CS_CHAIN(self.cs_spi, self.sr1_bit_bang, TOTAL_TC // 8)
+
         # VBUS pin (USB connection detection)
-        self.vbus_pin = machine.Pin(VBUS_PIN, machine.Pin.IN)
+        self.vbus_pin = hardware.pin(VBUS_PIN, machine.Pin.IN)
         
         # RTC
         self.rtc = machine.RTC()
         self.dt = self.rtc.datetime()
         
         print("Hardware initialised")
+
+    @property
+    def user_btn(self):
+        """User button, configured the first time it is read."""
+        return hardware.pin(USER_BTN_PIN, machine.Pin.IN, machine.Pin.PULL_DOWN)
    
    #Sends uart cmd to initialise software
     def init_software(self):
         """Initialize software components."""
         self.helper.write_uart("SOFTWARE_INIT")
+        self.helper.tx.flush()	#Send it now, not after the TC detection
+        self.frame_encoder = MEASURE_FRAME(TOTAL_TC)
+        self.delta_encoder = DELTA_FRAME(TOTAL_TC)
+        self.sample_encoder = SAMPLE_FRAME(TOTAL_TC)
+        self.reporter = CHANGE_REPORTER(TOTAL_TC)
+        self.file_sender = FILE_SENDER()
+        self.scan_jitter = SCAN_JITTER()
+        self.uart_filter = FILTER_STREAM(TOTAL_TC, UART_FILTER)
+        self.log_filter = self.uart_filter if LOG_FILTER == UART_FILTER else FILTER_STREAM(TOTAL_TC, LOG_FILTER)
+        self.set_log_format(LOG_FORMAT, reply=False)
         print("Software initialised")
     
     
     def run(self):
         """Main loop - handle state and process UART."""
         self.state.handle(self)
+        if self.file_sender.active:
+            self.file_sender.step(self.helper)
+        self.helper.drain(self.tx_budget())
         self.process_uart()
+    
+    def tx_budget(self):
+        """
+        Get how many bytes this pass may send without delaying the next scan.
+        
+        The UART write blocks for ~87 us per byte, so a full slice started just
+        before the scan timer fires would hold the scan back by up to ~11 ms.
+        
+        Returns:
+            None for a full slice (no scanning state, or no scan timer running),
+            else the bytes that fit before the next scan is due, at most a full slice
+        """
+        if not self.state.scans or not scan_timer_running:
+            return None
+        if scan_pending:
+            return 0	#The timer fired during this pass, the next pass scans first
+        # Past the deadline means the timer callback is about to run, the scan is overdue
+        left_us = time.ticks_diff(next_scan_due, time.ticks_us()) - TX_GUARD_US
+        if left_us <= 0:
+            return 0
+        n = left_us * UART_BAUD // 10000000
+        return n if n < self.helper.tx.slice_bytes else None
 
     
     def process_uart(self):
-        """Process incoming UART commands."""
-        cmd = self.helper.read_uart()
-        if cmd:
-            # Handle status command
-            if not isinstance(self.state, MeasureState):
-                #On recieving a reset command reset machine like pressing reset button
-                if cmd == "RESET":
-                    time.sleep_ms(1000)
-                    machine.reset()
-                
-                #On recieving "status" command send back state of system, and provide it with "Active TCs:" list
-                if cmd == "status":
-                    state_name = type(self.state).__name__
-                    time.sleep_ms(5)
-                    self.helper.write_uart(state_name)
-                    time.sleep_ms(5)
-                    print(f"Active TCs:{self.tc_manager.tcs_active}")
-                    self.helper.write_uart(f"Active TCs:{self.tc_manager.tcs_active}")
-     
-                # Send file list
-                #self._send_file_list()
-            
-            # Forward command to current state
-            self.state.handle_command(self, cmd)
-    
-#     def _send_file_list(self):
-#         """Send list of available CSV files over UART."""
-#         try:
-#             files = os.listdir()
-#             csv_files = []
-#             
-#             for filename in files:
-#                 if filename.endswith('.csv'):
-#                     # Validate filename format (should start with integer)
-#                     name_without_ext = filename[:-4]
-#                     first_part = name_without_ext.split('-')[0] if '-' in name_without_ext else name_without_ext
-#                     try:
-#                         int(first_part)
-#                         csv_files.append(filename)
-#                     except ValueError:
-#                         pass  # Skip invalid filenames
-#             
-#             if csv_files:
-#                 file_list = ','.join(csv_files)
-#                 self.helper.write_uart(f"FILES:{file_list}")
-#                 print(f"Sent file list: {file_list}")
-#             else:
-#                 self.helper.write_uart("FILES:")
-#                 print("No CSV files found")
-#                 
-#         except Exception as e:
-#             print(f"Error listing files: {e}")
-#             self.helper.write_uart("FILES:ERROR")
+        """Process every UART command received since the last call."""
+        for cmd in self.helper.read_commands():
+            self.dispatch(cmd)
+    
+    def dispatch(self, cmd):
+        """
+        Route one command through the command tables.
+        
+        System commands are handled here in every state. RESET and status are
+        handled outside measurement mode and then, like every other command,
+        passed on to the current state.
+        """
+        name, _, arg = cmd.partition(":")
+        handler = self.commands.get(name)
+        if handler:
+            handler(arg)
+            return
+        
+        if not isinstance(self.state, MeasureState):
+            handler = self.idle_commands.get(name)
+            if handler:
+                handler(arg)
+        
+        # Forward command to current state
+        self.state.handle_command(self, cmd)
+    
+    #On recieving a reset command reset machine like pressing reset button
+    def _cmd_reset(self, arg):
+        self.logger.close()
+        self.helper.tx.flush()
+        time.sleep_ms(1000)
+        machine.reset()
+    
+    #On recieving "status" command send back state of system, and provide it with "Active TCs:" list
+    def _cmd_status(self, arg):
+        state_name = type(self.state).__name__
+        time.sleep_ms(5)
+        self.helper.write_uart(state_name)
+        time.sleep_ms(5)
+        print(f"Active TCs:{self.tc_manager.tcs_active}")
+        self.helper.write_uart(f"Active TCs:{self.tc_manager.tcs_active}")
+    
+    def _cmd_log_stats(self, arg):
+        self.helper.write_uart(f"LOG_STATS:{self.logger.stats()}")
+    
+    def _cmd_tx_stats(self, arg):
+        self.helper.write_uart(f"TX_STATS:{self.helper.tx.stats()}")
+    
+    def _cmd_files(self, arg):
+        self.file_sender.send_list(self.helper)
+    
+    def _cmd_file_get(self, arg):
+        # Put buffered records on the card first, so a download of the current log is up to date
+        self.logger.flush()
+        self.file_sender.start(self.helper, arg)
+    
+    def _cmd_file_stop(self, arg):
+        self.file_sender.stop(self.helper)
+
+    def _cmd_boot_profile(self, arg):
+        boot_profile.report(self.helper)
 
+    def _cmd_rt_stats(self, arg):
+        if self.runtime is not None:
+            self.helper.write_uart(f"RT_STATS:runtime=async,{self.runtime.stats()}")
+        else:
+            self.helper.write_uart(f"RT_STATS:runtime=loop,{self.scan_jitter.stats()},{self.tc_manager.scheduler.stats()}")
+    
+    def _cmd_keyframe(self, arg):
+        # Resync a viewer: every channel in the next change report or delta frame
+        self.reporter.force_key()
+        self.delta_encoder.force_key()
+    
+    def _cmd_health(self, arg):
+        # HEALTH sends the fault summary, HEALTH:CLEAR zeroes it and scans every channel again
+        health = self.tc_manager.health
+        if arg == "CLEAR":
+            health.clear()
+        elif arg:
+            self.helper.write_uart(f"HEALTH:ERROR_{arg}")
+            return
+        self.helper.write_uart(f"HEALTH:{health.summary()}")
+    
+    def idle(self, ms):
+        """Wait while there is nothing to do. Under the uasyncio runtime the state task sleeps instead."""
+        if not self.cooperative:
+            time.sleep_ms(ms)
+    
+    def set_filter(self, arg, reply=True):
+        """
+        Select the filter of the UART stream, the log, or both.
+        
+        Args:
+            arg: "<UART|LOG|ALL>:<spec>" (see filters.py), or "" to only report the current filters
+            reply: Send FILTER:UART=<spec>,LOG=<spec> over UART
+        """
+        target, _, spec = arg.partition(":")
+        target = target.strip().upper()
+        if target:
+            try:
+                if target not in ("UART", "LOG", "ALL"):
+                    raise ValueError(target)
+                stream = FILTER_STREAM(TOTAL_TC, spec)
+            except ValueError:
+                if reply:
+                    self.helper.write_uart(f"FILTER:ERROR_{arg}")
+                return
+            # ALL shares one stream, so the scan is filtered once for both
+            if target != "LOG":
+                self.uart_filter = stream
+            if target != "UART":
+                self.log_filter = stream
+        if reply:
+            self.helper.write_uart(f"FILTER:UART={self.uart_filter.spec},LOG={self.log_filter.spec}")
+    
+    def set_report(self, arg, reply=True):
+        """
+        Select whether every channel is sent on each scan, or only the ones that changed.
+        
+        Args:
+            arg: "ALL", or "CHANGES[:<deadband °C>[:<keyframe s>]]", or "" to only report
+            reply: Send REPORT:<mode>,deadband=..,keyframe_s=..,reports=..,suppressed=..,keyframes=.. over UART
+        """
+        reporter = self.reporter
+        fields = arg.split(":")
+        mode = fields[0].strip().upper()
+        if mode:
+            try:
+                if mode not in (REPORT_ALL, REPORT_CHANGES) or len(fields) > 3:
+                    raise ValueError(mode)
+                deadband_q = reporter.deadband_q
+                keyframe_ms = reporter.keyframe_ms
+                if len(fields) > 1 and fields[1]:
+                    deadband_q = int(round(float(fields[1]) * 4))
+                if len(fields) > 2 and fields[2]:
+                    keyframe_ms = int(fields[2]) * 1000
+                if not 0 <= deadband_q <= DEADBAND_MAX_Q or not 1000 <= keyframe_ms <= KEYFRAME_MAX_MS:
+                    raise ValueError(arg)
+            except (ValueError, OverflowError):
+                if reply:
+                    self.helper.write_uart(f"REPORT:ERROR_{arg}")
+                return
+            reporter.deadband_q = deadband_q
+            reporter.keyframe_ms = keyframe_ms
+            if mode != self.report_mode:
+                self.report_mode = mode
+                # Changes are reported against what the host has, so start from a keyframe
+                reporter.force_key()
+                self.delta_encoder.force_key()
+        if reply:
+            self.helper.write_uart(f"REPORT:{self.report_mode},{reporter.stats()}")
+    
+    def set_sampling(self, arg, reply=True):
+        """
+        Switch measurement between fixed and adaptive sampling.
+        
+        Adaptive sampling reads each channel at a rate set by its dT/dt, from
+        SAMPLE_TICK_MS (10 Hz) down to the floor, within the SPI reads of the
+        fixed scan (see scheduler.RATE_SCHEDULER).
+        
+        Args:
+            arg: "FIXED", "ADAPTIVE" or "ADAPTIVE:<floor_ms>", or "" to only report
+            reply: Send SAMPLING:<mode>,floor_ms=..,active=..,samples=..,deferred=.. over UART
+        """
+        sampler = self.tc_manager.sampler
+        mode, _, floor = arg.partition(":")
+        mode = mode.strip().upper()
+        if mode:
+            try:
+                if mode not in (SAMPLING_FIXED, SAMPLING_ADAPTIVE):
+                    raise ValueError(mode)
+                floor_ms = int(floor) if floor else sampler.floor_ms
+                if not SAMPLE_TICK_MS <= floor_ms <= SAMPLE_FLOOR_MAX_MS:
+                    raise ValueError(floor)
+            except ValueError:
+                if reply:
+                    self.helper.write_uart(f"SAMPLING:ERROR_{arg}")
+                return
+            sampler.set_floor(floor_ms)
+            if mode != self.sampling:
+                self.sampling = mode
+                if mode == SAMPLING_FIXED:
+                    # The host lost the delta base while sample frames were sent
+                    self.delta_encoder.force_key()
+                if isinstance(self.state, MeasureState):
+                    self.state.start_sampling(self)
+                self.set_scan_period(scan_period_ms(mode))
+        if reply:
+            self.helper.write_uart(f"SAMPLING:{self.sampling},{sampler.stats()}")
+    
+    def set_scan_period(self, period_ms):
+        """Change the period at which MeasureState.scan() runs (the timer, or the runtime's acquisition task)."""
+        if self.runtime is not None:
+            self.runtime.set_period(period_ms)
+        else:
+            start_scan_timer(period_ms)
+    
+    def set_frame_mode(self, mode):
+        """
+        Switch measurement output between text lines, binary frames and delta frames.
+        
+        The reply is always a text line, so the host can read it whichever
+        mode it asked for.
+        
+        Args:
+            mode: FRAME_TEXT, FRAME_BINARY or FRAME_DELTA
+        """
+        if mode in (FRAME_TEXT, FRAME_BINARY, FRAME_DELTA):
+            if mode == FRAME_DELTA:
+                # Start the host off with a keyframe
+                self.delta_encoder.force_key()
+            self.frame_mode = mode
+            self.helper.write_uart(f"FRAME_MODE:{mode}")
+        else:
+            self.helper.write_uart(f"FRAME_MODE:ERROR_{mode}")
+    
+    def set_log_format(self, log_format, reply=True):
+        """
+        Select the log writer used in measurement mode.
+        
+        Args:
+            log_format: LOG_CSV, LOG_BIN or LOG_DELTA
+            reply: Send a LOG_FORMAT:<format> acknowledgment over UART
+        """
+        if log_format not in (LOG_CSV, LOG_BIN, LOG_DELTA):
+            if reply:
+                self.helper.write_uart(f"LOG_FORMAT:ERROR_{log_format}")
+            return
+        
+        # Finish the current file before switching writers
+        if self.log_format is not None:
+            self.logger.close()
+        
+        # Under the uasyncio runtime the log task writes the buffer out between scans
+        if log_format == LOG_CSV:
+            self.logger = CSV_LOG(auto_flush=not self.cooperative)
+        elif log_format == LOG_BIN:
+            self.logger = BIN_LOG(TOTAL_TC, auto_flush=not self.cooperative)
+        else:
+            self.logger = DELTA_LOG(TOTAL_TC, auto_flush=not self.cooperative)
+        self.log_format = log_format
+        if reply:
+            self.helper.write_uart(f"LOG_FORMAT:{log_format}")
+    
 
 # ============ MAIN ENTRY POINT ============
 
+def scan_period_ms(sampling):
+    """Get the period of MeasureState.scan(): the sampling tick when adaptive, else SCAN_PERIOD_MS."""
+    return SAMPLE_TICK_MS if sampling == SAMPLING_ADAPTIVE else SCAN_PERIOD_MS
+
 #Function for switching flag to allow thermocouple measurements to be read on set interval
 def trigger_tc_scan(timer):
-    global scan_pending
+    global scan_pending, scan_due, next_scan_due
     scan_pending = True  # ISR sets the flag
+    scan_due = time.ticks_us()
+    next_scan_due = time.ticks_add(scan_due, scan_period_us)
+
+def start_scan_timer(period_ms):
+    """(Re)start tc_timer with a new period, the first scan is one period from now."""
+    global scan_period_us, next_scan_due, scan_timer_running
+    scan_period_us = period_ms * 1000
+    next_scan_due = time.ticks_add(time.ticks_us(), scan_period_us)
+    tc_timer.init(period=period_ms, mode=machine.Timer.PERIODIC, callback=trigger_tc_scan)
+    scan_timer_running = True
+
+def stop_scan_timer():
+    """Stop tc_timer, the main loop then sends full UART slices again."""
+    global scan_timer_running
+    tc_timer.deinit()
+    scan_timer_running = False
     
 tc_timer = machine.Timer(-1)
-tc_timer.init(period=1000, mode=machine.Timer.PERIODIC, callback=trigger_tc_scan)
+start_scan_timer(scan_period_ms(SAMPLING))
 
 system = System()
 
 def main():
     """Main execution loop."""
-    while True:
-        system.run()
+    if USE_ASYNCIO:
+        # The acquisition task keeps its own scan deadlines
+        stop_scan_timer()
+        import runtime
+        runtime.run(system, scan_period_ms(system.sampling))
+    else:
+        while True:
+            system.run()
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,7 @@
 import pyb
 import machine
 import time
+from array import array
 
 #Class for thermocouple chip (MAX31855)
 class MAX31855:
@@ -64,7 +65,7 @@ class MAX31855:
             old_value = self.tc_buf[self.counter - 1]				#Obtains "old" value of array	
             self.tc_buf[self.counter - 1] = self.tc_c				#Populates index counter - 1 with temperature probe value
             self.tc_total = self.tc_total + (self.tc_c - old_value)	#Adds difference between new reading and old reading
-            self.tc_avg = self.tc_total >> 3 						#Bit shift by 3 to divide by 8
+            self.tc_avg = self.tc_total / self.size				#Average of the buffer (tc_total is a float, so no bit shift)
             self.counter = (self.counter % 8) + 1					#Increments counter by 1 and resets at counter = 8
             
     def print_temp(self, index = None):
@@ -78,6 +79,160 @@ class MAX31855:
         
 
 
+#Array-backed store for every active thermocouple channel
+#Replaces one MAX31855 object per channel: all readings live in a few typed arrays,
+#so 256 channels cost a few kB and a whole scan is converted in one pass
+class TC_BANK:
+    
+    #Initialise an empty bank able to hold up to capacity channels
+    def __init__(self, capacity, spi_bus):
+        self.capacity = capacity		#Maximum number of channels
+        self.spi_bus = spi_bus			#Spi bus lane shared by every chip
+        self.count = 0					#Number of channels in use
+        
+        self.frame = bytearray(4 * capacity)	#Raw 4 byte MAX31855 frame of every channel
+        self.views = []							#Memoryview slice of frame per channel, read into directly
+        self.slot = array('H', [0] * capacity)	#Chain position of each channel's !CS line (0-based)
+        self.tc_q = array('h', [0] * capacity)	#Probe temperatures in quarter degrees
+        self.cj_q = array('h', [0] * capacity)	#Reference temperatures in sixteenth degrees
+        self.faults = bytearray(capacity)		#Fault bits (SCV/SCG/OC) per channel
+        
+        # Position data of each thermocouple
+        self.x = array('f', [0] * capacity)
+        self.y = array('f', [0] * capacity)
+        self.z = array('f', [0] * capacity)
+        
+        self.channels = []				#TC_CHANNEL view per channel
+        self._frame_mv = memoryview(self.frame)
+    
+    #Empties the bank so the channels can be detected again
+    def clear(self):
+        self.count = 0
+        self.views = []
+        self.channels = []
+    
+    #Adds a detected chip and its first reading, returns its channel index
+    def add(self, cs_pin, raw_data):
+        index = self.count
+        if index >= self.capacity:
+            raise IndexError("TC_BANK full")
+        
+        # Slices are made here, once, because slicing a memoryview allocates
+        view = self._frame_mv[4 * index:4 * index + 4]
+        view[:] = raw_data
+        self.views.append(view)
+        self.slot[index] = cs_pin - 1
+        self.x[index] = 0
+        self.y[index] = 0
+        self.z[index] = 0
+        self.channels.append(TC_CHANNEL(self, index))
+        self.count = index + 1
+        self.convert(index, index + 1)
+        return index
+    
+    #Reads one channel straight into its slice of the frame buffer (!CS must already be low)
+    def read(self, index):
+        self.spi_bus.readinto(self.views[index])
+    
+    #Converts raw frames of channels start..stop-1 into the temperature and fault arrays
+    def convert(self, start, stop):
+        buf = self.frame
+        tc_q = self.tc_q
+        cj_q = self.cj_q
+        faults = self.faults
+        for i in range(start, stop):
+            j = i << 2
+            tc = (buf[j] << 6) | (buf[j + 1] >> 2)	#Probe temperature is bits [31:18], signed 14-bit
+            if tc & 0x2000:
+                tc -= 0x4000
+            cj = (buf[j + 2] << 4) | (buf[j + 3] >> 4)	#Reference temperature is bits [15:4], signed 12-bit
+            if cj & 0x800:
+                cj -= 0x1000
+            tc_q[i] = tc
+            cj_q[i] = cj
+            faults[i] = buf[j + 3] & 0x7
+    
+    #Converts every channel in one batched pass, small integers only so nothing is allocated
+    def convert_all(self):
+        self.convert(0, self.count)
+    
+    #Comma-separated probe temperatures in degrees, as sent in the text protocol and CSV log
+    #(a channel with a fault is an empty field, its reading is not a temperature)
+    def probe_text(self):
+        tc_q = self.tc_q
+        faults = self.faults
+        return ",".join([str(tc_q[i] / 4) if not faults[i] else "" for i in range(self.count)])
+
+
+#Thin per-channel view into a TC_BANK
+#Exposes the attributes TC_MANAGER users read from a MAX31855 object (tc_c, cj_c, x, y, z, ...)
+class TC_CHANNEL:
+    
+    def __init__(self, bank, index):
+        self.bank = bank		#Bank holding this channel's data
+        self.index = index		#Channel index in the bank
+    
+    @property
+    def cs_pin(self):
+        return self.bank.slot[self.index] + 1	#1-based chain position, as MAX31855.cs_pin
+    
+    @property
+    def raw_tc_data(self):
+        return self.bank.views[self.index]
+    
+    @property
+    def tc_c(self):
+        return self.bank.tc_q[self.index] * 0.25		#Each bit represents 0.25 degrees celcius of probe temperature
+    
+    @property
+    def cj_c(self):
+        return self.bank.cj_q[self.index] * 0.0625	#Each bit represents 0.0625 degrees celcius of reference temperature
+    
+    @property
+    def error_data(self):
+        return self.bank.faults[self.index]
+    
+    @property
+    def error_flag(self):
+        return self.bank.faults[self.index] != 0
+    
+    @property
+    def x(self):
+        return self.bank.x[self.index]
+    
+    @x.setter
+    def x(self, value):
+        self.bank.x[self.index] = value
+    
+    @property
+    def y(self):
+        return self.bank.y[self.index]
+    
+    @y.setter
+    def y(self, value):
+        self.bank.y[self.index] = value
+    
+    @property
+    def z(self):
+        return self.bank.z[self.index]
+    
+    @z.setter
+    def z(self, value):
+        self.bank.z[self.index] = value
+    
+    def read_thermocouple(self):
+        self.bank.read(self.index)
+    
+    def convert_temp(self):
+        self.bank.convert(self.index, self.index + 1)
+    
+    def print_temp(self, index = None):
+        label = f"Thermocouple {index}" if index is not None else "Thermocouple" #Gives the thermocouple an index label if one is assigned 
+        print(f'{label} temp: {self.tc_c} °C')	#Prints current probe temp
+        print(f'{label} Ref temp: {self.cj_c} °C\n')	#Prints current ref temp
+        
+
+
 if __name__ == "__main__":
     print("Thermocouple Module File")
 #     spi_bus = 
\ No newline at end of file
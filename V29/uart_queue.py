@@ -0,0 +1,254 @@
+"""
+UART Queue Module
+Transmit and receive ring buffers that decouple the UART from the main loop.
+"""
+
+# ============ CONFIGURATION ============
+TX_QUEUE_SIZE = 8192	#Ring size, room for two 256-channel text scans
+TX_HIGH_WATER = 6144	#Droppable messages are skipped once the queue would go past this
+TX_SLICE_BYTES = 128	#Bytes written per drain() call (~11 ms at 115200 baud)
+
+RX_QUEUE_SIZE = 4096	#Receive ring size, room for a burst of SAVE_POSITION lines
+RX_CHUNK = 256			#Bytes moved from the UART per readinto() call
+
+
+# ============ TX QUEUE CLASS ============
+class TX_QUEUE:
+    """
+    Ring buffer of bytes waiting to go out on a UART.
+
+    put() only copies into RAM, and the main loop calls drain() to write a
+    bounded slice at a time. The STM32 UART.write blocks until its bytes are
+    sent, so bounding each write bounds how long the loop is held up.
+
+    Measurement data is queued as droppable. When the host reads slower than
+    the MCU scans, whole scans are skipped at the high-water mark instead of
+    the backlog growing and delaying the next scan. Command replies are never
+    dropped: if there is no room, put() waits for the queue to drain.
+    """
+
+    def __init__(self, uart, size=TX_QUEUE_SIZE, high_water=TX_HIGH_WATER, slice_bytes=TX_SLICE_BYTES):
+        """
+        Initialize the queue.
+
+        Args:
+            uart: UART to transmit on
+            size: Ring buffer size in bytes
+            high_water: Queue depth above which droppable messages are skipped
+            slice_bytes: Maximum bytes written by one drain() call
+        """
+        self.uart = uart
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.size = size
+        self.high_water = high_water
+        self.slice_bytes = slice_bytes
+        self.head = 0		#Next byte to write into
+        self.tail = 0		#Next byte to send
+        self.depth = 0		#Bytes waiting
+
+        # Statistics, see stats()
+        self.max_depth = 0		#Deepest the queue has been
+        self.queued = 0			#Messages accepted
+        self.sent_bytes = 0		#Bytes written to the UART
+        self.dropped = 0		#Droppable messages skipped at the high-water mark
+        self.dropped_bytes = 0
+        self.stalls = 0			#put() calls that had to wait for room
+
+    def put(self, data, droppable=False):
+        """
+        Queue a message.
+
+        Args:
+            data: Bytes-like message
+            droppable: True for measurement data that may be skipped under back-pressure
+
+        Returns:
+            True if queued, False if it was dropped
+        """
+        n = len(data)
+        if droppable and self.depth + n > self.high_water:
+            self.dropped += 1
+            self.dropped_bytes += n
+            return False
+
+        if n > self.size - self.depth:
+            # No room: send what is queued (and a message larger than the ring directly)
+            self.stalls += 1
+            self.flush()
+            if n > self.size:
+                self.uart.write(data)
+                self.sent_bytes += n
+                self.queued += 1
+                return True
+
+        # Copy in, in two pieces if the message wraps around the end of the ring
+        first = self.size - self.head
+        if first >= n:
+            self.mv[self.head:self.head + n] = data
+        else:
+            data = memoryview(data)
+            self.mv[self.head:self.size] = data[:first]
+            self.mv[0:n - first] = data[first:]
+        self.head = (self.head + n) % self.size
+        self.depth += n
+        self.queued += 1
+        if self.depth > self.max_depth:
+            self.max_depth = self.depth
+        return True
+
+    def drain(self, max_bytes=None):
+        """
+        Write the next slice of queued bytes.
+
+        Args:
+            max_bytes: Upper bound for this call (slice_bytes if None)
+
+        Returns:
+            Number of bytes written
+        """
+        if max_bytes is None:
+            max_bytes = self.slice_bytes
+        n = self.depth if self.depth < max_bytes else max_bytes
+        if n == 0:
+            return 0
+        # Only the contiguous part up to the end of the ring, the rest goes next call
+        if n > self.size - self.tail:
+            n = self.size - self.tail
+        self.uart.write(self.mv[self.tail:self.tail + n])
+        self.tail = (self.tail + n) % self.size
+        self.depth -= n
+        self.sent_bytes += n
+        return n
+
+    def flush(self):
+        """Send everything queued, e.g. before a reset."""
+        while self.depth:
+            self.drain(self.size)
+
+    def stats(self):
+        """One-line summary of the queue statistics."""
+        return "depth={},max_depth={},size={},queued={},sent_bytes={},dropped={},dropped_bytes={},stalls={}".format(
+            self.depth, self.max_depth, self.size, self.queued, self.sent_bytes,
+            self.dropped, self.dropped_bytes, self.stalls)
+
+
+# ============ RX QUEUE CLASS ============
+class RX_QUEUE:
+    """
+    Ring buffer of received bytes, split into command lines.
+
+    Where the port supports it the ring is filled from the UART's RX idle
+    interrupt as soon as a burst ends. lines() also polls, so bytes are
+    picked up even without the interrupt or while a burst is still running.
+
+    Only fill() writes head and only lines() writes tail, so the interrupt
+    can run in the middle of lines() without losing an update. The bytes
+    waiting are worked out from the two, with one slot kept free so a full
+    ring is told apart from an empty one.
+    """
+
+    def __init__(self, uart, size=RX_QUEUE_SIZE):
+        """
+        Initialize the queue and hook the UART receive interrupt.
+
+        Args:
+            uart: UART to receive from
+            size: Ring buffer size in bytes
+        """
+        self.uart = uart
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.size = size
+        self.scratch = bytearray(RX_CHUNK)	#readinto() target, copied into the ring
+        self.scratch_mv = memoryview(self.scratch)
+        self.head = 0		#Next byte to write into, written by fill() only
+        self.tail = 0		#Start of the oldest unfinished line, written by lines() only
+        self.filling = False	#Guards fill() against the interrupt and the main loop overlapping
+
+        # Statistics
+        self.rx_bytes = 0
+        self.lines_read = 0
+        self.overflows = 0	#Bytes dropped because the ring was full
+        self.discarded = 0	#Bytes of a full ring without a newline, dropped by lines()
+
+        self.irq = False	#True if fill() runs from the UART interrupt
+        try:
+            uart.irq(handler=self._on_rx, trigger=uart.IRQ_RXIDLE)
+            self.irq = True
+        except (AttributeError, TypeError, ValueError):
+            pass
+
+    def _on_rx(self, uart):
+        self.fill()
+
+    def fill(self):
+        """Move everything the UART has received into the ring."""
+        if self.filling:
+            return
+        self.filling = True
+        try:
+            while self.uart.any():
+                n = self.uart.readinto(self.scratch)
+                if not n:
+                    break
+                self.rx_bytes += n
+                take = self.size - 1 - (self.head - self.tail) % self.size
+                if take > n:
+                    take = n
+                self.overflows += n - take
+                # Copy in, in two pieces if the data wraps around the end of the ring
+                first = self.size - self.head
+                if first >= take:
+                    self.mv[self.head:self.head + take] = self.scratch_mv[:take]
+                else:
+                    self.mv[self.head:self.size] = self.scratch_mv[:first]
+                    self.mv[0:take - first] = self.scratch_mv[first:take]
+                self.head = (self.head + take) % self.size
+        finally:
+            self.filling = False
+
+    def lines(self):
+        """
+        Split every complete line received so far, in one pass.
+
+        Returns:
+            List of decoded, stripped command strings (empty lines skipped)
+        """
+        self.fill()
+        cmds = []
+        head = self.head	#Bytes the interrupt adds from here on wait for the next call
+        waiting = (head - self.tail) % self.size
+        start = self.tail
+        length = 0
+        i = self.tail
+        for _ in range(waiting):
+            if self.buf[i] == 10:	#'\n'
+                if start + length <= self.size:
+                    line = bytes(self.buf[start:start + length])
+                else:
+                    line = bytes(self.buf[start:]) + bytes(self.buf[:start + length - self.size])
+                try:
+                    cmd = line.decode('utf-8').strip()
+                except UnicodeError:
+                    cmd = ''	#Line garbled on the wire
+                if cmd:
+                    cmds.append(cmd)
+                # Free the line and its newline
+                start = (i + 1) % self.size
+                length = 0
+            else:
+                length += 1
+            i = (i + 1) % self.size
+        # A full ring with no newline can never complete a line, so drop it
+        if start == self.tail and waiting == self.size - 1:
+            self.discarded += waiting
+            start = head
+        self.tail = start
+
+        self.lines_read += len(cmds)
+        return cmds
+
+
+if __name__ == "__main__":
+    print("UART Queue Module File")
@@ -0,0 +1,480 @@
+"""
+Scan Benchmark Module
+Deterministic scan-performance benchmarks for TC_MANAGER on the virtual board.
+
+For each channel count the firmware is booted fresh on the host simulator and
+these operations are measured:
+
+- init_tc:          building a TC_MANAGER at boot (checks the topology cached by the first boot)
+- init_tc_rescan:   the full slot probe scan (first boot, changed hardware or RESCAN)
+- tc_select_singular: one calibration read of a single channel
+- calibration_stream: one second of CalibrationState streaming a held channel
+- tc_scan:          one raw scan plus bank.convert_all (the zero-allocation path)
+- tc_measure:       one scan of every active channel, formatted as text
+- measure_cycle:    one MeasureState.handle call with a scan pending (output is queued, not sent)
+- measure_cycle_binary: the same with FRAME_MODE:BINARY (one packed frame per scan)
+- measure_cycle_filtered: the same with FILTER:ALL:MED3+MA8+EMA8 (every filter stage, filters.py)
+- measure_cycle_delta: the same with FRAME_MODE:DELTA and LOG_FORMAT:DLT (delta frame and delta log record)
+- adaptive_periods: three scan periods of SAMPLING:ADAPTIVE with two channels heating at 5 °C/s
+- tc_scan_faulted:  tc_scan with every 8th probe open, after the health monitor pruned them
+- measure_period:   one scan period of the main loop with a scan pending, including sending its output
+- measure_period_changes: the same with REPORT:CHANGES, after the keyframe (steady state)
+- download_periods: three timer-driven scan periods of the main loop while a log download streams
+- download_periods_async: the same under the uasyncio runtime (runtime.py)
+
+Metrics per operation:
+    virtual_ms      virtual clock time (sleeps plus modelled bus and pin time)
+    sleep_ms        time spent in time.sleep_ms / sleep_us
+    gpio_writes     Python-level Pin calls
+    gpio_edges      level changes on any pin
+    spi_bytes       bytes clocked on the SPI buses
+    uart_bytes      bytes written to the UART
+    alloc_blocks    heap allocations made by firmware code (simulator excluded)
+    alloc_bytes     bytes of those allocations
+    probe_updates   Probe_Data lines sent (calibration_stream only, higher is better)
+    hot_reads       reads of the two heating channels (adaptive_periods only, higher is better)
+    reads           MAX31855 reads of every channel (adaptive_periods and tc_scan_faulted only)
+    jitter_max_us   latest scan start against its deadline (download_periods* only)
+
+Allocations are measured on CPython, which also boxes integers above 256 and
+creates range iterators that MicroPython avoids, so they are an upper bound
+on what the firmware allocates on the MCU.
+
+Usage:
+    python host/bench/scan_bench.py                 # compare against baseline.json
+    python host/bench/scan_bench.py --update        # rewrite baseline.json
+    python host/bench/scan_bench.py --out run.json  # also save this run
+
+The run exits with status 1 if any metric regresses past its tolerance.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "sim"))
+
+import virtual_board  # noqa: E402  (installs the MicroPython time functions)
+
+# ============ CONFIGURATION ============
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+SIZES = (16, 32, 64, 128, 256)
+TOTAL_SLOTS = 256           # Chain length scanned by init_tc
+SCAN_PERIOD_MS = 1000       # tc_timer period in state_machine.py
+CALIBRATION_WINDOW_MS = 1000
+JITTER_PERIODS = 3          # Scan periods run by download_periods*
+DOWNLOAD_LOG = "2026-01-01_00-00.bin"
+DOWNLOAD_BYTES = 65536      # More than JITTER_PERIODS seconds of download at 115200 baud
+ADAPTIVE_PERIODS = 3        # Scan periods run by adaptive_periods
+ADAPTIVE_SETTLE_MS = 3000   # Adaptive sampling run before measuring, so the rates are known
+ADAPTIVE_EDGE_MS = 50       # adaptive_periods ends half a 100 ms tick later, so no tick sits on the window's edge
+HOT_RATE = 5.0              # °C/s of the heating channels in adaptive_periods
+FAULTED_EVERY = 8           # tc_scan_faulted opens every 8th probe...
+FAULT_PRUNE_SCANS = 10      # ...and scans this often before measuring, so they are pruned
+CHECK_EXPANDERS = 2         # MCP23S17s sharing one !CS in check_pcb_expanders
+CHECK_EXPANDER_CS = "PD14"
+
+# Relative tolerance per metric, plus an absolute allowance for tiny values.
+# Everything except allocations is exactly reproducible on the virtual board.
+TOLERANCES = {
+    "virtual_ms": (0.01, 0.5),
+    "sleep_ms": (0.0, 0.0),
+    "gpio_writes": (0.0, 0),
+    "gpio_edges": (0.0, 0),
+    "spi_bytes": (0.0, 0),
+    "uart_bytes": (0.02, 16),      # Text length follows the simulated temperatures
+    "alloc_blocks": (0.1, 8),      # CPython version dependent
+    "alloc_bytes": (0.1, 256),
+    "probe_updates": (0.0, 0),
+    "hot_reads": (0.0, 0),
+    "reads": (0.0, 0),
+    "jitter_max_us": (0.0, 100),
+}
+HIGHER_IS_BETTER = ("probe_updates", "hot_reads")
+
+
+# ============ HARNESS ============
+def boot(num_tcs):
+    """Boot state_machine.py on a fresh virtual board and return the module."""
+    virtual_board.reset(num_tcs=num_tcs, chain_length=TOTAL_SLOTS)
+    virtual_board.unload_firmware()
+    os.chdir(tempfile.mkdtemp(prefix="heat_cube_bench_"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        import state_machine
+    # The benchmark triggers scans itself; a free-running timer would make
+    # the measured cycle depend on where the clock happens to be.
+    state_machine.stop_scan_timer()
+    return state_machine
+
+
+def idle(ms):
+    """
+    Let virtual time pass between benchmarks without measuring it.
+
+    The clock stops on a whole millisecond, so the next benchmark does not start
+    at a sub-millisecond phase left over from the one before (sleeps and timers
+    are phase dependent).
+    """
+    clock = virtual_board.board().clock
+    clock.advance(ms * 1000 + (-clock.now_us) % 1000)
+
+
+class AllocationTracer:
+    """
+    Counts heap growth that happens while firmware lines execute.
+
+    A line tracer reads tracemalloc's current size at every event. Growth
+    between an event in a firmware frame and the next event is charged to the
+    firmware. Frame set-up ('call' events) and anything the simulator does
+    inside its own frames is not.
+    """
+
+    def __init__(self):
+        self.blocks = 0
+        self.bytes = 0
+        self._last = 0
+        self._in_firmware = False
+        self._tracer = self._trace  # One bound method, not a new one per event
+
+    def _trace(self, frame, event, arg):
+        now = tracemalloc.get_traced_memory()[0]
+        if self._in_firmware and event != "call" and now > self._last:
+            self.blocks += 1
+            self.bytes += now - self._last
+        self._in_firmware = frame.f_code.co_filename.startswith(virtual_board.FIRMWARE_DIR)
+        # Re-read after the bookkeeping so the tracer's own objects are not charged
+        self._last = tracemalloc.get_traced_memory()[0]
+        return self._tracer
+
+    def run(self, func):
+        tracemalloc.start()
+        self._last = tracemalloc.get_traced_memory()[0]
+        sys.settrace(self._tracer)
+        try:
+            func()
+        finally:
+            sys.settrace(None)
+            tracemalloc.stop()
+
+
+def measure(func):
+    """Run func() and return the counter deltas it caused on the virtual board."""
+    board = virtual_board.board()
+    board.uart(2).host_read()
+    before = board.snapshot()
+    tracer = AllocationTracer()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracer.run(func)
+    delta = virtual_board.Counters.delta(before, board.snapshot())
+    return {
+        "virtual_ms": round(delta["now_us"] / 1000.0, 3),
+        "sleep_ms": round(delta["sleep_us"] / 1000.0, 3),
+        "gpio_writes": delta["gpio_writes"],
+        "gpio_edges": delta["gpio_edges"],
+        "spi_bytes": delta["spi_bytes_read"] + delta["spi_bytes_written"],
+        "uart_bytes": delta["uart_tx_bytes"],
+        "alloc_blocks": tracer.blocks,
+        "alloc_bytes": tracer.bytes,
+    }
+
+
+def bench_size(num_tcs):
+    """Run every benchmark at one channel count."""
+    sm = boot(num_tcs)
+    system = sm.system
+    results = {}
+
+    def init_tc():
+        system.tc_manager = sm.TC_MANAGER(
+            total_tc=TOTAL_SLOTS,
+            sr1_bit_bang=system.sr1_bit_bang,
+            spi_bus=system.spi_bus,
+            MAX31855=sm.MAX31855,
+            uart=system.uart,
+            cs_chain=system.cs_chain
+        )
+    results["init_tc"] = measure(init_tc)
+    results["init_tc_rescan"] = measure(lambda: system.tc_manager.init_tc(use_cache=False))
+
+    tc_manager = system.tc_manager
+    if tc_manager.num_tcs != num_tcs:
+        raise RuntimeError("expected {} TCs, init_tc found {}".format(num_tcs, tc_manager.num_tcs))
+
+    results["tc_select_singular"] = measure(lambda: tc_manager.tc_select_singular(max(1, num_tcs // 2)))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        system.state = sm.CalibrationState(system)
+    system.state.tc_selected = max(1, num_tcs // 2)
+    idle(SCAN_PERIOD_MS)
+    stream = measure(lambda: virtual_board.run_for(system.run, CALIBRATION_WINDOW_MS))
+    lines = virtual_board.board().uart(2).host_lines()
+    stream["probe_updates"] = sum(1 for line in lines if line.startswith("Probe_Data"))
+    results["calibration_stream"] = stream
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = sm.MeasureState(system)
+    system.state = state
+    # Scans run once per timer period, so give the chips a period to convert
+    idle(SCAN_PERIOD_MS)
+
+    def tc_scan():
+        tc_manager.tc_scan()
+        tc_manager.bank.convert_all()
+    tc_scan()  # Warm-up, so one-time interpreter caches are not counted
+    idle(SCAN_PERIOD_MS)
+    results["tc_scan"] = measure(tc_scan)
+    idle(SCAN_PERIOD_MS)
+    results["tc_measure"] = measure(tc_manager.tc_measure)
+
+    def measure_cycle():
+        sm.scan_pending = True
+        state.handle(system)
+    # Warm-up, so opening the log file (kept open from then on) is not counted
+    with contextlib.redirect_stdout(io.StringIO()):
+        measure_cycle()
+    idle(SCAN_PERIOD_MS)
+    # Output is only queued by the cycle; send it before the next benchmark
+    results["measure_cycle"] = measure(measure_cycle)
+    system.helper.tx.flush()
+
+    system.frame_mode = sm.FRAME_BINARY
+    idle(SCAN_PERIOD_MS)
+    results["measure_cycle_binary"] = measure(measure_cycle)
+    system.helper.tx.flush()
+    system.frame_mode = sm.FRAME_TEXT
+
+    def measure_period():
+        sm.scan_pending = True
+        virtual_board.run_for(system.run, SCAN_PERIOD_MS)
+    idle(SCAN_PERIOD_MS)
+    results["measure_period"] = measure(measure_period)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        system.set_report(sm.REPORT_CHANGES, reply=False)
+        # Warm-up: the first period sends the keyframe
+        measure_period()
+    idle(SCAN_PERIOD_MS)
+    results["measure_period_changes"] = measure(measure_period)
+    system.set_report(sm.REPORT_ALL, reply=False)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        system.set_filter("ALL:MED3+MA8+EMA8", reply=False)
+        # Warm-up: the first scan primes the filters
+        measure_cycle()
+    system.helper.tx.flush()
+    idle(SCAN_PERIOD_MS)
+    results["measure_cycle_filtered"] = measure(measure_cycle)
+    system.helper.tx.flush()
+    system.set_filter("ALL:RAW", reply=False)
+
+    # Last, so switching log writers does not affect the operations above
+    with contextlib.redirect_stdout(io.StringIO()):
+        system.set_frame_mode(sm.FRAME_DELTA)
+        system.set_log_format(sm.LOG_DELTA)
+        # Warm-up: the first cycle opens the log and sends keyframes
+        measure_cycle()
+    system.helper.tx.flush()
+    idle(SCAN_PERIOD_MS)
+    results["measure_cycle_delta"] = measure(measure_cycle)
+    system.helper.tx.flush()
+
+    # Adaptive sampling with two heating channels: the rest fall to the floor rate
+    board = virtual_board.board()
+    hot = [board.chips[0], board.chips[num_tcs - 1]]
+    start_s = board.clock.now_us / 1e6
+    for chip in hot:
+        chip.temperature = lambda t_s, base=chip.temperature(start_s): base + HOT_RATE * (t_s - start_s)
+    with contextlib.redirect_stdout(io.StringIO()):
+        system.set_sampling(sm.SAMPLING_ADAPTIVE, reply=False)
+        virtual_board.run_for(system.run, ADAPTIVE_SETTLE_MS)
+    system.helper.tx.flush()
+    hot_reads = sum(chip.reads for chip in hot)
+    reads = system.tc_manager.sampler.samples
+    with contextlib.redirect_stdout(io.StringIO()):
+        metrics = measure(lambda: virtual_board.run_for(
+            system.run, ADAPTIVE_PERIODS * SCAN_PERIOD_MS + ADAPTIVE_EDGE_MS))
+    metrics["hot_reads"] = sum(chip.reads for chip in hot) - hot_reads
+    metrics["reads"] = system.tc_manager.sampler.samples - reads
+    results["adaptive_periods"] = metrics
+    system.set_sampling(sm.SAMPLING_FIXED, reply=False)
+    sm.stop_scan_timer()
+    system.helper.tx.flush()
+    for chip in hot:
+        chip.temperature = chip._default_temperature
+
+    # One probe in FAULTED_EVERY open: once pruned, the scan skips them
+    faulted = [board.chips[k] for k in range(0, num_tcs, FAULTED_EVERY)]
+    for chip in faulted:
+        chip.fault = virtual_board.FAULT_OC
+    for _ in range(FAULT_PRUNE_SCANS):
+        idle(SCAN_PERIOD_MS)
+        tc_scan()
+    idle(SCAN_PERIOD_MS)
+    reads = board.counters.max31855_reads
+    metrics = measure(tc_scan)
+    metrics["reads"] = board.counters.max31855_reads - reads
+    results["tc_scan_faulted"] = metrics
+    for chip in faulted:
+        chip.fault = 0
+    tc_manager.health.clear()
+
+    # Scan jitter under UART load: a log download streams while the scan timer runs
+    with open(DOWNLOAD_LOG, "wb") as f:
+        f.write(bytes(range(256)) * (DOWNLOAD_BYTES // 256))
+
+    def download_periods(run_periods):
+        with contextlib.redirect_stdout(io.StringIO()):
+            system.dispatch("FILE_GET:{}:0".format(DOWNLOAD_LOG))
+        system.scan_jitter.reset()
+        metrics = measure(run_periods)
+        metrics["jitter_max_us"] = system.scan_jitter.max_us
+        system.file_sender.stop()
+        system.helper.tx.flush()
+        return metrics
+
+    def loop_periods():
+        sm.start_scan_timer(SCAN_PERIOD_MS)
+        virtual_board.run_for(system.run, JITTER_PERIODS * SCAN_PERIOD_MS + SCAN_PERIOD_MS // 2)
+        sm.stop_scan_timer()
+    idle(SCAN_PERIOD_MS)
+    results["download_periods"] = download_periods(loop_periods)
+
+    # Last, the runtime switches the system to cooperative mode for good
+    import runtime
+    import uasyncio
+
+    def async_periods():
+        rt = runtime.RUNTIME(system, SCAN_PERIOD_MS)
+        uasyncio.run(rt.main(JITTER_PERIODS * SCAN_PERIOD_MS + SCAN_PERIOD_MS // 2))
+    idle(SCAN_PERIOD_MS)
+    results["download_periods_async"] = download_periods(async_periods)
+    return results
+
+
+def run(sizes):
+    return {str(n): bench_size(n) for n in sizes}
+
+
+# ============ CHECKS ============
+def check_pcb_expanders(expanders=CHECK_EXPANDERS):
+    """
+    Select every PCB through PCB_EXPANDER with several expanders on one !CS
+    and return a list of errors: any PCB other than the selected one enabled.
+    Expanders sharing a !CS only tell their opcodes apart once IOCON.HAEN is
+    set, so a wrong IOCON address enables a board on every expander at once.
+    """
+    board = virtual_board.reset(num_tcs=0, chain_length=TOTAL_SLOTS,
+                                pcb_expander_cs=CHECK_EXPANDER_CS, pcb_expanders=expanders)
+    virtual_board.unload_firmware()
+    import machine
+    from pcb import PCB_EXPANDER
+
+    def enabled():
+        return [e.address * 16 + bit for e in board.expanders for bit in range(16) if not e.output(bit)]
+
+    pcbs = PCB_EXPANDER(CHECK_EXPANDER_CS, machine.SPI(1), expanders)
+    errors = []
+    for pcb in list(range(pcbs.count)) + [0, pcbs.count - 1, pcbs.count]:
+        pcbs.select(pcb)
+        expected = [pcb] if pcb < pcbs.count else []
+        if enabled() != expected:
+            errors.append("{} expanders, PCB {} selected: PCBs {} enabled".format(expanders, pcb, enabled()))
+    pcbs.release()
+    if enabled():
+        errors.append("{} expanders, released: PCBs {} enabled".format(expanders, enabled()))
+    return errors
+
+
+# ============ REPORTING ============
+def print_table(results):
+    columns = ("virtual_ms", "sleep_ms", "gpio_writes", "gpio_edges", "spi_bytes", "uart_bytes", "alloc_blocks", "alloc_bytes")
+    print("{:>5} {:<21}".format("TCs", "operation") + "".join("{:>13}".format(c) for c in columns))
+    for size, ops in results.items():
+        for op, metrics in ops.items():
+            print("{:>5} {:<21}".format(size, op) + "".join("{:>13}".format(metrics[c]) for c in columns))
+    for size, ops in results.items():
+        stream = ops["calibration_stream"]
+        print("{:>5} calibration_stream: {} Probe_Data updates in {} ms".format(
+            size, stream["probe_updates"], CALIBRATION_WINDOW_MS))
+    for size, ops in results.items():
+        print("{:>5} scan jitter during a log download: {} us (main loop), {} us (uasyncio runtime)".format(
+            size, ops["download_periods"]["jitter_max_us"], ops["download_periods_async"]["jitter_max_us"]))
+    for size, ops in results.items():
+        adaptive = ops["adaptive_periods"]
+        print("{:>5} adaptive sampling: heating channels at {:.1f} Hz, {} reads/s (fixed scan: {})".format(
+            size, adaptive["hot_reads"] / (2.0 * ADAPTIVE_PERIODS),
+            adaptive["reads"] // ADAPTIVE_PERIODS, int(size) * 1000 // SCAN_PERIOD_MS))
+    for size, ops in results.items():
+        cycle = ops["measure_cycle"]["virtual_ms"]
+        if cycle > SCAN_PERIOD_MS:
+            print("WARNING: {} TCs measure cycle takes {} ms, longer than the {} ms scan period".format(
+                size, cycle, SCAN_PERIOD_MS))
+
+
+def compare(results, baseline):
+    """Return a list of human-readable regressions against the baseline."""
+    regressions = []
+    for size, ops in results.items():
+        for op, metrics in ops.items():
+            base_metrics = baseline.get(size, {}).get(op)
+            if base_metrics is None:
+                continue
+            for name, value in metrics.items():
+                if name not in base_metrics:
+                    continue
+                rel, absolute = TOLERANCES.get(name, (0.0, 0))
+                if name in HIGHER_IS_BETTER:
+                    regressed = value < base_metrics[name] * (1 - rel) - absolute
+                else:
+                    regressed = value > base_metrics[name] * (1 + rel) + absolute
+                if regressed:
+                    regressions.append("{} TCs {} {}: {} vs baseline {}".format(
+                        size, op, name, value, base_metrics[name]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TC_MANAGER scan benchmarks on the virtual board")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="channel counts to run")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON to compare against")
+    parser.add_argument("--update", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--out", help="save this run's results as JSON")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    errors = check_pcb_expanders()
+    for line in errors:
+        print("CHECK FAILED:", line)
+    results = run(args.sizes)
+    os.chdir(cwd)
+    print_table(results)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("Baseline written to", args.baseline)
+        return 1 if errors else 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at", args.baseline, "- run with --update to create one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline)
+    for line in regressions:
+        print("REGRESSION:", line)
+    return 1 if regressions or errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Machine Module (host stand-in)
+Drop-in replacement for MicroPython's `machine` that drives the virtual board.
+
+Only the parts of the API the V29 firmware uses are provided. Every call is
+forwarded to virtual_board.board() at call time, so objects created before a
+board reset keep working against the new board.
+"""
+import virtual_board
+from virtual_board import MachineReset
+
+
+def _board():
+    return virtual_board.board()
+
+
+# ============ PIN ============
+class Pin:
+    """GPIO handle; several Pin objects for the same name share one line."""
+
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    ALT_OPEN_DRAIN = 4
+    ANALOG = 5
+
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    IRQ_FALLING = 1
+    IRQ_RISING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id.id if isinstance(id, Pin) else id
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        state = _board().pin_state(self.id)
+        if mode != -1:
+            state.mode = mode
+        if pull != -1:
+            state.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def value(self, x=None):
+        if x is None:
+            return _board().pin_state(self.id).level
+        _board().write_pin(self.id, x)
+
+    def __call__(self, x=None):
+        return self.value(x)
+
+    def on(self):
+        _board().write_pin(self.id, 1)
+
+    def off(self):
+        _board().write_pin(self.id, 0)
+
+    def high(self):
+        _board().write_pin(self.id, 1)
+
+    def low(self):
+        _board().write_pin(self.id, 0)
+
+    def name(self):
+        return self.id
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING):
+        state = _board().pin_state(self.id)
+        state.irq_handler = (lambda: handler(self)) if handler else None
+
+    def __repr__(self):
+        return "Pin({})".format(self.id)
+
+
+# ============ SPI ============
+class SPI:
+    """Hardware SPI peripheral on the virtual board."""
+
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, id, baudrate=1000000, polarity=0, phase=0, bits=8, firstbit=MSB, **kwargs):
+        self.id = id
+        self.init(baudrate=baudrate, polarity=polarity, phase=phase)
+
+    def init(self, baudrate=1000000, polarity=0, phase=0, **kwargs):
+        self.baudrate = baudrate
+        self.polarity = polarity
+        self.phase = phase
+        _board().spi(self.id).baudrate = baudrate
+
+    def deinit(self):
+        pass
+
+    def _bus(self):
+        bus = _board().spi(self.id)
+        bus.baudrate = self.baudrate
+        return bus
+
+    def read(self, nbytes, write=0x00):
+        return bytes(self._bus().transfer(None, nbytes))
+
+    def readinto(self, buf, write=0x00):
+        data = self._bus().transfer(None, len(buf))
+        buf[:] = data
+
+    def write(self, buf):
+        self._bus().transfer(bytes(buf), len(buf), read=False)
+
+    def write_readinto(self, write_buf, read_buf):
+        data = self._bus().transfer(bytes(write_buf), len(write_buf))
+        read_buf[:] = data
+
+
+class SoftSPI:
+    """
+    Bit-banged SPI; the bits are clocked out on the pins by the driver (C code on
+    the MCU), so edges are counted but not as Python-level pin writes.
+    """
+
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, baudrate=500000, polarity=0, phase=0, bits=8, firstbit=MSB, sck=None, mosi=None, miso=None):
+        if sck is None or mosi is None or miso is None:
+            raise ValueError("must specify all of sck/mosi/miso")
+        self.baudrate = baudrate
+        self.polarity = polarity
+        self.phase = phase
+        self.firstbit = firstbit
+        self.sck = sck.id
+        self.mosi = mosi.id
+        self.miso = miso.id
+        board = _board()
+        board.pin_state(self.sck).mode = Pin.OUT
+        board.pin_state(self.mosi).mode = Pin.OUT
+        board.pin_state(self.miso).mode = Pin.IN
+
+    def deinit(self):
+        pass
+
+    def _transfer(self, data):
+        board = _board()
+        counters = board.counters
+        counters.spi_transactions += 1
+        counters.spi_bytes_written += len(data)
+        busy = board.costs["spi_call"] + (len(data) * 8 * 1000000) // self.baudrate
+        counters.busy_us += busy
+        board.clock.advance(busy)
+        idle = self.polarity
+        out = bytearray(len(data))
+        for n, byte in enumerate(data):
+            value = 0
+            order = range(7, -1, -1) if self.firstbit == SoftSPI.MSB else range(8)
+            for i in order:
+                board.write_pin(self.mosi, (byte >> i) & 1, python_call=False)
+                board.write_pin(self.sck, 1 - idle, python_call=False)
+                value |= board.pin_state(self.miso).level << i
+                board.write_pin(self.sck, idle, python_call=False)
+            out[n] = value
+        return out
+
+    def write(self, buf):
+        self._transfer(bytes(buf))
+
+    def read(self, nbytes, write=0x00):
+        return bytes(self._transfer(bytes([write]) * nbytes))
+
+    def readinto(self, buf, write=0x00):
+        buf[:] = self._transfer(bytes([write]) * len(buf))
+
+    def write_readinto(self, write_buf, read_buf):
+        read_buf[:] = self._transfer(bytes(write_buf))
+
+
+# ============ UART ============
+class UART:
+    """UART whose transmit log and receive queue live on the virtual board."""
+
+    IRQ_RXIDLE = 0x10
+    IRQ_RX = 0x20
+
+    def __init__(self, id, baudrate=115200, **kwargs):
+        self.id = id
+        self.init(baudrate, **kwargs)
+
+    def init(self, baudrate=115200, **kwargs):
+        self.baudrate = baudrate
+        _board().uart(self.id).baudrate = baudrate
+
+    def deinit(self):
+        pass
+
+    def any(self):
+        return len(_board().uart(self.id).rx)
+
+    def read(self, nbytes=None):
+        port = _board().uart(self.id)
+        if not port.rx:
+            return None
+        if nbytes is None:
+            nbytes = len(port.rx)
+        data = bytes(port.rx[:nbytes])
+        del port.rx[:nbytes]
+        _board().counters.uart_rx_bytes += len(data)
+        return data
+
+    def readinto(self, buf, nbytes=None):
+        data = self.read(len(buf) if nbytes is None else nbytes)
+        if data is None:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        port = _board().uart(self.id)
+        end = port.rx.find(b"\n")
+        if end < 0:
+            return self.read()
+        return self.read(end + 1)
+
+    def write(self, buf):
+        board = _board()
+        port = board.uart(self.id)
+        data = bytes(buf)
+        port.tx += data
+        board.counters.uart_writes += 1
+        board.counters.uart_tx_bytes += len(data)
+        # Blocking write: the call returns once the last stop bit has gone out
+        busy = board.costs["uart_call"] + (len(data) * 10 * 1000000) // self.baudrate
+        board.counters.busy_us += busy
+        board.clock.advance(busy)
+        return len(data)
+
+    def irq(self, handler=None, trigger=IRQ_RXIDLE, hard=False):
+        port = _board().uart(self.id)
+        port.irq_handler = (lambda: handler(self)) if handler else None
+
+
+# ============ TIMER ============
+class Timer:
+    """Soft timer driven by the virtual clock."""
+
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.id = id
+        self._slot = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None, **kwargs):
+        self.deinit()
+        if freq > 0:
+            period_us = 1000000 // freq
+        else:
+            period_us = period * 1000
+        clock = _board().clock
+        self._slot = virtual_board.TimerSlot(self, period_us, mode == Timer.PERIODIC, callback, clock.now_us)
+        clock.add_timer(self._slot)
+
+    def deinit(self):
+        if self._slot is not None:
+            _board().clock.remove_timer(self._slot)
+            self._slot = None
+
+
+# ============ RTC ============
+class RTC:
+    """Real-time clock that follows the virtual clock."""
+
+    def __init__(self, id=0):
+        pass
+
+    def datetime(self, datetimetuple=None):
+        if datetimetuple is None:
+            return _board().datetime()
+        _board().set_datetime(datetimetuple)
+
+
+# ============ MODULE FUNCTIONS ============
+def reset():
+    board = _board()
+    board.resets += 1
+    raise MachineReset()
+
+
+def soft_reset():
+    reset()
+
+
+def unique_id():
+    return b"\x48\x43\x55\x42\x45\x56\x32\x39\x00\x00\x00\x01"
+
+
+def freq():
+    return 168000000
+
+
+def idle():
+    _board().clock.advance(100)
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
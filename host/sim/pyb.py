@@ -0,0 +1,50 @@
+"""
+Pyb Module (host stand-in)
+The handful of `pyb` functions the V29 firmware touches, backed by the virtual board.
+"""
+import time
+
+import virtual_board
+from machine import Pin, SPI, UART, RTC, Timer
+
+
+def main(filename):
+    """boot.py selects the main script; the host harness imports it instead."""
+    virtual_board.board().main_script = filename
+
+
+def delay(ms):
+    time.sleep_ms(ms)
+
+
+def udelay(us):
+    time.sleep_us(us)
+
+
+def millis():
+    return time.ticks_ms()
+
+
+def micros():
+    return time.ticks_us()
+
+
+def elapsed_millis(start):
+    return time.ticks_diff(time.ticks_ms(), start)
+
+
+class LED:
+    """On-board LED; only its state is recorded."""
+
+    def __init__(self, id):
+        self.id = id
+        self.state = 0
+
+    def on(self):
+        self.state = 1
+
+    def off(self):
+        self.state = 0
+
+    def toggle(self):
+        self.state ^= 1
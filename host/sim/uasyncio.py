@@ -0,0 +1,168 @@
+"""
+Uasyncio Module (host stand-in)
+Cooperative scheduler on the virtual board's clock, replacing MicroPython's
+`uasyncio` for V29/runtime.py.
+
+Only the parts of the API the firmware uses are provided: run, create_task,
+sleep, sleep_ms and Event. When every task is waiting, the clock jumps to
+the earliest wake-up (firing any machine.Timer on the way), so a run is
+deterministic and takes no real time. Each task step is charged the board's
+"task_step" cost, the MCU's scheduler overhead.
+"""
+import heapq
+
+import virtual_board
+
+
+def _board():
+    return virtual_board.board()
+
+
+class CancelledError(BaseException):
+    pass
+
+
+# ============ AWAITABLES ============
+class _Sleep:
+    """Yielded by a task to be woken after us microseconds."""
+
+    def __init__(self, us):
+        self.us = us
+
+    def __await__(self):
+        yield self
+
+
+class _Park:
+    """Yielded by a task to wait, unscheduled, in a waiter list."""
+
+    def __init__(self, waiters):
+        self.waiters = waiters
+
+    def __await__(self):
+        yield self
+
+
+def sleep_ms(ms):
+    return _Sleep(max(0, int(ms)) * 1000)
+
+
+def sleep(seconds):
+    return _Sleep(max(0, int(seconds * 1000000)))
+
+
+# ============ TASKS ============
+class Task:
+    def __init__(self, coro):
+        self.coro = coro
+        self.done = False
+        self.result = None
+        self.waiters = []
+        self.cancelled = False
+
+    def cancel(self):
+        if not self.done:
+            self.cancelled = True
+            _schedule(self, _board().clock.now_us)
+
+    def __await__(self):
+        if not self.done:
+            yield _Park(self.waiters)
+        return self.result
+
+
+_queue = []     # (wake_us, seq, task) heap
+_seq = 0
+
+
+def _schedule(task, wake_us):
+    global _seq
+    _seq += 1
+    heapq.heappush(_queue, (wake_us, _seq, task))
+
+
+def _finish(task, result):
+    task.done = True
+    task.result = result
+    now = _board().clock.now_us
+    for waiter in task.waiters:
+        _schedule(waiter, now)
+    task.waiters = []
+
+
+def _step(task):
+    board = _board()
+    board.clock.advance(board.costs["task_step"])
+    try:
+        if task.cancelled:
+            task.cancelled = False
+            request = task.coro.throw(CancelledError())
+        else:
+            request = task.coro.send(None)
+    except StopIteration as e:
+        _finish(task, e.value)
+        return
+    except CancelledError:
+        _finish(task, None)
+        return
+    now = board.clock.now_us
+    if isinstance(request, _Sleep):
+        _schedule(task, now + request.us)
+    elif isinstance(request, _Park):
+        request.waiters.append(task)
+    else:
+        _schedule(task, now)
+
+
+def create_task(coro):
+    task = Task(coro)
+    _schedule(task, _board().clock.now_us)
+    return task
+
+
+def run(coro):
+    """
+    Run coro and every task it creates until coro returns.
+
+    Tasks still waiting when it returns are dropped, as on the MCU.
+    """
+    main = create_task(coro)
+    clock = _board().clock
+    try:
+        while not main.done:
+            if not _queue:
+                raise RuntimeError("every task is waiting and nothing can wake them")
+            wake_us, _, task = heapq.heappop(_queue)
+            if task.done:
+                continue
+            if wake_us > clock.now_us:
+                clock.advance(wake_us - clock.now_us)
+            _step(task)
+    finally:
+        del _queue[:]
+    return main.result
+
+
+# ============ EVENT ============
+class Event:
+    def __init__(self):
+        self.state = False
+        self.waiting = []
+
+    def is_set(self):
+        return self.state
+
+    def set(self):
+        self.state = True
+        now = _board().clock.now_us
+        for task in self.waiting:
+            _schedule(task, now)
+        self.waiting = []
+
+    def clear(self):
+        self.state = False
+
+    async def wait(self):
+        if not self.state:
+            await _Park(self.waiting)
+        return True
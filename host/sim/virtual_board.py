@@ -0,0 +1,710 @@
+"""
+Virtual Board Module
+Host-side model of the Heat Cube hardware so the V29 firmware runs under CPython.
+
+The `machine` and `pyb` stand-ins in this folder forward every pin, SPI, UART,
+timer and RTC call to the board defined here. The board models:
+
+- a virtual clock that only advances on sleeps and modelled bus/pin time,
+- a 74HC595 chain whose latched outputs drive the MAX31855 !CS lines,
+- an array of MAX31855 chips with a ~100 ms continuous conversion cycle,
+- the PCB enable lines that gate each board's MISO buffer, on MCU pins or on
+  the outputs of MCP23S17 expanders,
+- counters for GPIO writes/edges, SPI bytes, UART bytes and sleep time.
+
+Usage:
+    sys.path[:0] = [SIM_DIR, FIRMWARE_DIR]
+    import virtual_board
+    board = virtual_board.reset(num_tcs=64)
+    import state_machine        # runs InitState against the virtual board
+"""
+import math
+import os
+import sys
+import time
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+FIRMWARE_DIR = os.path.join(os.path.dirname(os.path.dirname(SIM_DIR)), "V29")
+
+# ============ CONFIGURATION ============
+TICKS_PERIOD = 1 << 30          # MicroPython ticks wrap at 2**30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD // 2
+
+CONVERSION_US = 100000          # MAX31855 worst-case conversion time
+
+# Pin names used by state_machine.System for the shift register chain
+CHAIN_PINS = {
+    "ser": "PF12",
+    "srclk": "PE14",
+    "rclk": "PF15",
+    "oe": "PF13",
+    "srclr": "PF14",
+}
+PCB_ENABLE_PINS = ("PG0", "PG1")
+
+# Levels seen on input pins that nothing drives (VBUS high = USB connected)
+DEFAULT_INPUTS = {"PA9": 1, "PA0": 0, "PC13": 0}
+
+# Modelled cost of work that is not a sleep, in microseconds
+DEFAULT_COSTS = {
+    "pin_write": 2,         # One Python-level Pin call on the MCU
+    "spi_call": 8,          # Fixed overhead of one SPI method call
+    "uart_call": 10,        # Fixed overhead of one UART write call
+    "task_step": 20,        # uasyncio switching to a task and back
+}
+
+# MAX31855 fault bits (D2..D0)
+FAULT_OC = 0x1
+FAULT_SCG = 0x2
+FAULT_SCV = 0x4
+
+
+# ============ VIRTUAL CLOCK ============
+class VirtualClock:
+    """
+    Monotonic microsecond clock with soft timers.
+
+    Time only moves when the firmware sleeps or when modelled work (bus
+    transfers, pin writes) is charged to it, so every run is deterministic.
+    """
+
+    def __init__(self, counters):
+        self.now_us = 0
+        self.counters = counters
+        self.timers = []
+        self._firing = False
+
+    def advance(self, us):
+        """Move time forward by us microseconds, firing any due timers."""
+        target = self.now_us + int(us)
+        if self._firing:
+            self.now_us = target
+            return
+        while True:
+            due = None
+            for timer in self.timers:
+                if timer.due_us is not None and timer.due_us <= target:
+                    if due is None or timer.due_us < due.due_us:
+                        due = timer
+            if due is None:
+                break
+            self.now_us = max(self.now_us, due.due_us)
+            due.due_us = due.due_us + due.period_us if due.periodic else None
+            self._firing = True
+            try:
+                due.callback(due.owner)
+            finally:
+                self._firing = False
+        self.now_us = max(self.now_us, target)
+
+    def sleep_us(self, us):
+        self.counters.sleep_us += int(us)
+        self.counters.sleep_calls += 1
+        self.advance(us)
+
+    def add_timer(self, timer):
+        if timer not in self.timers:
+            self.timers.append(timer)
+
+    def remove_timer(self, timer):
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+
+class TimerSlot:
+    """Clock-side state of one machine.Timer."""
+
+    def __init__(self, owner, period_us, periodic, callback, now_us):
+        self.owner = owner
+        self.period_us = period_us
+        self.periodic = periodic
+        self.callback = callback
+        self.due_us = now_us + period_us
+
+
+# ============ COUNTERS ============
+class Counters:
+    """Running totals of simulated hardware activity."""
+
+    FIELDS = (
+        "gpio_writes", "gpio_edges", "spi_transactions", "spi_bytes_read",
+        "spi_bytes_written", "uart_tx_bytes", "uart_rx_bytes", "uart_writes",
+        "sleep_us", "sleep_calls", "busy_us", "max31855_reads",
+        "max31855_stale_reads", "bus_contention",
+    )
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, 0)
+
+    def snapshot(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @staticmethod
+    def delta(before, after):
+        return {name: after[name] - before[name] for name in after}
+
+
+# ============ PINS ============
+class PinState:
+    """Electrical state of one named MCU pin, shared by every Pin handle."""
+
+    def __init__(self, name, level=0):
+        self.name = name
+        self.mode = None
+        self.pull = None
+        self.level = level
+        self.listeners = []
+        self.irq_handler = None
+
+
+# ============ 74HC595 CHAIN ============
+class Virtual74HC595Chain:
+    """
+    Chain of 74HC595 registers whose latched outputs are the MAX31855 !CS lines.
+
+    Stage 0 is the output nearest SER; each SRCLK rising edge moves every stage
+    one step further along the chain. OE high puts all outputs in Hi-Z, which the
+    !CS pull-ups read as high (no chip selected).
+    """
+
+    def __init__(self, board, length, pins):
+        self.board = board
+        self.length = length
+        self.mask = (1 << length) - 1
+        self.pins = pins
+        self.shift = 0
+        self.latched = 0
+        self.low_mask = 0
+        for role, name in pins.items():
+            board.pin_state(name).listeners.append((self, role))
+
+    def on_edge(self, role, level):
+        ser = self.board.pin_state(self.pins["ser"]).level
+        srclr = self.board.pin_state(self.pins["srclr"]).level
+        if role == "srclr" and not level:
+            self.shift = 0
+        elif role == "srclk" and level and srclr:
+            self.shift = ((self.shift << 1) | (1 if ser else 0)) & self.mask
+        elif role == "rclk" and level:
+            self.latched = self.shift
+        elif role not in ("oe",):
+            return
+        self._update_outputs()
+
+    def _update_outputs(self):
+        oe = self.board.pin_state(self.pins["oe"]).level
+        low_mask = 0 if oe else (~self.latched & self.mask)
+        changed = low_mask ^ self.low_mask
+        self.low_mask = low_mask
+        while changed:
+            bit = changed & -changed
+            slot = bit.bit_length() - 1
+            changed ^= bit
+            chip = self.board.chips.get(slot)
+            if chip is not None:
+                chip.set_cs(0 if low_mask & bit else 1)
+
+    def selected_slots(self):
+        """Return the chain positions whose !CS output is currently low."""
+        slots = []
+        low = self.low_mask
+        while low:
+            bit = low & -low
+            slots.append(bit.bit_length() - 1)
+            low ^= bit
+        return slots
+
+
+# ============ MCP23S17 ============
+class VirtualMCP23S17:
+    """
+    One MCP23S17 port expander on an SPI bus (IOCON.BANK = 0 register map).
+
+    A transfer is the opcode, the register, then data bytes to or from
+    consecutive registers (sequential mode). Until IOCON.HAEN is set the
+    expander answers to every hardware address. Outputs follow OLAT where
+    IODIR is 0, inputs read as pulled high. Writing GPIO writes OLAT, and
+    INTF/INTCAP ignore writes.
+    """
+
+    IODIRA = 0x00
+    IOCON = 0x0A
+    INTFA = 0x0E
+    INTCAPB = 0x11
+    GPIOA = 0x12
+    GPIOB = 0x13
+    OLATA = 0x14
+    IOCON_HAEN = 0x08
+
+    def __init__(self, board, address, cs_pin):
+        self.board = board
+        self.address = address
+        self.regs = bytearray(0x16)
+        self.regs[self.IODIRA] = 0xFF       # Power-on: every pin an input
+        self.regs[self.IODIRA + 1] = 0xFF
+        self.selected = False
+        self.pos = 0
+        self.mine = False
+        self.write = False
+        self.reg = 0
+        self.writes = 0
+        self.reads = 0
+        board.pin_state(cs_pin).listeners.append((self, "cs"))
+
+    def on_edge(self, role, level):
+        self.selected = not level
+        self.pos = 0
+
+    def _read_reg(self, reg):
+        if reg == self.GPIOA or reg == self.GPIOB:
+            port = reg - self.GPIOA
+            value = 0
+            for bit in range(8):
+                value |= self.output(port * 8 + bit) << bit
+            return value
+        return self.regs[reg] if reg < len(self.regs) else 0
+
+    def drive(self):
+        """Byte put on MISO for the next clocked byte, None when not driving."""
+        if self.selected and self.mine and not self.write and self.pos >= 2:
+            return self._read_reg(self.reg)
+        return None
+
+    def clock_in(self, byte):
+        if not self.selected:
+            return
+        if self.pos == 0:
+            haen = self.regs[self.IOCON] & self.IOCON_HAEN
+            self.mine = (byte & 0xF0) == 0x40 and (not haen or (byte >> 1) & 7 == self.address)
+            self.write = not byte & 1
+        elif self.pos == 1:
+            self.reg = byte
+        elif self.mine:
+            if self.write:
+                reg = self.reg
+                if reg == self.GPIOA or reg == self.GPIOB:
+                    reg += 2
+                if reg < len(self.regs) and not self.INTFA <= reg <= self.INTCAPB:
+                    self.regs[reg] = byte
+                    if reg == self.IOCON or reg == self.IOCON + 1:
+                        self.regs[self.IOCON] = self.regs[self.IOCON + 1] = byte    # IOCON is mapped at 0x0A and 0x0B
+                if self.pos == 2:
+                    self.writes += 1
+            elif self.pos == 2:
+                self.reads += 1
+            self.reg += 1
+        self.pos += 1
+
+    def output(self, bit):
+        """Level of output bit (0-7 port A, 8-15 port B)."""
+        port = bit >> 3
+        mask = 1 << (bit & 7)
+        if self.regs[self.IODIRA + port] & mask:
+            return 1
+        return 1 if self.regs[self.OLATA + port] & mask else 0
+
+
+# ============ MAX31855 ============
+def encode_max31855(tc_c, cj_c, fault=0):
+    """Pack a probe and cold-junction temperature into a MAX31855 32-bit word."""
+    tc = int(round(tc_c * 4)) & 0x3FFF
+    cj = int(round(cj_c * 16)) & 0xFFF
+    word = (tc << 18) | (cj << 4)
+    if fault:
+        word |= 0x10000 | (fault & 0x7)
+    return word
+
+
+class VirtualMAX31855:
+    """
+    One MAX31855 converter at a chain position.
+
+    Pulling !CS low stops the conversion in progress and freezes the output
+    register; releasing it starts a new conversion that takes CONVERSION_US.
+    A read before that conversion finished returns the previous result.
+    """
+
+    def __init__(self, board, slot, temperature=None, cold_junction=22.0, fault=0):
+        self.board = board
+        self.slot = slot
+        self.temperature = temperature if temperature is not None else self._default_temperature
+        self.cold_junction = cold_junction
+        self.fault = fault
+        self.cs = 1
+        self.conversion_start_us = -CONVERSION_US
+        self.word = None
+        self.out = b"\x00\x00\x00\x00"
+        self.out_pos = 0
+        self.reads = 0
+        self.stale_reads = 0
+
+    def _default_temperature(self, t_s):
+        base = 20.0 + 0.25 * ((self.slot * 7) % 5)
+        return base + 0.5 * math.sin(2 * math.pi * t_s / 600.0 + self.slot)
+
+    def sample(self, t_us):
+        t_s = t_us / 1e6
+        tc_c = self.temperature(t_s) if callable(self.temperature) else self.temperature
+        cj_c = self.cold_junction(t_s) if callable(self.cold_junction) else self.cold_junction
+        return encode_max31855(tc_c, cj_c, self.fault)
+
+    def set_cs(self, level):
+        if level == self.cs:
+            return
+        now = self.board.clock.now_us
+        self.cs = level
+        if level:
+            self.conversion_start_us = now
+            return
+        done_us = self.conversion_start_us + CONVERSION_US
+        self.reads += 1
+        self.board.counters.max31855_reads += 1
+        if now >= done_us or self.word is None:
+            self.word = self.sample(min(now, done_us))
+        else:
+            self.stale_reads += 1
+            self.board.counters.max31855_stale_reads += 1
+        self.out = self.word.to_bytes(4, "big")
+        self.out_pos = 0
+
+    def clock_out(self):
+        value = self.out[self.out_pos] if self.out_pos < 4 else 0
+        self.out_pos += 1
+        return value
+
+
+# ============ SPI BUS ============
+class VirtualSPIBus:
+    """MISO/MOSI lines of one SPI peripheral and the devices hanging off it."""
+
+    def __init__(self, board, bus_id):
+        self.board = board
+        self.bus_id = bus_id
+        self.baudrate = 1000000
+        self.devices = []
+
+    def transfer(self, write_data, nbytes, read=True):
+        """
+        Clock nbytes over the bus, shifting write_data (or 0x00) out on MOSI.
+
+        Returns the bytes seen on MISO: the AND of every chip that has !CS low
+        and whose PCB buffer is enabled, or 0x00 when nothing drives the line.
+        """
+        board = self.board
+        counters = board.counters
+        counters.spi_transactions += 1
+        if read:
+            counters.spi_bytes_read += nbytes
+        if write_data is not None:
+            counters.spi_bytes_written += nbytes
+        busy = board.costs["spi_call"] + (nbytes * 8 * 1000000) // self.baudrate
+        counters.busy_us += busy
+        board.clock.advance(busy)
+        drivers = board.miso_drivers()
+        if len(drivers) > 1:
+            counters.bus_contention += 1
+        board.last_read_slots = [chip.slot for chip in drivers]
+        if board.trace_reads is not None:
+            board.trace_reads.append((board.clock.now_us, tuple(board.last_read_slots)))
+        out = bytearray(nbytes)
+        for i in range(nbytes):
+            value = 0xFF if drivers else 0x00
+            for chip in drivers:
+                value &= chip.clock_out()
+            for device in self.devices:
+                driven = device.drive()
+                if driven is not None:
+                    value = driven & (value if drivers else 0xFF)
+            out[i] = value
+            if write_data is not None:
+                for device in self.devices:
+                    device.clock_in(write_data[i])
+        return out
+
+
+# ============ UART ============
+class VirtualUART:
+    """Host side of one UART: bytes the MCU wrote and bytes queued for it."""
+
+    def __init__(self, board, uart_id):
+        self.board = board
+        self.uart_id = uart_id
+        self.baudrate = 115200
+        self.tx = bytearray()
+        self.rx = bytearray()
+        self.irq_handler = None
+
+    def host_write(self, data):
+        """Queue bytes as if the host had sent them."""
+        if isinstance(data, str):
+            data = data.encode()
+        self.rx += data
+        if self.irq_handler is not None:
+            self.irq_handler()
+
+    def host_read(self):
+        """Drain and return everything the MCU has transmitted."""
+        data = bytes(self.tx)
+        self.tx = bytearray()
+        return data
+
+    def host_lines(self):
+        """Drain the transmit log and return it as decoded lines."""
+        return [line for line in self.host_read().decode(errors="replace").split("\n") if line]
+
+
+# ============ BOARD ============
+class VirtualBoard:
+    """
+    The complete virtual Heat Cube.
+
+    Args:
+        num_tcs: Number of populated MAX31855 chips, placed at chain slots 0..num_tcs-1
+        chain_length: Number of 74HC595 outputs in the chip-select chain
+        tcs_per_pcb: Thermocouples per PCB (one MISO buffer per PCB)
+        pcb_enable_pins: Active-low MISO buffer enables; PCBs past the end of this
+            tuple are strapped enabled
+        pcb_expander_cs: !CS pin of MCP23S17 expanders on SPI bus 1 whose outputs are
+            the PCB enables instead (16 PCBs each), None for pcb_enable_pins
+        pcb_expanders: Number of expanders on pcb_expander_cs, at addresses 0, 1, ...
+        slots: Explicit list of populated chain slots (overrides num_tcs)
+        start_datetime: RTC start as (year, month, day, hour, minute, second)
+    """
+
+    def __init__(self, num_tcs=16, chain_length=256, tcs_per_pcb=16,
+                 pcb_enable_pins=PCB_ENABLE_PINS, slots=None,
+                 start_datetime=(2026, 2, 3, 12, 0, 0), costs=None,
+                 pcb_expander_cs=None, pcb_expanders=1):
+        self.counters = Counters()
+        self.clock = VirtualClock(self.counters)
+        self.costs = dict(DEFAULT_COSTS)
+        if costs:
+            self.costs.update(costs)
+        self.pins = {}
+        self.spi_buses = {}
+        self.uarts = {}
+        self.start_datetime = start_datetime
+        self.rtc_offset_s = 0
+        self.tcs_per_pcb = tcs_per_pcb
+        self.pcb_enable_pins = tuple(pcb_enable_pins)
+        self.trace_reads = None
+        self.last_read_slots = []
+        self.resets = 0
+        self.chips = {}
+        if slots is None:
+            slots = range(num_tcs)
+        for slot in slots:
+            self.chips[slot] = VirtualMAX31855(self, slot)
+        self.chain = Virtual74HC595Chain(self, chain_length, CHAIN_PINS)
+        self.expanders = []
+        if pcb_expander_cs is not None:
+            self.pcb_enable_pins = ()
+            for address in range(pcb_expanders):
+                expander = VirtualMCP23S17(self, address, pcb_expander_cs)
+                self.expanders.append(expander)
+                self.spi(1).devices.append(expander)
+
+    # ---------- pins ----------
+    def pin_state(self, name):
+        state = self.pins.get(name)
+        if state is None:
+            state = PinState(name, DEFAULT_INPUTS.get(name, 0))
+            self.pins[name] = state
+        return state
+
+    def write_pin(self, name, level, python_call=True):
+        """Drive an output pin; python_call=False for edges made by C drivers."""
+        state = self.pin_state(name)
+        level = 1 if level else 0
+        if python_call:
+            self.counters.gpio_writes += 1
+            self.counters.busy_us += self.costs["pin_write"]
+            self.clock.advance(self.costs["pin_write"])
+        if level == state.level:
+            return
+        state.level = level
+        self.counters.gpio_edges += 1
+        for listener, role in state.listeners:
+            listener.on_edge(role, level)
+
+    def set_input(self, name, level):
+        """Drive an input pin from the outside world (e.g. unplug USB)."""
+        state = self.pin_state(name)
+        old = state.level
+        state.level = 1 if level else 0
+        if state.irq_handler is not None and old != state.level:
+            state.irq_handler()
+
+    # ---------- buses ----------
+    def spi(self, bus_id):
+        bus = self.spi_buses.get(bus_id)
+        if bus is None:
+            bus = VirtualSPIBus(self, bus_id)
+            self.spi_buses[bus_id] = bus
+        return bus
+
+    def uart(self, uart_id):
+        uart = self.uarts.get(uart_id)
+        if uart is None:
+            uart = VirtualUART(self, uart_id)
+            self.uarts[uart_id] = uart
+        return uart
+
+    def pcb_enabled(self, pcb):
+        if self.expanders:
+            if pcb >= 16 * len(self.expanders):
+                return True
+            return self.expanders[pcb // 16].output(pcb % 16) == 0
+        if pcb >= len(self.pcb_enable_pins):
+            return True
+        return self.pin_state(self.pcb_enable_pins[pcb]).level == 0
+
+    def miso_drivers(self):
+        drivers = []
+        for slot in self.chain.selected_slots():
+            chip = self.chips.get(slot)
+            if chip is not None and self.pcb_enabled(slot // self.tcs_per_pcb):
+                drivers.append(chip)
+        return drivers
+
+    # ---------- RTC ----------
+    def datetime(self):
+        y, mo, d, h, mi, s = self.start_datetime
+        base = time.mktime((y, mo, d, h, mi, s, 0, 0, -1))
+        now_us = self.clock.now_us
+        lt = time.localtime(base + self.rtc_offset_s + now_us // 1000000)
+        subsec = 255 - ((now_us // 1000) % 1000) * 256 // 1000
+        return (lt.tm_year, lt.tm_mon, lt.tm_mday, lt.tm_wday + 1,
+                lt.tm_hour, lt.tm_min, lt.tm_sec, subsec)
+
+    def set_datetime(self, dt):
+        y, mo, d, _, h, mi, s = dt[:7]
+        self.start_datetime = (y, mo, d, h, mi, s)
+        self.rtc_offset_s = -(self.clock.now_us // 1000000)
+
+    # ---------- reporting ----------
+    def snapshot(self):
+        snap = self.counters.snapshot()
+        snap["now_us"] = self.clock.now_us
+        return snap
+
+
+class MachineReset(Exception):
+    """Raised by machine.reset() so a host harness can observe the reboot."""
+
+
+# ============ MODULE STATE ============
+_board = None
+
+
+def board():
+    """Return the active virtual board, creating a default one if needed."""
+    global _board
+    if _board is None:
+        _board = VirtualBoard()
+    return _board
+
+
+def reset(**kwargs):
+    """Replace the active board with a fresh one built from kwargs."""
+    global _board
+    _board = VirtualBoard(**kwargs)
+    return _board
+
+
+# ============ MICROPYTHON TIME FUNCTIONS ============
+def sleep_ms(ms):
+    board().clock.sleep_us(int(ms) * 1000)
+
+
+def sleep_us(us):
+    board().clock.sleep_us(us)
+
+
+def ticks_ms():
+    return (board().clock.now_us // 1000) & TICKS_MAX
+
+
+def ticks_us():
+    return board().clock.now_us & TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(end, start):
+    return ((end - start + TICKS_HALF) & TICKS_MAX) - TICKS_HALF
+
+
+def install():
+    """
+    Add the MicroPython-only functions to CPython's time module and put the
+    simulator and firmware folders on sys.path.
+    """
+    for func in (sleep_ms, sleep_us, ticks_ms, ticks_us, ticks_cpu, ticks_add, ticks_diff):
+        setattr(time, func.__name__, func)
+    for path in (FIRMWARE_DIR, SIM_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def unload_firmware():
+    """Drop firmware modules from sys.modules so the next import re-runs them."""
+    for name in list(sys.modules):
+        module = sys.modules[name]
+        path = getattr(module, "__file__", None) or ""
+        if os.path.dirname(os.path.abspath(path)) == FIRMWARE_DIR:
+            del sys.modules[name]
+
+
+def run_for(step, duration_ms, idle_us=100):
+    """
+    Call step() repeatedly until duration_ms of virtual time has passed.
+
+    Iterations that do not consume any virtual time are charged idle_us so a
+    polling main loop still moves the clock forward.
+    """
+    clock = board().clock
+    end = clock.now_us + duration_ms * 1000
+    while clock.now_us < end:
+        before = clock.now_us
+        step()
+        if clock.now_us == before:
+            clock.advance(idle_us)
+
+
+install()
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    # Re-import by name so this script and the machine stand-in share one board
+    import virtual_board
+
+    parser = argparse.ArgumentParser(description="Boot the V29 firmware on the virtual board")
+    parser.add_argument("--tcs", type=int, default=16, help="populated thermocouples")
+    parser.add_argument("--seconds", type=float, default=3.0, help="virtual seconds in measure mode")
+    args = parser.parse_args()
+
+    sim_board = virtual_board.reset(num_tcs=args.tcs)
+    os.chdir(tempfile.mkdtemp(prefix="heat_cube_sd_"))
+    boot = sim_board.snapshot()
+    import state_machine
+    print("Boot:", Counters.delta(boot, sim_board.snapshot()))
+
+    uart = sim_board.uart(2)
+    uart.host_write("measure\n")
+    before = sim_board.snapshot()
+    virtual_board.run_for(state_machine.system.run, int(args.seconds * 1000))
+    print("Measure:", Counters.delta(before, sim_board.snapshot()))
+    for line in uart.host_lines()[-5:]:
+        print("UART:", line)
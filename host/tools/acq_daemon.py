@@ -0,0 +1,647 @@
+"""
+Acquisition Daemon Module
+Host-side recorder for the MCU's text stream: reads the UART at full rate and
+stores every sample in columnar chunk files, independent of the web UI.
+
+On start the daemon sends "status" (the reply's state and "Active TCs:[...]"
+are kept as events) and, with --measure, "measure". After that it only
+listens. Each line is parsed in place in the receive buffer: the buffer is
+compacted once per read rather than once per line, and only the numeric
+fields of a line are sliced out, so measurement lines are never decoded to
+str.
+
+    TC<id>: <temp>[ @<ticks_ms>]        -> samples table (FAULT_OC|SCG|SCV -> NaN + fault bits)
+    Probe_Data<id>, Ref Data: <p>,<r>   -> probe table
+    anything else                       -> events.txt
+
+The tables are written as chunk files in a new run directory under --out-dir:
+
+    samples-000001.hcc   host_s, scan, channel, mcu_ms, value, fault
+    probe-000001.hcc     host_s, channel, probe, ref
+    events.txt           <host_s>\\t<line>
+
+A chunk is sealed after --chunk-rows rows or --chunk-seconds, whichever
+comes first, and written under a temporary name then renamed, so a reader
+never sees half a chunk. host_s is the host time of the read that completed
+the line, mcu_ms the "@<ticks_ms>" of adaptive sampling (-1 without), and
+scan counts runs of rising channel numbers. Fault bits match V29/health.py
+(1 OC, 2 SCG, 4 SCV), with 0x80 for a fault of unknown type.
+
+Backpressure: the reader never waits for the disk. Sealed chunks go into a
+queue of at most --max-pending, and one worker thread writes them. If the
+disk falls that far behind, the newest sealed chunk is dropped and counted
+(dropped_chunks, dropped_rows in the summary), like the MCU's transmit queue
+drops whole scans.
+
+The daemon expects FRAME_MODE:TEXT (the default); binary frames are skipped
+as overlong lines. On POSIX the port is opened directly (raw termios, read
+from the event loop), so it also runs on a pseudo-terminal without pyserial.
+Elsewhere pyserial is read from a thread.
+
+Usage:
+    python host/tools/acq_daemon.py --port /dev/ttyACM0 --out-dir TemperatureData/acq --measure
+    python host/tools/acq_daemon.py --port COM5 --record raw.txt        # also keep the raw stream
+    python host/tools/acq_daemon.py --replay raw.txt --out-dir /tmp/acq  # feed a pty from a recording
+    python host/tools/acq_daemon.py --dump /tmp/acq/2026-01-27_09-00-00/samples-000001.hcc
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import math
+import os
+import signal
+import struct
+import sys
+import time
+from array import array
+
+# ============ CONFIGURATION ============
+DEFAULT_BAUD = 115200
+RX_READ = 65536             # Largest single read from the port
+MAX_LINE = 4096             # Longer runs of bytes without a newline are dropped (binary frames, noise)
+CHUNK_ROWS = 65536          # Rows per chunk file
+CHUNK_SECONDS = 10.0        # Longest time a row waits in memory before its chunk is sealed
+MAX_PENDING = 16            # Sealed chunks waiting for the disk before new ones are dropped
+REPLAY_IDLE = 0.5           # Seconds --replay keeps reading after the recording ends
+
+FAULT_OC = 0x01             # Must match V29/health.py
+FAULT_SCG = 0x02
+FAULT_SCV = 0x04
+FAULT_UNKNOWN = 0x80        # "FAULT" without a type
+FAULT_CODES = {b"_OC": FAULT_OC, b"_SCG": FAULT_SCG, b"_SCV": FAULT_SCV, b"": FAULT_UNKNOWN}
+
+SAMPLE_COLUMNS = (("host_s", "d"), ("scan", "I"), ("channel", "H"),
+                  ("mcu_ms", "q"), ("value", "f"), ("fault", "B"))
+PROBE_COLUMNS = (("host_s", "d"), ("channel", "H"), ("probe", "f"), ("ref", "f"))
+
+# Chunk file: header, one descriptor per column, then each column's values in turn (little-endian)
+CHUNK_MAGIC = b"HCAC"
+CHUNK_VERSION = 1
+CHUNK_HEADER = struct.Struct("<4sBBHI")     # magic, version, columns, reserved, rows
+COLUMN_HEADER = struct.Struct("<12sc")      # name, array typecode
+
+NAN = float("nan")
+
+
+class ChunkFormatError(ValueError):
+    """The file is not a valid chunk file."""
+
+
+def new_table(columns):
+    """An empty table: {name: array} in column order."""
+    return {name: array(typecode) for name, typecode in columns}
+
+
+def table_rows(table):
+    return len(next(iter(table.values())))
+
+
+def write_chunk(path, table):
+    """Write a table to path, through a temporary file so the chunk appears whole."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(CHUNK_HEADER.pack(CHUNK_MAGIC, CHUNK_VERSION, len(table), 0, table_rows(table)))
+        for name, column in table.items():
+            f.write(COLUMN_HEADER.pack(name.encode(), column.typecode.encode()))
+        for column in table.values():
+            if sys.byteorder == "big":
+                column = array(column.typecode, column)
+                column.byteswap()
+            column.tofile(f)
+    os.replace(tmp, path)
+
+
+def read_chunk(path):
+    """
+    Read a chunk file.
+
+    Returns:
+        {name: array} in column order
+
+    Raises:
+        ChunkFormatError: if the file is not a chunk file or is truncated
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < CHUNK_HEADER.size:
+        raise ChunkFormatError("{}: file too short for a header".format(path))
+    magic, version, count, _, rows = CHUNK_HEADER.unpack_from(data)
+    if magic != CHUNK_MAGIC:
+        raise ChunkFormatError("{}: not a chunk file".format(path))
+    if version != CHUNK_VERSION:
+        raise ChunkFormatError("{}: unsupported chunk version {}".format(path, version))
+    pos = CHUNK_HEADER.size
+    columns = []
+    for _ in range(count):
+        name, typecode = COLUMN_HEADER.unpack_from(data, pos)
+        columns.append((name.rstrip(b"\0").decode(), typecode.decode()))
+        pos += COLUMN_HEADER.size
+    table = {}
+    for name, typecode in columns:
+        column = array(typecode)
+        end = pos + rows * column.itemsize
+        if end > len(data):
+            raise ChunkFormatError("{}: truncated column {}".format(path, name))
+        column.frombytes(data[pos:end])
+        if sys.byteorder == "big":
+            column.byteswap()
+        table[name] = column
+        pos = end
+    return table
+
+
+# ============ LINE PARSER CLASS ============
+class LineParser:
+    """
+    Incremental parser of the MCU's text stream into sample, probe and event tables.
+
+    Lines are parsed where they lie in the receive buffer and the consumed
+    bytes are removed once per feed(). Lines that look like measurement data
+    but do not parse are counted in `bad_lines` and kept as events.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.samples = new_table(SAMPLE_COLUMNS)
+        self.probe = new_table(PROBE_COLUMNS)
+        self.events = []                # (host_s, line) of every other line
+        self.active = None              # Channel list of the last "Active TCs:[...]"
+        self.state = None               # Last state name sent by the MCU
+        self.scan = 0
+        self.last_channel = 0
+
+        self.lines = 0
+        self.sample_rows = 0
+        self.faults = 0
+        self.probe_rows = 0
+        self.bad_lines = 0
+        self.overflows = 0              # Runs of MAX_LINE bytes without a newline dropped
+
+    def feed(self, data, host_s):
+        """Parse the complete lines in the buffer after adding data, host_s being the time it was read."""
+        buf = self.buffer
+        buf += data
+        find = buf.find
+        start = 0
+        while True:
+            end = find(b"\n", start)
+            if end < 0:
+                break
+            self._line(buf, start, end, host_s)
+            start = end + 1
+        if start:
+            del buf[:start]
+        if len(buf) > MAX_LINE:
+            del buf[:]
+            self.overflows += 1
+
+    def _line(self, buf, start, end, host_s):
+        if end > start and buf[end - 1] == 0x0D:
+            end -= 1
+        if end == start:
+            return
+        self.lines += 1
+        if buf.startswith(b"TC", start, end) and self._sample(buf, start, end, host_s):
+            return
+        if buf.startswith(b"Probe_Data", start, end) and self._probe_data(buf, start, end, host_s):
+            return
+        self._event(bytes(buf[start:end]).decode("utf-8", "replace"), host_s)
+
+    def _sample(self, buf, start, end, host_s):
+        """TC<id>: <temp>[ @<ms>], TC<id>: FAULT_<type>[ @<ms>]"""
+        colon = buf.find(b":", start, end)
+        if colon < 0:
+            return False
+        at = buf.find(b"@", colon, end)
+        value_end = end if at < 0 else at
+        try:
+            channel = int(buf[start + 2:colon])
+            mcu_ms = -1 if at < 0 else int(buf[at + 1:end])
+            fault_at = buf.find(b"FAULT", colon, value_end)
+            if fault_at < 0:
+                value = float(buf[colon + 1:value_end])
+                fault = 0
+            else:
+                value = NAN
+                fault = FAULT_CODES[bytes(buf[fault_at + 5:value_end]).strip()]
+        except (ValueError, KeyError):
+            self.bad_lines += 1
+            return False
+        if channel <= self.last_channel:
+            self.scan += 1
+        self.last_channel = channel
+
+        table = self.samples
+        table["host_s"].append(host_s)
+        table["scan"].append(self.scan)
+        table["channel"].append(channel)
+        table["mcu_ms"].append(mcu_ms)
+        table["value"].append(value)
+        table["fault"].append(fault)
+        self.sample_rows += 1
+        if fault:
+            self.faults += 1
+        return True
+
+    def _probe_data(self, buf, start, end, host_s):
+        """Probe_Data<id>, Ref Data: <probe>,<ref>"""
+        comma = buf.find(b",", start, end)
+        colon = buf.find(b":", comma, end)
+        split = buf.find(b",", colon, end)
+        if comma < 0 or colon < 0 or split < 0:
+            self.bad_lines += 1
+            return False
+        try:
+            channel = int(buf[start + 10:comma])
+            probe = float(buf[colon + 1:split])
+            ref = float(buf[split + 1:end])
+        except ValueError:
+            self.bad_lines += 1
+            return False
+        table = self.probe
+        table["host_s"].append(host_s)
+        table["channel"].append(channel)
+        table["probe"].append(probe)
+        table["ref"].append(ref)
+        self.probe_rows += 1
+        return True
+
+    def _event(self, line, host_s):
+        if line.startswith("Active TCs:"):
+            body = line.partition(":")[2].strip("[] ")
+            try:
+                self.active = [int(c) for c in body.split(",") if c.strip()]
+            except ValueError:
+                pass
+        elif line.endswith("State") and line.isalpha():
+            self.state = line
+        self.events.append((host_s, line))
+
+    def take(self, kind):
+        """Hand over the rows of one table ("samples", "probe" or "events"), starting a new one."""
+        if kind == "samples":
+            table, self.samples = self.samples, new_table(SAMPLE_COLUMNS)
+        elif kind == "probe":
+            table, self.probe = self.probe, new_table(PROBE_COLUMNS)
+        else:
+            table, self.events = self.events, []
+        return table
+
+
+# ============ PORT CLASSES ============
+class PosixPort:
+    """Serial device (or pseudo-terminal) opened non-blocking in raw mode, read from the event loop."""
+
+    def __init__(self, path, baudrate=DEFAULT_BAUD):
+        import termios
+        import tty
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            tty.setraw(self.fd)
+            attrs = termios.tcgetattr(self.fd)
+            speed = getattr(termios, "B{}".format(baudrate))
+            attrs[4] = attrs[5] = speed
+            termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def fileno(self):
+        return self.fd
+
+    def read(self, n):
+        """Return the bytes waiting (up to n), None if there are none, b"" once the device is gone."""
+        try:
+            return os.read(self.fd, n)
+        except BlockingIOError:
+            return None
+        except OSError:
+            return b""  # EIO: the device was unplugged or the pty master closed
+
+    def write(self, data):
+        os.write(self.fd, data)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SerialPort:
+    """pyserial port, read from a worker thread where the event loop cannot watch the device."""
+
+    def __init__(self, path, baudrate=DEFAULT_BAUD):
+        import serial  # Only needed when the device cannot be opened directly
+        self.serial = serial.Serial(path, baudrate, timeout=0.05)
+
+    def fileno(self):
+        return None
+
+    def read(self, n):
+        """Wait up to the timeout and return the bytes received (up to n), None if there were none."""
+        data = self.serial.read(min(n, max(1, self.serial.in_waiting)))
+        return data or None
+
+    def write(self, data):
+        self.serial.write(data)
+
+    def close(self):
+        self.serial.close()
+
+
+def open_port(path, baudrate=DEFAULT_BAUD):
+    if os.name == "posix":
+        return PosixPort(path, baudrate)
+    return SerialPort(path, baudrate)
+
+
+# ============ CHUNK STORE CLASS ============
+class ChunkStore:
+    """Writes the sealed tables of one run into its directory. Only called from the disk thread."""
+
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        os.makedirs(run_dir, exist_ok=True)
+        self.seq = {}                   # Next chunk number of each table
+        self.chunks = 0
+        self.rows = 0
+        self.events = open(os.path.join(run_dir, "events.txt"), "a")
+
+    def write(self, kind, table):
+        if kind == "events":
+            self.events.write("".join("{:.3f}\t{}\n".format(t, line) for t, line in table))
+            self.events.flush()
+            return
+        seq = self.seq.get(kind, 1)
+        self.seq[kind] = seq + 1
+        write_chunk(os.path.join(self.run_dir, "{}-{:06d}.hcc".format(kind, seq)), table)
+        self.chunks += 1
+        self.rows += table_rows(table)
+
+    def close(self):
+        self.events.close()
+
+
+# ============ ACQUISITION DAEMON CLASS ============
+class AcqDaemon:
+    """
+    Reads a port into a LineParser and hands sealed chunks to a disk thread.
+
+    The reader, the chunk timer and the writer are asyncio tasks. Only the
+    writer waits for the disk, through a one-thread executor.
+    """
+
+    def __init__(self, port, store, chunk_rows=CHUNK_ROWS, chunk_seconds=CHUNK_SECONDS,
+                 max_pending=MAX_PENDING, measure=False, record=None):
+        self.port = port
+        self.store = store
+        self.chunk_rows = chunk_rows
+        self.chunk_seconds = chunk_seconds
+        self.max_pending = max_pending
+        self.measure = measure
+        self.record = record            # File the raw stream is appended to, or None
+        self.parser = LineParser()
+        self.raw = bytearray()          # Raw bytes not yet handed to the disk thread
+        self.queue = None
+        self.stopping = False
+        self.wake = None                # Set when the port is readable, or to stop
+
+        self.bytes = 0
+        self.reads = 0
+        self.dropped_chunks = 0
+        self.dropped_rows = 0
+        self.max_depth = 0
+
+    def stop(self):
+        """Make run() seal what it holds, wait for the disk and return."""
+        self.stopping = True
+        if self.wake is not None:
+            self.wake.set()
+
+    async def run(self, seconds=None):
+        """Record until stop(), the device going away, or for seconds."""
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.max_pending)
+        self.wake = asyncio.Event()
+        disk = concurrent.futures.ThreadPoolExecutor(1)
+        writer = asyncio.create_task(self._writer(disk))
+        timer = asyncio.create_task(self._timer())
+        if seconds is not None:
+            loop.call_later(seconds, self.stop)
+
+        self.port.write(b"status\n")
+        if self.measure:
+            self.port.write(b"measure\n")
+        try:
+            if self.port.fileno() is None:
+                await self._read_thread()
+            else:
+                await self._read_ready()
+        finally:
+            timer.cancel()
+            self.seal_all()
+            # The reader is done, so waiting for queue space now holds up nothing
+            await self.queue.put(None)
+            await writer
+            disk.shutdown()
+
+    async def _read_ready(self):
+        loop = asyncio.get_running_loop()
+        fd = self.port.fileno()
+        loop.add_reader(fd, self.wake.set)
+        try:
+            while not self.stopping:
+                await self.wake.wait()
+                self.wake.clear()
+                data = self.port.read(RX_READ)
+                if data is None:
+                    continue
+                if not data:
+                    break
+                self._received(data)
+        finally:
+            loop.remove_reader(fd)
+
+    async def _read_thread(self):
+        loop = asyncio.get_running_loop()
+        rx = concurrent.futures.ThreadPoolExecutor(1)
+        try:
+            while not self.stopping:
+                data = await loop.run_in_executor(rx, self.port.read, RX_READ)
+                if data:
+                    self._received(data)
+        finally:
+            rx.shutdown()
+
+    def _received(self, data):
+        self.bytes += len(data)
+        self.reads += 1
+        if self.record is not None:
+            self.raw += data
+        self.parser.feed(data, time.time())
+        if len(self.parser.samples["host_s"]) >= self.chunk_rows:
+            self._seal("samples")
+        if len(self.parser.probe["host_s"]) >= self.chunk_rows:
+            self._seal("probe")
+
+    def _seal(self, kind):
+        """Queue one table's rows for the disk, or drop them if the queue is full."""
+        if kind == "raw":
+            if not self.raw:
+                return
+            item, self.raw = bytes(self.raw), bytearray()
+            rows = 0
+        else:
+            item = self.parser.take(kind)
+            rows = len(item) if kind == "events" else table_rows(item)
+            if not rows:
+                return
+        try:
+            self.queue.put_nowait((kind, item))
+        except asyncio.QueueFull:
+            self.dropped_chunks += 1
+            self.dropped_rows += rows
+            return
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def seal_all(self):
+        for kind in ("samples", "probe", "events", "raw"):
+            self._seal(kind)
+
+    async def _timer(self):
+        while True:
+            await asyncio.sleep(self.chunk_seconds)
+            self.seal_all()
+
+    async def _writer(self, disk):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                break
+            kind, data = item
+            if kind == "raw":
+                await loop.run_in_executor(disk, self._write_raw, data)
+            else:
+                await loop.run_in_executor(disk, self.store.write, kind, data)
+
+    def _write_raw(self, data):
+        self.record.write(data)
+        self.record.flush()
+
+    def summary(self):
+        p = self.parser
+        return ("bytes={} lines={} samples={} faults={} probe={} state={} active={} bad_lines={} "
+                "overflows={} chunks={} rows_written={} dropped_chunks={} dropped_rows={} max_pending={}").format(
+            self.bytes, p.lines, p.sample_rows, p.faults, p.probe_rows, p.state,
+            len(p.active) if p.active is not None else "?", p.bad_lines, p.overflows,
+            self.store.chunks, self.store.rows, self.dropped_chunks, self.dropped_rows, self.max_depth)
+
+
+# ============ PTY REPLAY ============
+async def replay(master, data, bytes_per_s, done):
+    """
+    Write a recorded stream into a pty master at bytes_per_s (0: as fast as the pty takes it),
+    discarding what the daemon sends, then set done.
+    """
+    block = max(1, bytes_per_s // 100) if bytes_per_s else RX_READ
+    pos = 0
+    while pos < len(data):
+        try:
+            os.read(master, RX_READ)  # Commands from the daemon
+        except (BlockingIOError, OSError):
+            pass
+        try:
+            pos += os.write(master, data[pos:pos + block])
+        except BlockingIOError:
+            await asyncio.sleep(0.001)  # The pty is full until the daemon reads
+            continue
+        await asyncio.sleep(block / bytes_per_s if bytes_per_s else 0)
+    await asyncio.sleep(REPLAY_IDLE)
+    done()
+
+
+def dump(path, out):
+    """Print a chunk file as CSV."""
+    table = read_chunk(path)
+    out.write(",".join(table) + "\n")
+    for row in zip(*table.values()):
+        out.write(",".join("" if isinstance(v, float) and math.isnan(v) else str(v) for v in row) + "\n")
+    return table_rows(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record the MCU's measurement stream into columnar chunk files")
+    parser.add_argument("--port", help="serial port of the MCU, e.g. /dev/ttyACM0 or COM5")
+    parser.add_argument("--baud", type=int, default=DEFAULT_BAUD)
+    parser.add_argument("--out-dir", default=".", help="directory the run directory is created in")
+    parser.add_argument("--measure", action="store_true", help="send \"measure\" after \"status\"")
+    parser.add_argument("--seconds", type=float, help="stop after this long (default: until Ctrl+C)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per chunk file")
+    parser.add_argument("--chunk-seconds", type=float, default=CHUNK_SECONDS, help="longest time before a chunk is written")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING, help="sealed chunks held while the disk is behind")
+    parser.add_argument("--record", help="also append the raw received bytes to this file")
+    parser.add_argument("--replay", help="recorded stream to feed through a pseudo-terminal instead of --port (POSIX)")
+    parser.add_argument("--replay-baud", type=int, default=DEFAULT_BAUD, help="replay rate, 0 for as fast as possible")
+    parser.add_argument("--dump", help="print a chunk file as CSV and exit")
+    args = parser.parse_args()
+
+    if args.dump:
+        try:
+            dump(args.dump, sys.stdout)
+        except (OSError, ChunkFormatError) as e:
+            print("error:", e, file=sys.stderr)
+            return 1
+        return 0
+    if not args.port and not args.replay:
+        parser.error("one of --port, --replay or --dump is required")
+
+    master = None
+    if args.replay:
+        with open(args.replay, "rb") as f:
+            data = f.read()
+        master, slave = os.openpty()
+        os.set_blocking(master, False)
+        path = os.ttyname(slave)
+    else:
+        path = args.port
+
+    run_dir = os.path.join(args.out_dir, time.strftime("%Y-%m-%d_%H-%M-%S"))
+    try:
+        port = open_port(path, args.baud)
+    except (OSError, ImportError) as e:
+        print("error:", e, file=sys.stderr)
+        return 1
+    record = open(args.record, "ab") if args.record else None
+    store = ChunkStore(run_dir)
+    daemon = AcqDaemon(port, store, args.chunk_rows, args.chunk_seconds, args.max_pending, args.measure, record)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, daemon.stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+        if master is not None:
+            asyncio.create_task(replay(master, data, args.replay_baud // 10, daemon.stop))
+        await daemon.run(args.seconds)
+
+    start = time.monotonic()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        port.close()
+        store.close()
+        if record is not None:
+            record.close()
+        if master is not None:
+            os.close(master)
+            os.close(slave)
+    print("{} ({:.1f} s)".format(run_dir, time.monotonic() - start), file=sys.stderr)
+    print(daemon.summary(), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Delta Codec Module
+Host-side decoder for the delta payloads written by V29/delta.py, used by
+frame_decoder.py (delta UART frames) and log_export.py (.dlt logs).
+
+    Keyframe payload: n int16 quarter-degree samples, little-endian
+    Delta payload:    ceil(n/4) bytes of 2-bit codes (0 same, 1 +1, 2 -1, 3 escape),
+                      channel i in bits 2*(i % 4) of byte i // 4, then one
+                      zig-zag varint per escape, in channel order
+"""
+import struct
+
+# ============ CONFIGURATION ============
+# Must match V29/delta.py
+CODE_UP = 1
+CODE_DOWN = 2
+CODE_ESCAPE = 3
+
+
+class DeltaError(ValueError):
+    """A payload could not be decoded."""
+
+
+def keyframe_size(count):
+    return 2 * count
+
+
+def read_varint(data, pos):
+    """Return (value, end) for the varint at data[pos]."""
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise DeltaError("varint runs past the end of the payload")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def unzigzag(z):
+    return z >> 1 if not z & 1 else -((z + 1) >> 1)
+
+
+def decode_payload(data, pos, count, prev, key):
+    """
+    Decode one payload.
+
+    Args:
+        data: Bytes holding the payload
+        pos: Offset of the payload in data
+        count: Number of channels
+        prev: Samples of the previous payload (ignored for a keyframe)
+        key: True for a keyframe payload
+
+    Returns:
+        (samples, end): the decoded samples and the offset after the payload
+    """
+    if key:
+        end = pos + keyframe_size(count)
+        if end > len(data):
+            raise DeltaError("keyframe truncated")
+        return list(struct.unpack_from("<{}h".format(count), data, pos)), end
+
+    if prev is None or len(prev) != count:
+        raise DeltaError("delta payload without a matching keyframe")
+    codes_end = pos + (count + 3) // 4
+    if codes_end > len(data):
+        raise DeltaError("delta payload truncated")
+    samples = list(prev)
+    j = codes_end
+    for i in range(count):
+        code = (data[pos + (i >> 2)] >> ((i & 3) << 1)) & 3
+        if code == CODE_UP:
+            samples[i] += 1
+        elif code == CODE_DOWN:
+            samples[i] -= 1
+        elif code == CODE_ESCAPE:
+            z, j = read_varint(data, j)
+            samples[i] += unzigzag(z)
+    return samples, j
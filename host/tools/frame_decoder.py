@@ -0,0 +1,321 @@
+"""
+Frame Decoder Module
+Host-side decoder for the binary measurement frames sent by V29/frames.py.
+
+After the host sends "FRAME_MODE:BINARY\\n", MeasureState sends one packed
+frame per scan in place of the "TC<id>: <temp>" lines. Other messages
+(command replies, status) stay as text lines. FrameDecoder takes the raw UART
+byte stream and separates the two.
+
+"FRAME_MODE:DELTA\n" selects delta frames instead, which carry each scan as
+the change from the previous one (see V29/delta.py). FrameDecoder rebuilds
+the samples; after a lost frame it skips delta frames until the next
+keyframe.
+
+With "SAMPLING:ADAPTIVE" both binary modes send sample frames, holding only
+the channels read on one sampling tick, each with its own time. They decode
+to SampleFrame.
+
+    decoder = FrameDecoder()
+    for item in decoder.feed(serial_port.read(4096)):
+        if isinstance(item, Frame):
+            print(item.seq, item.temperatures())
+        else:
+            print("text:", item)
+"""
+import binascii
+import struct
+
+from delta_codec import DeltaError, decode_payload
+
+# ============ CONFIGURATION ============
+# Must match V29/frames.py
+SYNC = b"\xaa\x55"
+FRAME_MEASURE = 0x01
+FRAME_MEASURE_DELTA = 0x02
+FRAME_SAMPLES = 0x03
+VERSION = 1
+HEADER = struct.Struct("<2sBBHIH")  # sync, type, version, seq, timestamp, count
+DELTA_HEADER = struct.Struct("<BH")  # flags, payload length (after HEADER)
+SAMPLE = struct.Struct("<BBh")  # channel index, ms after the header timestamp, quarter degrees
+CRC_SIZE = 2
+FLAG_KEYFRAME = 0x01
+FLAG_FAULTS = 0x02
+MAX_CHANNELS = 256
+
+
+def crc16(data):
+    """CRC-16/CCITT (poly 0x1021, init 0xFFFF), the same CRC the firmware uses."""
+    return binascii.crc_hqx(bytes(data), 0xFFFF)
+
+
+def frame_size(count):
+    """Size in bytes of a frame holding count channels."""
+    return HEADER.size + 2 * count + (count + 7) // 8 + CRC_SIZE
+
+
+def sample_frame_size(count):
+    """Size in bytes of a sample frame holding count samples."""
+    return HEADER.size + SAMPLE.size * count + (count + 7) // 8 + CRC_SIZE
+
+
+def delta_frame_size(count, flags, length):
+    """Size in bytes of a delta frame."""
+    bitmap = (count + 7) // 8 if flags & FLAG_FAULTS else 0
+    return HEADER.size + DELTA_HEADER.size + length + bitmap + CRC_SIZE
+
+
+class FrameError(ValueError):
+    """A frame failed to decode (bad sync, type, length or CRC)."""
+
+
+class MissingKeyframe(FrameError):
+    """A valid delta frame arrived without the previous frame to apply it to."""
+
+
+class Frame:
+    """One decoded measurement frame."""
+
+    def __init__(self, seq, timestamp_ms, samples, faults, keyframe=True):
+        self.seq = seq                    # 16-bit sequence number
+        self.timestamp_ms = timestamp_ms  # MCU ticks_ms when the scan finished
+        self.samples = samples            # Probe temperatures in quarter degrees
+        self.faults = faults              # True where the MAX31855 reported a fault
+        self.keyframe = keyframe          # False for a delta frame
+
+    @property
+    def count(self):
+        return len(self.samples)
+
+    def temperatures(self):
+        """Probe temperatures in degrees, as the text protocol reports them."""
+        return [q / 4 for q in self.samples]
+
+    def text_lines(self):
+        """
+        The "TC<id>: <temp>" lines the text protocol would have sent for this scan.
+
+        The fault bitmap does not say which fault, so a faulted channel is
+        "FAULT" where the text protocol sends "FAULT_OC", "FAULT_SCG" or "FAULT_SCV".
+        """
+        return ["TC{}: {}".format(i + 1, "FAULT" if f else t)
+                for i, (t, f) in enumerate(zip(self.temperatures(), self.faults))]
+
+    def __repr__(self):
+        return "Frame(seq={}, timestamp_ms={}, count={})".format(self.seq, self.timestamp_ms, self.count)
+
+
+class SampleFrame(Frame):
+    """One decoded sample frame: some channels, each with its own time."""
+
+    def __init__(self, seq, timestamp_ms, channels, times_ms, samples, faults):
+        Frame.__init__(self, seq, timestamp_ms, samples, faults)
+        self.channels = channels          # 0-based channel index of each sample
+        self.times_ms = times_ms          # MCU ticks_ms of each sample's read
+
+    def text_lines(self):
+        """The "TC<id>: <temp> @<ms>" lines the text protocol would have sent for this tick."""
+        return ["TC{}: {} @{}".format(c + 1, "FAULT" if f else q / 4, t)
+                for c, q, t, f in zip(self.channels, self.samples, self.times_ms, self.faults)]
+
+    def __repr__(self):
+        return "SampleFrame(seq={}, timestamp_ms={}, count={})".format(self.seq, self.timestamp_ms, self.count)
+
+
+def _faults(bitmap, count):
+    return [bool(bitmap[i >> 3] & (1 << (i & 7))) for i in range(count)]
+
+
+def decode_frame(data, prev=None):
+    """
+    Decode exactly one frame.
+
+    Args:
+        data: The frame's bytes
+        prev: Samples of the previous frame, needed for a delta frame that is not a keyframe
+
+    Raises:
+        FrameError: if the bytes are not a valid frame
+        MissingKeyframe: if a valid delta frame needs prev and it is missing
+    """
+    data = bytes(data)
+    if len(data) < HEADER.size + CRC_SIZE:
+        raise FrameError("frame too short")
+    sync, ftype, version, seq, timestamp, count = HEADER.unpack_from(data)
+    if sync != SYNC:
+        raise FrameError("bad sync bytes")
+    if ftype not in (FRAME_MEASURE, FRAME_MEASURE_DELTA, FRAME_SAMPLES) or version != VERSION:
+        raise FrameError("unsupported frame type {} version {}".format(ftype, version))
+    if ftype == FRAME_MEASURE:
+        size = frame_size(count)
+    elif ftype == FRAME_SAMPLES:
+        size = sample_frame_size(count)
+    else:
+        if len(data) < HEADER.size + DELTA_HEADER.size + CRC_SIZE:
+            raise FrameError("frame too short")
+        flags, length = DELTA_HEADER.unpack_from(data, HEADER.size)
+        size = delta_frame_size(count, flags, length)
+    if len(data) != size:
+        raise FrameError("length {} does not match {} channels".format(len(data), count))
+    crc = struct.unpack_from("<H", data, len(data) - CRC_SIZE)[0]
+    if crc != crc16(data[2:-CRC_SIZE]):
+        raise FrameError("CRC mismatch")
+
+    if ftype == FRAME_MEASURE:
+        samples = list(struct.unpack_from("<{}h".format(count), data, HEADER.size))
+        return Frame(seq, timestamp, samples, _faults(data[HEADER.size + 2 * count:-CRC_SIZE], count))
+    if ftype == FRAME_SAMPLES:
+        channels, times, samples = [], [], []
+        for k in range(count):
+            channel, dt, q = SAMPLE.unpack_from(data, HEADER.size + SAMPLE.size * k)
+            channels.append(channel)
+            times.append((timestamp + dt) & 0xFFFFFFFF)
+            samples.append(q)
+        faults = _faults(data[HEADER.size + SAMPLE.size * count:-CRC_SIZE], count)
+        return SampleFrame(seq, timestamp, channels, times, samples, faults)
+
+    key = bool(flags & FLAG_KEYFRAME)
+    if not key and (prev is None or len(prev) != count):
+        raise MissingKeyframe("delta frame {} without its previous frame".format(seq))
+    start = HEADER.size + DELTA_HEADER.size
+    try:
+        samples, end = decode_payload(data, start, count, prev, key)
+    except DeltaError as e:
+        raise FrameError(str(e))
+    if end != start + length:
+        raise FrameError("payload length mismatch")
+    if flags & FLAG_FAULTS:
+        faults = _faults(data[end:-CRC_SIZE], count)
+    else:
+        faults = [False] * count
+    return Frame(seq, timestamp, samples, faults, key)
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for a UART stream mixing text lines and binary frames.
+
+    Bytes that are neither are skipped and counted in `resyncs`. Frames that
+    fail to decode (usually a bad CRC) are counted in `bad_frames`, and gaps in
+    the sequence numbers (frames lost on the link) in `dropped`. Delta frames
+    that arrive before the first keyframe, or after a lost frame, cannot be
+    rebuilt and are counted in `awaiting_key`.
+    """
+
+    def __init__(self, max_channels=MAX_CHANNELS):
+        self.max_channels = max_channels
+        self.buffer = bytearray()
+        self.last_seq = None
+        self.last_type = None             # Each frame type has its own sequence numbers
+        self.prev = None                  # Samples of the last frame, the base for the next delta frame
+        self.frames = 0
+        self.awaiting_key = 0
+        self.dropped = 0
+        self.bad_frames = 0
+        self.resyncs = 0
+
+    def feed(self, data):
+        """Add received bytes and return the frames and text lines completed by them."""
+        self.buffer += data
+        items = []
+        while self.buffer:
+            if self.buffer[0] == SYNC[0]:
+                if len(self.buffer) < 2:
+                    break
+                if self.buffer[1] != SYNC[1]:
+                    self._skip(1)
+                    continue
+                item = self._take_frame()
+                if item is None:
+                    break
+                if item is not False:
+                    items.append(item)
+                continue
+
+            end = self.buffer.find(b"\n")
+            sync = self.buffer.find(SYNC)
+            if end < 0 or (0 <= sync < end):
+                if sync > 0:
+                    # Garbage or a partial line in front of a frame
+                    self._skip(sync)
+                    continue
+                break
+            line = self.buffer[:end].decode("utf-8", "replace").strip()
+            del self.buffer[:end + 1]
+            if line:
+                items.append(line)
+        return items
+
+    def _take_frame(self):
+        """Return a Frame, False if the bytes at the front were not one, or None if more bytes are needed."""
+        if len(self.buffer) < HEADER.size:
+            return None
+        _, ftype, _, seq, _, count = HEADER.unpack_from(self.buffer)
+        if count > self.max_channels:
+            self._skip(1)
+            return False
+        if ftype == FRAME_MEASURE_DELTA:
+            if len(self.buffer) < HEADER.size + DELTA_HEADER.size:
+                return None
+            flags, length = DELTA_HEADER.unpack_from(self.buffer, HEADER.size)
+            if length > 3 * count + 3:
+                self._skip(1)
+                return False
+            size = delta_frame_size(count, flags, length)
+        elif ftype == FRAME_SAMPLES:
+            size = sample_frame_size(count)
+        else:
+            size = frame_size(count)
+        if len(self.buffer) < size:
+            return None
+
+        # A delta frame only applies on top of the frame right before it
+        in_order = self.last_seq is not None and ftype == self.last_type and seq == (self.last_seq + 1) & 0xFFFF
+        try:
+            frame = decode_frame(self.buffer[:size], self.prev if in_order else None)
+        except MissingKeyframe:
+            frame = None
+        except FrameError:
+            self.bad_frames += 1
+            self._skip(1)
+            return False
+        del self.buffer[:size]
+
+        if self.last_seq is not None and ftype == self.last_type:
+            self.dropped += (seq - self.last_seq - 1) & 0xFFFF
+        self.last_seq = seq
+        self.last_type = ftype
+        if frame is None:
+            self.prev = None
+            self.awaiting_key += 1
+            return False
+        # A sample frame only holds some channels, it is no base for a delta frame
+        self.prev = None if isinstance(frame, SampleFrame) else frame.samples
+        self.frames += 1
+        return frame
+
+    def _skip(self, n):
+        del self.buffer[:n]
+        self.resyncs += 1
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Decode a captured UART stream of binary measurement frames")
+    parser.add_argument("capture", help="file holding the raw bytes received from the MCU")
+    args = parser.parse_args()
+
+    decoder = FrameDecoder()
+    with open(args.capture, "rb") as f:
+        for item in decoder.feed(f.read()):
+            if isinstance(item, SampleFrame):
+                print("#{} t={}ms {}".format(item.seq, item.timestamp_ms, ",".join(
+                    "TC{}@{}={}".format(c + 1, t, q / 4) for c, t, q in zip(item.channels, item.times_ms, item.samples))))
+            elif isinstance(item, Frame):
+                print("#{} t={}ms {}".format(item.seq, item.timestamp_ms, ",".join(str(t) for t in item.temperatures())))
+            else:
+                print(item)
+    print("frames={} dropped={} bad_frames={} resyncs={} awaiting_key={}".format(
+        decoder.frames, decoder.dropped, decoder.bad_frames, decoder.resyncs, decoder.awaiting_key), file=sys.stderr)
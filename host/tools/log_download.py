@@ -0,0 +1,207 @@
+"""
+Log Download Module
+Host side of the log download handled by V29/download.py.
+
+    FILES                    -> FILES:<name>,<size>;...
+    FILE_GET:<name>:<offset> -> FILE_START:<name>:<size>:<offset>
+                                FILE_DATA:<offset>:<base64>:<crc>   (repeated)
+                                FILE_END:<name>:<size>
+
+Verified chunks are appended to "<name>.part" as they arrive. After a bad
+chunk, a timeout, or a new run of the tool following a disconnect, the
+download continues from the size of the .part file. It is renamed to
+<name> once FILE_END arrives and its size matches; if chunks at the end of
+the stream were lost, the download is resumed instead.
+
+Usage:
+    python host/tools/log_download.py --port COM5 --list
+    python host/tools/log_download.py --port COM5 2026-01-27_09-00.bin --out-dir TemperatureData
+    python host/tools/log_download.py --port COM5 --all --out-dir TemperatureData
+"""
+import binascii
+import os
+import sys
+import time
+
+from serial_link import SerialLink
+
+# ============ CONFIGURATION ============
+MAX_RETRIES = 5             # Consecutive timeouts or bad chunks before giving up
+
+
+class DownloadError(RuntimeError):
+    """The MCU reported an error or stopped answering."""
+
+
+def crc16(data):
+    """CRC-16/CCITT (poly 0x1021, init 0xFFFF), the same CRC the firmware uses."""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def parse_data(line):
+    """
+    Split a FILE_DATA line into (offset, raw bytes).
+
+    Raises:
+        ValueError: if the line is malformed or the CRC does not match
+    """
+    _, offset, data, crc = line.split(":")
+    raw = binascii.a2b_base64(data)
+    if crc16(raw) != int(crc, 16):
+        raise ValueError("CRC mismatch at offset {}".format(offset))
+    return int(offset), raw
+
+
+class LogDownloader:
+    """
+    Downloads log files over a link with write(bytes) and readline() -> str,
+    or None after a timeout. Lines that are not part of the download
+    (measurement data, status) are ignored.
+    """
+
+    def __init__(self, link, max_retries=MAX_RETRIES):
+        self.link = link
+        self.max_retries = max_retries
+        self.resumes = 0        # Times a download restarted from the last good offset
+        self.bad_chunks = 0
+
+    def _reply(self, prefixes):
+        while True:
+            line = self.link.readline()
+            if line is None:
+                return None
+            if line.startswith(prefixes):
+                return line
+
+    def list_files(self):
+        """Return [(name, size)] for every log on the card."""
+        self.link.write(b"FILES\n")
+        reply = self._reply(("FILES:",))
+        if reply is None:
+            raise DownloadError("no reply to FILES")
+        body = reply.partition(":")[2]
+        if body.startswith("ERROR"):
+            raise DownloadError(body)
+        files = []
+        for entry in body.split(";"):
+            if entry:
+                name, size = entry.split(",")
+                files.append((name, int(size)))
+        return files
+
+    def download(self, name, path, progress=None):
+        """
+        Download one file to path, resuming from path + ".part" if it exists.
+
+        Args:
+            name: File name on the MCU
+            path: Local file to create
+            progress: Optional callable(offset, size) called after each chunk
+
+        Returns:
+            Size of the downloaded file
+        """
+        part = path + ".part"
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        retries = 0
+        with open(part, "ab") as out:
+            while True:
+                # Lines still in flight from an abandoned stream are skipped until FILE_START
+                self.link.write("FILE_GET:{}:{}\n".format(name, offset).encode())
+                reply = self._reply(("FILE_START", "FILE_ERROR"))
+                if reply is None:
+                    retries = self._retry(retries, "no reply to FILE_GET")
+                    continue
+                if reply.startswith("FILE_ERROR"):
+                    raise DownloadError(reply.partition(":")[2])
+                size = int(reply.split(":")[2])
+
+                while True:
+                    line = self._reply(("FILE_DATA", "FILE_END", "FILE_ERROR"))
+                    if line is None:
+                        break
+                    if line.startswith("FILE_END"):
+                        # FILE_END follows the last chunk directly, so a lost final chunk only shows in its size
+                        try:
+                            end = int(line.split(":")[2])
+                        except (IndexError, ValueError):
+                            self.bad_chunks += 1
+                            break
+                        if offset < end:
+                            break
+                        out.close()
+                        os.replace(part, path)
+                        return offset
+                    if line.startswith("FILE_ERROR"):
+                        raise DownloadError(line.partition(":")[2])
+                    try:
+                        chunk_offset, raw = parse_data(line)
+                    except (ValueError, binascii.Error):
+                        self.bad_chunks += 1
+                        break
+                    if chunk_offset != offset:
+                        break
+                    out.write(raw)
+                    out.flush()
+                    offset += len(raw)
+                    retries = 0
+                    if progress:
+                        progress(offset, size)
+
+                # Stream broken: stop it and ask again from the last good byte
+                self.link.write(b"FILE_STOP\n")
+                self.resumes += 1
+                retries = self._retry(retries, "download of {} stalled at {}".format(name, offset))
+
+    def _retry(self, retries, message):
+        retries += 1
+        if retries > self.max_retries:
+            raise DownloadError(message)
+        return retries
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Download measurement logs from the MCU over UART")
+    parser.add_argument("files", nargs="*", help="log files to download")
+    parser.add_argument("--port", required=True, help="serial port of the MCU, e.g. COM5 or /dev/ttyACM0")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--list", action="store_true", help="list the logs on the card and exit")
+    parser.add_argument("--all", action="store_true", help="download every log not already in --out-dir")
+    parser.add_argument("--out-dir", default=".", help="directory for the downloaded files")
+    args = parser.parse_args()
+
+    link = SerialLink(args.port, args.baud)
+    downloader = LogDownloader(link)
+    try:
+        files = downloader.list_files()
+        if args.list:
+            for name, size in files:
+                print("{}\t{}".format(name, size))
+            return 0
+        sizes = dict(files)
+        names = args.files
+        if args.all:
+            # A local file of the same size is complete; the newest log may still be growing
+            names = [name for name, size in files
+                     if not (os.path.exists(os.path.join(args.out_dir, name))
+                             and os.path.getsize(os.path.join(args.out_dir, name)) == size)]
+        for name in names:
+            if name not in sizes:
+                print("error: {} is not on the card".format(name), file=sys.stderr)
+                return 1
+            start = time.monotonic()
+            size = downloader.download(name, os.path.join(args.out_dir, name))
+            elapsed = time.monotonic() - start
+            print("{} ({} bytes, {:.1f} s)".format(name, size, elapsed), file=sys.stderr)
+    except DownloadError as e:
+        print("error:", e, file=sys.stderr)
+        return 1
+    finally:
+        link.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Log Export Module
+Reads the binary measurement logs written by V29/logger.py (BIN_LOG) and
+converts them to the CSV layout of the text logs:
+
+    HH:MM:SS,<temp>,<temp>,...
+
+Records are fixed-size, so any record (or the first record at or after a
+time) is found without reading the ones before it.
+
+Delta logs (.dlt, DELTA_LOG) are converted the same way. Their records vary in
+size, so a time is found by binary search over byte offsets: from any offset
+the next keyframe is located by its sync bytes and CRC, and decoding starts
+there.
+
+Usage:
+    python host/tools/log_export.py 2026-01-27_09-00.bin              # writes 2026-01-27_09-00.csv
+    python host/tools/log_export.py *.bin --out-dir TemperatureData
+    python host/tools/log_export.py run.bin --stdout --start 09:15:00 --end 09:20:00
+    python host/tools/log_export.py run.bin --info                    # header only
+    python host/tools/log_export.py 2026-01-27_09-00.dlt              # delta logs too
+"""
+import argparse
+import binascii
+import os
+import struct
+import sys
+
+from delta_codec import DeltaError, decode_payload, keyframe_size
+
+# ============ CONFIGURATION ============
+# Must match V29/logger.py
+MAGIC = b"HCLG"
+DELTA_MAGIC = b"HCLD"
+VERSION = 1
+HEADER_FIXED = struct.Struct("<4sBBHHHBBBBBBH")
+RECORD_TIME = struct.Struct("<I")
+KEY_SYNC = b"\xaa\x4b"
+KEY_OVERHEAD = 8            # Sync, time and CRC around a keyframe payload
+NO_READING_Q = -32768       # Sample logged for a channel that read with a fault
+
+
+class LogFormatError(ValueError):
+    """The file is not a valid binary measurement log."""
+
+
+def read_header(f, path, magic):
+    """
+    Read and check a log file header.
+
+    Returns:
+        (start, channels, header_size, record_size)
+    """
+    fixed = f.read(HEADER_FIXED.size)
+    if len(fixed) < HEADER_FIXED.size:
+        raise LogFormatError("{}: file too short for a header".format(path))
+    (file_magic, version, _, header_size, record_size, year, month, day,
+     hour, minute, second, _, count) = HEADER_FIXED.unpack(fixed)
+    if file_magic != magic:
+        raise LogFormatError("{}: not a {} log".format(path, magic.decode()))
+    if version != VERSION:
+        raise LogFormatError("{}: unsupported log version {}".format(path, version))
+    if header_size != HEADER_FIXED.size + 2 * count + 2:
+        raise LogFormatError("{}: inconsistent header sizes".format(path))
+
+    rest = f.read(header_size - HEADER_FIXED.size)
+    header = fixed + rest
+    if len(header) != header_size:
+        raise LogFormatError("{}: truncated header".format(path))
+    crc = struct.unpack_from("<H", header, header_size - 2)[0]
+    if crc != binascii.crc_hqx(header[:-2], 0xFFFF):
+        raise LogFormatError("{}: header CRC mismatch".format(path))
+
+    start = (year, month, day, hour, minute, second)
+    channels = list(struct.unpack_from("<{}H".format(count), header, HEADER_FIXED.size))
+    return start, channels, header_size, record_size
+
+
+def open_log(path):
+    """Open a binary (.bin) or delta (.dlt) log, chosen by the magic bytes."""
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+    if magic == DELTA_MAGIC:
+        return DeltaLog(path)
+    return BinaryLog(path)
+
+
+class BinaryLog:
+    """
+    Random-access reader for one binary log file.
+
+    Attributes:
+        start: (year, month, day, hour, minute, second) of the first record
+        channels: 1-based chain position (cs_pin) of each logged channel
+        header_size, record_size: layout of the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self._read_header()
+        except Exception:
+            self.file.close()
+            raise
+
+    def _read_header(self):
+        self.start, self.channels, self.header_size, self.record_size = read_header(self.file, self.path, MAGIC)
+        if self.record_size != RECORD_TIME.size + 2 * len(self.channels):
+            raise LogFormatError("{}: inconsistent header sizes".format(self.path))
+        self._samples = struct.Struct("<{}h".format(len(self.channels)))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        """Number of complete records (a record cut short by power loss is ignored)."""
+        size = os.fstat(self.file.fileno()).st_size
+        return max(0, (size - self.header_size) // self.record_size)
+
+    def record(self, index):
+        """Return (time_of_day_ms, [quarter-degree samples]) for one record."""
+        if not 0 <= index < len(self):
+            raise IndexError("record {} out of range".format(index))
+        self.file.seek(self.header_size + index * self.record_size)
+        data = self.file.read(self.record_size)
+        return RECORD_TIME.unpack_from(data)[0], list(self._samples.unpack_from(data, RECORD_TIME.size))
+
+    def records(self, start=0, stop=None):
+        """Yield records start..stop-1, reading sequentially."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        self.file.seek(self.header_size + start * self.record_size)
+        for _ in range(start, stop):
+            data = self.file.read(self.record_size)
+            yield RECORD_TIME.unpack_from(data)[0], list(self._samples.unpack_from(data, RECORD_TIME.size))
+
+    def find_time(self, time_ms):
+        """Index of the first record at or after time_ms (records are in time order)."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            self.file.seek(self.header_size + mid * self.record_size)
+            if RECORD_TIME.unpack(self.file.read(RECORD_TIME.size))[0] < time_ms:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+    def iter_range(self, start_ms=None, end_ms=None):
+        """Yield the records between start_ms and end_ms (inclusive)."""
+        first = self.find_time(start_ms) if start_ms is not None else 0
+        stop = self.find_time(end_ms + 1) if end_ms is not None else None
+        return self.records(first, stop)
+
+
+class DeltaLog:
+    """
+    Reader for one delta log file.
+
+    Attributes are the same as BinaryLog's (record_size is 0, records vary
+    in size). The file is read into memory once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.start, self.channels, self.header_size, self.record_size = read_header(f, path, DELTA_MAGIC)
+            f.seek(0)
+            self.data = f.read()
+        self.key_size = KEY_OVERHEAD + keyframe_size(len(self.channels))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return sum(1 for _ in self.records())
+
+    def _key_time(self, pos):
+        """Time of the keyframe at pos, or None if there is no valid keyframe there."""
+        data = self.data
+        end = pos + self.key_size
+        if data[pos:pos + 2] != KEY_SYNC or end > len(data):
+            return None
+        if struct.unpack_from("<H", data, end - 2)[0] != binascii.crc_hqx(data[pos + 2:end - 2], 0xFFFF):
+            return None
+        return RECORD_TIME.unpack_from(data, pos + 2)[0]
+
+    def next_key(self, pos):
+        """Return (offset, time_ms) of the first keyframe at or after pos, or None."""
+        while True:
+            pos = self.data.find(KEY_SYNC, pos)
+            if pos < 0:
+                return None
+            time_ms = self._key_time(pos)
+            if time_ms is not None:
+                return pos, time_ms
+            pos += 1
+
+    def find_key(self, time_ms):
+        """Offset of the last keyframe at or before time_ms (the first keyframe if none is)."""
+        best = self.header_size
+        lo, hi = self.header_size, len(self.data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = self.next_key(mid)
+            if key is None or key[1] > time_ms:
+                hi = mid
+            else:
+                best = key[0]
+                lo = key[0] + 1
+        return best
+
+    def records(self, pos=None):
+        """Yield (time_ms, samples) from the keyframe at pos (the first record if None) to the end."""
+        data = self.data
+        count = len(self.channels)
+        pos = self.header_size if pos is None else pos
+        samples = None
+        time_ms = 0
+        while pos < len(data):
+            key = data[pos] == KEY_SYNC[0]
+            try:
+                if key:
+                    if self._key_time(pos) is None:
+                        return          # Cut short by power loss
+                    time_ms = RECORD_TIME.unpack_from(data, pos + 2)[0]
+                    samples, _ = decode_payload(data, pos + 6, count, None, True)
+                    pos += self.key_size
+                else:
+                    time_ms += data[pos] * 1000
+                    samples, pos = decode_payload(data, pos + 1, count, samples, False)
+            except DeltaError:
+                return
+            yield time_ms, samples
+
+    def iter_range(self, start_ms=None, end_ms=None):
+        """Yield the records between start_ms and end_ms (inclusive)."""
+        pos = self.find_key(start_ms) if start_ms is not None else None
+        for time_ms, samples in self.records(pos):
+            if start_ms is not None and time_ms < start_ms:
+                continue
+            if end_ms is not None and time_ms > end_ms:
+                return
+            yield time_ms, samples
+
+
+def format_time(time_ms):
+    seconds = time_ms // 1000
+    return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, (seconds // 60) % 60, seconds % 60)
+
+
+def parse_time(text):
+    """Parse HH:MM[:SS] into milliseconds since midnight."""
+    parts = [int(p) for p in text.split(":")]
+    if len(parts) == 2:
+        parts.append(0)
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError("expected HH:MM or HH:MM:SS, got {!r}".format(text))
+    return ((parts[0] * 60 + parts[1]) * 60 + parts[2]) * 1000
+
+
+def csv_line(time_ms, samples):
+    """One line in the text log layout (temperatures formatted as the MCU formats them, empty for a fault)."""
+    return "{},{}\n".format(format_time(time_ms),
+                            ",".join("" if q == NO_READING_Q else str(q / 4) for q in samples))
+
+
+def export(log, out, start_ms=None, end_ms=None):
+    """Write the log's records between start_ms and end_ms (inclusive) as CSV lines. Returns the line count."""
+    lines = 0
+    for time_ms, samples in log.iter_range(start_ms, end_ms):
+        out.write(csv_line(time_ms, samples))
+        lines += 1
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert binary measurement logs to CSV")
+    parser.add_argument("logs", nargs="+", help="binary (.bin) or delta (.dlt) log files")
+    parser.add_argument("--out-dir", help="directory for the CSV files (default: next to each log)")
+    parser.add_argument("--stdout", action="store_true", help="write CSV to stdout instead of files")
+    parser.add_argument("--start", type=parse_time, help="first time to export, HH:MM[:SS]")
+    parser.add_argument("--end", type=parse_time, help="last time to export, HH:MM[:SS]")
+    parser.add_argument("--info", action="store_true", help="print each log's header and record count only")
+    args = parser.parse_args()
+
+    status = 0
+    for path in args.logs:
+        try:
+            log = open_log(path)
+        except (OSError, LogFormatError) as e:
+            print("error:", e, file=sys.stderr)
+            status = 1
+            continue
+        with log:
+            if args.info:
+                print("{}: start {:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}, {} channels, {} records".format(
+                    path, *log.start, len(log.channels), len(log)))
+                print("  channels (cs_pin):", ",".join(str(c) for c in log.channels))
+                continue
+            if args.stdout:
+                export(log, sys.stdout, args.start, args.end)
+                continue
+            out_dir = args.out_dir or os.path.dirname(os.path.abspath(path))
+            out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + ".csv")
+            with open(out_path, "w", newline="") as out:
+                lines = export(log, out, args.start, args.end)
+            print("{} -> {} ({} lines)".format(path, out_path, lines), file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
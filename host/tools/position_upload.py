@@ -0,0 +1,182 @@
+"""
+Position Upload Module
+Host side of the bulk position upload handled by CalibrationState in
+V29/state_machine.py.
+
+Positions are sent in numbered chunks, each carrying several probes and a
+CRC. Up to <window> chunks are in flight before the MCU acknowledges them,
+so the link is never idle waiting for a reply per probe:
+
+    host                                    MCU
+    POS_BULK_START:<count>          ->
+                                    <-      POS_BULK_READY:<window>,<max per chunk>
+    POS_CHUNK:<seq>:<id,x,y,z;...>:<crc>  (up to <window> unacknowledged)
+                                    <-      POS_ACK:<chunks received in order>
+                                    <-      POS_NAK:<seq>   (resend from <seq>)
+    POS_BULK_END:<chunks>           ->
+                                    <-      POS_BULK_DONE:<count> or POS_BULK_ERROR:<reason>
+
+<crc> is the CRC-16/CCITT (poly 0x1021, init 0xFFFF) of "<seq>:<payload>"
+as 4 hex digits. The MCU writes position.csv once, after the last chunk.
+If POS_BULK_DONE is lost, the END line is sent again after the timeout and
+the MCU answers with the same POS_BULK_DONE.
+
+Usage:
+    python host/tools/position_upload.py position.csv --port COM5
+"""
+import binascii
+import sys
+import time
+
+from serial_link import SerialLink
+
+# ============ CONFIGURATION ============
+DEFAULT_WINDOW = 8          # Used if the READY reply does not carry one
+DEFAULT_CHUNK = 16
+MAX_RETRIES = 5
+
+
+class UploadError(RuntimeError):
+    """The MCU rejected the upload or stopped answering."""
+
+
+def crc16(data):
+    """CRC-16/CCITT (poly 0x1021, init 0xFFFF), the same CRC the firmware uses."""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def chunk_line(seq, positions):
+    """The POS_CHUNK line for one chunk of (tc_id, x, y, z) tuples."""
+    payload = ";".join("{},{},{},{}".format(tc_id, x, y, z) for tc_id, x, y, z in positions)
+    body = "{}:{}".format(seq, payload)
+    return "POS_CHUNK:{}:{:04X}\n".format(body, crc16(body.encode()))
+
+
+def read_positions(path):
+    """Read (tc_id, x, y, z) tuples from a file in the position.csv layout."""
+    positions = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            tc_id, x, y, z = line.split(",")
+            positions.append((int(tc_id), float(x), float(y), float(z)))
+    return positions
+
+
+class PositionUploader:
+    """
+    Go-back-N sender for the bulk position protocol.
+
+    link needs write(bytes) and readline() -> str, or None after a timeout.
+    Lines that are not part of the protocol (calibration data still in
+    flight when the upload starts) are ignored.
+    """
+
+    def __init__(self, link, max_retries=MAX_RETRIES):
+        self.link = link
+        self.max_retries = max_retries
+        self.chunks_sent = 0
+        self.resent = 0
+
+    def _reply(self, prefixes):
+        """Wait for the next line starting with one of prefixes. Returns None on a timeout."""
+        while True:
+            line = self.link.readline()
+            if line is None:
+                return None
+            if line.startswith(prefixes):
+                return line
+
+    def upload(self, positions):
+        """
+        Upload positions and return the count the MCU stored.
+
+        Args:
+            positions: Iterable of (tc_id, x, y, z)
+
+        Raises:
+            UploadError: if the MCU reports an error or stops answering
+        """
+        positions = list(positions)
+        self.link.write("POS_BULK_START:{}\n".format(len(positions)).encode())
+        reply = self._reply(("POS_BULK_READY", "POS_BULK_ERROR"))
+        if reply is None or reply.startswith("POS_BULK_ERROR"):
+            raise UploadError("upload not accepted: {}".format(reply))
+        window, chunk = DEFAULT_WINDOW, DEFAULT_CHUNK
+        fields = reply.partition(":")[2].split(",")
+        if len(fields) == 2:
+            window, chunk = int(fields[0]), int(fields[1])
+
+        lines = [chunk_line(seq, positions[i:i + chunk]).encode()
+                 for seq, i in enumerate(range(0, len(positions), chunk))]
+        base = 0            # First chunk not yet acknowledged
+        next_seq = 0        # Next chunk to send
+        retries = 0
+        ending = False
+        while True:
+            if base == len(lines) and not ending:
+                self.link.write("POS_BULK_END:{}\n".format(len(lines)).encode())
+                ending = True
+            while not ending and next_seq < len(lines) and next_seq < base + window:
+                self.link.write(lines[next_seq])
+                self.chunks_sent += 1
+                next_seq += 1
+
+            reply = self._reply(("POS_ACK", "POS_NAK", "POS_BULK_DONE", "POS_BULK_ERROR"))
+            if reply is None:
+                retries += 1
+                if retries > self.max_retries:
+                    self.link.write(b"POS_BULK_ABORT\n")
+                    raise UploadError("no reply after {} retries".format(self.max_retries))
+                # Nothing heard, resend everything unacknowledged (or the END line)
+                self.resent += next_seq - base
+                next_seq = base
+                ending = False
+                continue
+
+            kind, _, value = reply.partition(":")
+            if kind == "POS_BULK_DONE":
+                return int(value)
+            if kind == "POS_BULK_ERROR":
+                raise UploadError("MCU reported {}".format(value))
+            retries = 0
+            acked = int(value)
+            if acked > base:
+                base = acked
+            if kind == "POS_NAK":
+                self.resent += max(0, next_seq - acked)
+                next_seq = acked
+                ending = False
+            elif next_seq < base:
+                next_seq = base
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Upload thermocouple positions to the MCU in bulk")
+    parser.add_argument("positions", help="file with one tc_id,x,y,z line per probe (position.csv layout)")
+    parser.add_argument("--port", required=True, help="serial port of the MCU, e.g. COM5 or /dev/ttyACM0")
+    parser.add_argument("--baud", type=int, default=115200)
+    args = parser.parse_args()
+
+    positions = read_positions(args.positions)
+    link = SerialLink(args.port, args.baud)
+    uploader = PositionUploader(link)
+    start = time.monotonic()
+    try:
+        stored = uploader.upload(positions)
+    except UploadError as e:
+        print("error:", e, file=sys.stderr)
+        return 1
+    finally:
+        link.close()
+    print("stored {} positions in {:.2f} s ({} chunks sent, {} resent)".format(
+        stored, time.monotonic() - start, uploader.chunks_sent, uploader.resent), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
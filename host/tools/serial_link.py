@@ -0,0 +1,32 @@
+"""
+Serial Link Module
+Line-based access to the MCU's UART for the host tools.
+
+The tools only need write(bytes) and readline() -> str, or None after a
+timeout, so they can also be driven by the simulator in host/sim.
+"""
+
+# ============ CONFIGURATION ============
+DEFAULT_BAUD = 115200
+DEFAULT_TIMEOUT = 1.0       # Seconds readline() waits before returning None
+
+
+class SerialLink:
+    """Line-based wrapper around a pyserial port."""
+
+    def __init__(self, port, baudrate=DEFAULT_BAUD, timeout=DEFAULT_TIMEOUT):
+        import serial  # Only needed when talking to real hardware
+        self.port = serial.Serial(port, baudrate, timeout=timeout)
+
+    def write(self, data):
+        self.port.write(data)
+
+    def readline(self):
+        """Return one received line, or None if nothing arrived before the timeout."""
+        line = self.port.readline()
+        if not line:
+            return None
+        return line.decode("utf-8", "replace").strip()
+
+    def close(self):
+        self.port.close()
@@ -8,6 +8,7 @@ export const VIZ_CONFIG = {
     coldColor: 0x00AAFF,  // Bright vibrant blue
     midColor: 0x00FF00,   // Bright green
     hotColor: 0xFF2222,   // Bright orange-red
+    faultColor: 0x808080, // Grey for a probe reporting FAULT_OC/SCG/SCV
     opacityMin: 0.5,
     opacityMax: 0.85,
     cubeSize: 0.5,
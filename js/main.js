@@ -246,6 +246,19 @@ class Visualization3D {
         const isHovered = cube === this.hoveredCube;
         const temp = tc.tcTemp;
         
+        if (tc.fault) {
+            // Faulted probe: grey and faint until it reads a temperature again
+            const faultColor = new THREE.Color(this.config.faultColor);
+            cube.material.color.copy(faultColor);
+            cube.material.emissive.copy(faultColor);
+            cube.material.transparent = true;
+            cube.material.opacity = this.config.opacityMin;
+            const outline = cube.children && cube.children.find(ch => ch.userData && ch.userData.isOutline);
+            if (outline && outline.material) {
+                outline.material.opacity = cube.material.opacity;
+            }
+            return;
+        }
         if (typeof temp !== 'number') return;
 
         const tempRange = this.config.tempMax - this.config.tempMin;
@@ -1060,6 +1073,16 @@ class HeatCubeSystem {
     }
 
     handleTCTemperature(line) {
+        // A channel that read with a fault sends e.g. "TC3: FAULT_OC" instead of a temperature
+        const faultMatch = line.match(/TC(\d+):\s*(FAULT_[A-Z]+)/);
+        if (faultMatch) {
+            const tcObj = this.activeTcsArray.find(tc => tc.id === parseInt(faultMatch[1]));
+            if (tcObj) {
+                tcObj.setFault(faultMatch[2]);
+                delete this.previousTcTemps[tcObj.id];
+            }
+            return;
+        }
         const match = line.match(/TC(\d+):\s*([\d.]+)/);
         if (match) {
             const tcId = parseInt(match[1]);
@@ -1646,6 +1669,7 @@ class HeatCubeSystem {
                 const tc = this.activeTcsArray.find(t => t.id === tcId);
                 if (tc) {
                     tc.tcTemp = temp;
+                    tc.fault = null;
                 }
             });
             
@@ -1889,7 +1913,7 @@ class HeatCubeSystem {
             return parseFloat(val).toFixed(digits);
         };
         
-        const temp = safeFixed(tc.tcTemp, 2);
+        const temp = tc.fault ? tc.fault : safeFixed(tc.tcTemp, 2);
         const refTemp = safeFixed(tc.refTemp, 2);
         const x = safeFixed(tc.x, 2);
         const y = safeFixed(tc.y, 2);
@@ -1921,7 +1945,7 @@ class HeatCubeSystem {
                 <strong>🌡️ TC #${tcId}</strong>
                 <div class="tc-info-field">
                     <span class="label">Temp</span>
-                    <span class="value">${temp}°C</span>
+                    <span class="value">${temp}${tc.fault ? '' : '°C'}</span>
                 </div>
                 <div class="tc-info-field">
                     <span class="label">X</span>
@@ -2407,6 +2431,7 @@ class HeatCubeSystem {
                 const tc = this.activeTcsArray.find(t => t.id === tcId);
                 if (tc) {
                     tc.tcTemp = temp;
+                    tc.fault = null;
                 }
             });
             this.viz3D.syncTcMeshes(this.activeTcsArray, this.getSelectedTcId(), !this.calibrationFinished);
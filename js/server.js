@@ -14,8 +14,8 @@ async function ensureDir(dirPath) {
 }
 
 function isTargetFile(fileName) {
-    // Match files like 2026-01-13.csv or 2026-01-13_12-34.csv
-    return /^\d{4}-\d{2}-\d{2}(_\d{2}-\d{2})?\.csv$/i.test(fileName);
+    // Match files like 2026-01-13.csv, 2026-01-13_12-34.csv or 2026-01-13_12-34_1.csv
+    return /^\d{4}-\d{2}-\d{2}(_\d{2}-\d{2}(_\d+)?)?\.csv$/i.test(fileName);
 }
 
 async function copyRecursive(src, dest) {
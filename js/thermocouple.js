@@ -7,6 +7,7 @@ export class Thermocouple {
         this.id = id;
         this.tcTemp = 0;
         this.refTemp = 0;
+        this.fault = null;  // "FAULT_OC", "FAULT_SCG" or "FAULT_SCV" while the probe reads with a fault
         this.x = 0;
         this.y = 0;
         this.z = 0;
@@ -15,6 +16,13 @@ export class Thermocouple {
     update(tcTemp, refTemp) {
         this.tcTemp = tcTemp;
         this.refTemp = refTemp;
+        this.fault = null;
+    }
+
+    setFault(fault) {
+        // No temperature while faulted, so the last good value is not shown as current
+        this.tcTemp = null;
+        this.fault = fault;
     }
 
     toJSON() {